@@ -0,0 +1,371 @@
+"""
+冷数据归档: 把大量零散小文件打包成按大小分卷的 ZIP 压缩卷，压缩在多个工作进程中并行完成。
+每卷内的成员独立压缩，卷本身是标准 ZIP，任何解压工具都能打开；同时在归档目录中写一份 SQLite 清单，
+记录每个原始路径所在的卷和偏移，单个文件可以直接定位还原，不必解开整卷。
+U 盘 / 网络盘上每个文件的创建、写入、关闭开销远大于数据本身，打包后目标端只有少量大文件顺序写入。
+"""
+import lzma
+import os
+import sqlite3
+import struct
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+from core import DEFAULT_MOVE_WORKERS, HASH_CHUNK_SIZE
+
+ARCHIVE_VOLUME_SIZE = 1024 * 1024 * 1024
+ARCHIVE_VOLUME_FILES = 20000
+ARCHIVE_MANIFEST = "archive_manifest.db"
+# 先用最快的压缩级别试压文件开头，压缩后仍大于该比例的 (加密的 .dat、视频、图片) 直接存储
+COMPRESSIBLE_PROBE = 8 * 1024
+COMPRESSIBLE_RATIO = 0.95
+# 不超过该大小的文件一次读入内存，试压和写入共用同一份数据，每个文件只打开一次
+SMALL_FILE_READ = 1024 * 1024
+COMPRESSION_METHODS = {'deflate': zipfile.ZIP_DEFLATED, 'lzma': zipfile.ZIP_LZMA}
+
+LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+LOCAL_HEADER_SIG = b'PK\x03\x04'
+
+
+def _is_compressible(head):
+    return bool(head) and len(zlib.compress(head, 1)) < len(head) * COMPRESSIBLE_RATIO
+
+
+def _write_volume(volume_path, items, compression):
+    """
+    在工作进程中写出一卷: items 为 [(源路径, 卷内名字), ...]。
+    先写 .part 临时文件并 fsync，完成后原子改名。
+    返回 (成功条目, 失败条目)；成功条目为 (源路径, 卷内名字, 本地文件头偏移, 压缩后大小, 原始大小, crc32, 压缩方法, mtime_ns)
+    """
+    method = COMPRESSION_METHODS[compression]
+    done, failed = [], []
+    tmp = volume_path + '.part'
+    with open(tmp, 'wb') as raw:
+        with zipfile.ZipFile(raw, 'w', allowZip64=True) as zf:
+            for src, arcname in items:
+                try:
+                    st = os.stat(src)
+                    with open(src, 'rb') as f:
+                        data = f.read(SMALL_FILE_READ + 1) if st.st_size <= SMALL_FILE_READ else None
+                        head = data[:COMPRESSIBLE_PROBE] if data is not None else f.read(COMPRESSIBLE_PROBE)
+                    compress_type = method if _is_compressible(head) else zipfile.ZIP_STORED
+                    if data is not None and len(data) <= SMALL_FILE_READ:
+                        zinfo = zipfile.ZipInfo.from_file(src, arcname)
+                        zinfo.compress_type = compress_type
+                        zf.writestr(zinfo, data)
+                    else:
+                        zf.write(src, arcname, compress_type=compress_type)
+                except (OSError, ValueError) as e:
+                    failed.append((src, str(e)))
+                    continue
+                info = zf.infolist()[-1]
+                done.append((src, arcname, info.header_offset, info.compress_size, info.file_size,
+                             info.CRC, info.compress_type, st.st_mtime_ns))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, volume_path)
+    return done, failed
+
+
+class ArchiveManifest:
+    """
+    归档清单 (与压缩卷放在同一目录，随归档一起拷走即可还原):
+    - archive_volumes: 每卷的文件名、成员数、原始字节数、卷大小
+    - archive_entries: 原始路径 -> 卷、卷内名字、本地文件头偏移、压缩方法、大小、crc32、mtime
+    """
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.conn = sqlite3.connect(os.path.join(archive_dir, ARCHIVE_MANIFEST))
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_volumes (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            file_count INTEGER,
+            raw_bytes INTEGER,
+            stored_bytes INTEGER,
+            created_at TEXT
+        )''')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_entries (
+            path TEXT PRIMARY KEY,
+            volume_id INTEGER,
+            arcname TEXT,
+            header_offset INTEGER,
+            compress_size INTEGER,
+            size INTEGER,
+            crc32 INTEGER,
+            method INTEGER,
+            mtime_ns INTEGER,
+            status TEXT DEFAULT 'archived'
+        )''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_volume ON archive_entries (volume_id)')
+        self.conn.commit()
+
+    def add_volume(self, name, entries):
+        """
+        核对卷文件确实包含 entries 中的全部成员 (偏移、大小、crc32 一致) 后才写入清单；
+        不一致时抛出 ValueError，调用方不得删除这些源文件
+        """
+        path = os.path.join(self.archive_dir, name)
+        try:
+            with zipfile.ZipFile(path) as zf:
+                infos = {info.filename: info for info in zf.infolist()}
+        except (OSError, zipfile.BadZipFile) as e:
+            raise ValueError(f"无法读取压缩卷 {name}: {e}")
+        if len(infos) != len(entries):
+            raise ValueError(f"压缩卷 {name} 有 {len(infos)} 个成员，应为 {len(entries)} 个")
+        for _, arcname, header_offset, compress_size, size, crc, _, _ in entries:
+            info = infos.get(arcname)
+            if (info is None or info.header_offset != header_offset or info.compress_size != compress_size
+                    or info.file_size != size or info.CRC != crc):
+                raise ValueError(f"压缩卷 {name} 中的 {arcname} 与记录不符")
+
+        cursor = self.conn.cursor()
+        raw_bytes = sum(e[4] for e in entries)
+        stored_bytes = os.path.getsize(path)
+        cursor.execute('INSERT INTO archive_volumes (name, file_count, raw_bytes, stored_bytes, created_at) '
+                       'VALUES (?, ?, ?, ?, ?)',
+                       (name, len(entries), raw_bytes, stored_bytes, time.strftime('%Y-%m-%d %H:%M:%S')))
+        volume_id = cursor.lastrowid
+        cursor.executemany(
+            'INSERT OR REPLACE INTO archive_entries (path, volume_id, arcname, header_offset, compress_size, '
+            'size, crc32, method, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(e[0], volume_id) + tuple(e[1:]) for e in entries])
+        self.conn.commit()
+        return raw_bytes, stored_bytes
+
+    def find(self, pattern=None):
+        """列出清单中的路径 (pattern 为 SQL LIKE 模式)，返回 [(路径, 大小, 卷名), ...]"""
+        sql = ('SELECT e.path, e.size, v.name FROM archive_entries e '
+               'JOIN archive_volumes v ON v.id = e.volume_id')
+        if pattern:
+            return self.conn.execute(sql + ' WHERE e.path LIKE ? ORDER BY e.path', (pattern,)).fetchall()
+        return self.conn.execute(sql + ' ORDER BY e.path').fetchall()
+
+    def summary(self):
+        """返回 (卷数, 文件数, 原始字节数, 卷总大小)"""
+        return self.conn.execute('SELECT COUNT(*), COALESCE(SUM(file_count), 0), COALESCE(SUM(raw_bytes), 0), '
+                                 'COALESCE(SUM(stored_bytes), 0) FROM archive_volumes').fetchone()
+
+    def restore(self, paths=None, target_root=None, overwrite=False):
+        """
+        还原 paths 中的文件 (默认全部)。target_root 为空时还原到原始路径，否则以相对原始路径的结构放在 target_root 下。
+        只读取每个文件在卷中的那一段数据并校验 crc32。返回 (还原数, 字节数, [(路径, 错误), ...])
+        """
+        sql = ('SELECT e.path, v.name, e.header_offset, e.compress_size, e.size, e.crc32, e.method, e.mtime_ns '
+               'FROM archive_entries e JOIN archive_volumes v ON v.id = e.volume_id')
+        errors = []
+        if paths is None:
+            rows = self.conn.execute(sql + ' ORDER BY e.volume_id, e.header_offset').fetchall()
+        else:
+            rows = []
+            for path in paths:
+                found = self.conn.execute(sql + ' WHERE e.path = ?', (path,)).fetchall()
+                if not found:
+                    errors.append((path, "不在归档清单中"))
+                rows.extend(found)
+        count = total = 0
+        handles = {}
+        try:
+            for path, volume, offset, compress_size, size, crc, method, mtime_ns in rows:
+                dest = path if target_root is None else os.path.join(
+                    target_root, os.path.splitdrive(path)[1].lstrip('\\/'))
+                if os.path.exists(dest) and not overwrite:
+                    errors.append((path, "目标已存在"))
+                    continue
+                try:
+                    if volume not in handles:
+                        handles[volume] = open(os.path.join(self.archive_dir, volume), 'rb')
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    self._extract(handles[volume], offset, compress_size, crc, method, dest)
+                    os.utime(dest, ns=(mtime_ns, mtime_ns))
+                except (OSError, ValueError, zlib.error, lzma.LZMAError) as e:
+                    errors.append((path, str(e)))
+                    continue
+                self.conn.execute("UPDATE archive_entries SET status = 'restored' WHERE path = ?", (path,))
+                count += 1
+                total += size
+        finally:
+            for f in handles.values():
+                f.close()
+            self.conn.commit()
+        return count, total, errors
+
+    @staticmethod
+    def _extract(f, offset, compress_size, crc, method, dest):
+        """跳过本地文件头后流式解压 compress_size 字节，写入 dest.part，校验 crc32 后改名"""
+        f.seek(offset)
+        header = f.read(LOCAL_HEADER.size)
+        if len(header) != LOCAL_HEADER.size or header[:4] != LOCAL_HEADER_SIG:
+            raise ValueError("本地文件头损坏")
+        name_len, extra_len = LOCAL_HEADER.unpack(header)[9:11]
+        f.seek(name_len + extra_len, 1)
+
+        remaining = compress_size
+        if method == zipfile.ZIP_STORED:
+            decompress = None
+        elif method == zipfile.ZIP_DEFLATED:
+            decompress = zlib.decompressobj(-15).decompress
+        elif method == zipfile.ZIP_LZMA:
+            # ZIP 中的 LZMA 成员: 2 字节版本 + 2 字节属性长度 + LZMA1 属性 (lc/lp/pb + 字典大小)，之后是原始流
+            _, props_len = struct.unpack('<2H', f.read(4))
+            props = f.read(props_len)
+            remaining -= 4 + props_len
+            pb, rest = divmod(props[0], 45)
+            lp, lc = divmod(rest, 9)
+            dict_size = struct.unpack('<L', props[1:5])[0]
+            decompress = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[{
+                'id': lzma.FILTER_LZMA1, 'dict_size': dict_size, 'lc': lc, 'lp': lp, 'pb': pb}]).decompress
+        else:
+            raise ValueError(f"不支持的压缩方法: {method}")
+
+        tmp = dest + '.part'
+        actual = 0
+        with open(tmp, 'wb') as out:
+            while remaining > 0:
+                chunk = f.read(min(HASH_CHUNK_SIZE, remaining))
+                if not chunk: raise ValueError("压缩卷被截断")
+                remaining -= len(chunk)
+                data = decompress(chunk) if decompress else chunk
+                actual = zlib.crc32(data, actual)
+                out.write(data)
+        if actual != crc:
+            os.remove(tmp)
+            raise ValueError("crc32 校验失败")
+        os.replace(tmp, dest)
+
+    def close(self):
+        self.conn.close()
+
+
+class ArchiveWriter:
+    """
+    把文件打包进 target_base_dir/wechat_archive_<操作名>_<时间>/ 下的分卷:
+    - 按路径排序后切分成原始大小不超过 volume_size、文件数不超过 ARCHIVE_VOLUME_FILES 的卷
+      (单个文件超过 volume_size 时独占一卷)
+    - 每卷交给一个工作进程压缩写出，同时在途的卷不超过 workers * 2 个
+    - 一卷写完并记入清单后才删除这一卷的源文件；打包期间被修改过的源文件保留不删
+    """
+
+    def __init__(self, workers=DEFAULT_MOVE_WORKERS, compression='deflate', volume_size=ARCHIVE_VOLUME_SIZE,
+                 remove_source=True, progress_callback=None):
+        if compression not in COMPRESSION_METHODS:
+            raise ValueError(f"未知的压缩方式: {compression}")
+        self.workers = max(1, int(workers))
+        self.compression = compression
+        self.volume_size = volume_size
+        self.remove_source = remove_source
+        self.progress_callback = progress_callback
+
+    @staticmethod
+    def make_archive_dir(target_base_dir, operation_name):
+        """
+        新建本次归档专用的目录: 同一秒内开始的多次归档 (如命令行并行归档多个根目录) 不能共用目录，
+        否则卷文件会互相覆盖，因此不用 exist_ok，已存在时加序号重试
+        """
+        os.makedirs(target_base_dir, exist_ok=True)
+        base = os.path.join(target_base_dir, f"wechat_{operation_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        dest_root, n = base, 1
+        while True:
+            try:
+                os.mkdir(dest_root)
+                return dest_root
+            except FileExistsError:
+                n += 1
+                dest_root = f"{base}_{n}"
+
+    def plan_volumes(self, file_list):
+        """返回 [[(源路径, 卷内名字, 大小), ...], ...]，无法访问的文件被忽略"""
+        from file_ops import MoveEngine
+        volumes, current, current_bytes, used = [], [], 0, set()
+        for src in sorted(file_list):
+            try:
+                size = os.path.getsize(src)
+            except OSError:
+                continue
+            if current and (current_bytes + size > self.volume_size or len(current) >= ARCHIVE_VOLUME_FILES):
+                volumes.append(current)
+                current, current_bytes, used = [], 0, set()
+            # 卷内名字沿用迁移时的相对结构，ZIP 中统一使用 / 分隔；
+            # 微信目录之外的文件只保留文件名，可能重名，同一卷内重名时加序号 (原始路径记在清单的 arcname 中)
+            arcname = self._unique_arcname(MoveEngine.relative_dest(src).replace(os.sep, '/'), used)
+            current.append((src, arcname, size))
+            current_bytes += size
+        if current:
+            volumes.append(current)
+        return volumes
+
+    @staticmethod
+    def _unique_arcname(arcname, used):
+        """同一卷内已有 arcname 时改为 名字_2.扩展名、名字_3.扩展名 …，并记入 used"""
+        stem, ext = os.path.splitext(arcname)
+        candidate, n = arcname, 1
+        while candidate in used:
+            n += 1
+            candidate = f"{stem}_{n}{ext}"
+        used.add(candidate)
+        return candidate
+
+    def archive(self, file_list, target_base_dir, operation_name="archive"):
+        """返回 (归档目录, 归档文件数, 原始字节数, 卷总大小, [(路径, 错误), ...])"""
+        dest_root = self.make_archive_dir(target_base_dir, operation_name)
+        manifest = ArchiveManifest(dest_root)
+        volumes = self.plan_volumes(file_list)
+        total_files = sum(len(v) for v in volumes)
+        done_files = archived = raw_total = stored_total = 0
+        errors = []
+
+        def finish(name, result):
+            nonlocal done_files, archived, raw_total, stored_total
+            entries, failed = result
+            errors.extend(failed)
+            raw, stored = manifest.add_volume(name, entries)
+            archived += len(entries)
+            raw_total += raw
+            stored_total += stored
+            if self.remove_source:
+                self._remove_sources(entries, errors)
+            done_files += len(entries) + len(failed)
+            if self.progress_callback:
+                self.progress_callback(done_files, total_files)
+
+        pending = {}
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                def drain(block_until):
+                    while pending and block_until():
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for fut in finished:
+                            name, items = pending.pop(fut)
+                            try:
+                                finish(name, fut.result())
+                            except Exception as e:
+                                errors.extend((src, str(e)) for src, _, _ in items)
+
+                for idx, items in enumerate(volumes, 1):
+                    drain(lambda: len(pending) >= self.workers * 2)
+                    name = f"vol_{idx:05d}.zip"
+                    fut = pool.submit(_write_volume, os.path.join(dest_root, name),
+                                      [(src, arcname) for src, arcname, _ in items], self.compression)
+                    pending[fut] = (name, items)
+                drain(lambda: True)
+        finally:
+            manifest.close()
+        return dest_root, archived, raw_total, stored_total, errors
+
+    @staticmethod
+    def _remove_sources(entries, errors):
+        for src, _, _, _, size, _, _, mtime_ns in entries:
+            try:
+                st = os.stat(src)
+                if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                    errors.append((src, "打包期间文件被修改，已保留源文件"))
+                    continue
+                os.remove(src)
+            except OSError as e:
+                errors.append((src, str(e)))
@@ -0,0 +1,295 @@
+"""
+asyncio 接口 (不依赖 Qt): 把遍历、哈希和去重扫描包装成异步迭代器，便于在基于 asyncio 的服务中
+同时管理多台机器同步来的微信目录。
+
+阻塞的遍历和哈希在线程池中运行，结果分批经有界队列交给事件循环: 消费方处理不过来时工作线程在队列满时等待，
+内存占用与结果总数无关。取消消费协程或用 async with 提前退出时，工作线程在下一个 should_stop 检查点停止。
+
+示例:
+    scanner = AsyncScanner(DatabaseManager())
+    async with scanner.duplicates(root, 'strict') as stream:
+        async for d in stream:
+            ...
+    report = stream.result
+
+    async for root, item in scanner.scan_many(roots, 'fuzzy', concurrency=2):
+        ...
+"""
+import asyncio
+import concurrent.futures
+import threading
+from collections import deque
+
+from core import (Utils, CoreLogic, DirectoryIndex, FileTable, HashEngine, DEFAULT_HASH_WORKERS,
+                  STAGE3_CHUNK_SIZE)
+
+# 队列中最多缓存的批数，每批最多 ASYNC_BATCH_SIZE 条；跨线程交接按批进行，减少事件循环的调度开销
+ASYNC_QUEUE_SIZE = 8
+ASYNC_BATCH_SIZE = 256
+DEFAULT_ROOT_CONCURRENCY = 2
+
+
+class _Stopped(Exception):
+    """消费方已停止，工作线程放弃剩余结果"""
+
+
+class AsyncStream:
+    """
+    在 executor 中运行阻塞函数 func(emit, should_stop)，func 每产出一条结果调用一次 emit(item)；
+    async for 逐条取出，func 的返回值在迭代结束后见 .result，func 抛出的异常在迭代结束时重新抛出。
+    建议配合 async with 使用，提前退出时会通知工作线程停止并等待其结束
+    """
+
+    def __init__(self, func, executor=None, queue_size=ASYNC_QUEUE_SIZE, batch_size=ASYNC_BATCH_SIZE):
+        self.func = func
+        self.executor = executor
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.result = None
+        self._stop = threading.Event()
+        self._loop = None
+        self._queue = None
+        self._future = None
+        self._items = deque()
+        self._done = False
+
+    def _start(self):
+        if self._future is None:
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue(self.queue_size)
+            self._future = self._loop.run_in_executor(self.executor, self._run)
+
+    def _put(self, batch):
+        """工作线程中调用: 队列满时阻塞等待 (背压)，期间消费方停止则抛出 _Stopped"""
+        if self._stop.is_set(): raise _Stopped
+        fut = asyncio.run_coroutine_threadsafe(self._queue.put(batch), self._loop)
+        while True:
+            try:
+                return fut.result(timeout=0.1)
+            except concurrent.futures.TimeoutError:
+                if self._stop.is_set():
+                    fut.cancel()
+                    raise _Stopped
+
+    def _run(self):
+        batch = []
+
+        def emit(item):
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._put(batch[:])
+                batch.clear()
+
+        try:
+            result = self.func(emit, self._stop.is_set)
+            if batch: self._put(batch[:])
+            return result
+        except _Stopped:
+            return None
+        finally:
+            # 结束标记；消费方已停止时不再需要
+            try:
+                self._put(None)
+            except (_Stopped, RuntimeError):
+                pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self._start()
+        try:
+            while not self._items:
+                if self._done: raise StopAsyncIteration
+                batch = await self._queue.get()
+                if batch is None:
+                    self._done = True
+                    self.result = await self._future
+                    raise StopAsyncIteration
+                self._items.extend(batch)
+        except asyncio.CancelledError:
+            self._stop.set()
+            raise
+        return self._items.popleft()
+
+    def cancel(self):
+        """通知工作线程停止 (可在任意线程调用)"""
+        self._stop.set()
+
+    async def aclose(self):
+        """停止并等待工作线程结束；已正常迭代完时什么也不做"""
+        if self._future is None or self._done: return
+        self._stop.set()
+        self._items.clear()
+        try:
+            await self._future
+        finally:
+            self._done = True
+
+    def __del__(self):
+        # 未用 async with 又提前丢弃时，至少让工作线程退出
+        self._stop.set()
+
+    async def __aenter__(self):
+        self._start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+
+class AsyncScanner:
+    """
+    扫描引擎的 asyncio 包装，各方法返回 AsyncStream。
+    db        : DatabaseManager，内部有锁，多个根目录的扫描可以共用
+    executor  : 运行阻塞部分的线程池，默认使用事件循环的默认 executor；每个流占用其中一个线程直到结束
+    queue_size / batch_size: 每个流的队列容量 (批数) 与每批条数
+    """
+
+    def __init__(self, db=None, executor=None, queue_size=ASYNC_QUEUE_SIZE, batch_size=ASYNC_BATCH_SIZE):
+        self.db = db
+        self.executor = executor
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+
+    def _stream(self, func):
+        return AsyncStream(func, self.executor, self.queue_size, self.batch_size)
+
+    def walk(self, root_dir, extensions=None, incremental=False):
+        """
+        逐个产出 root_dir 下的 FileRecord。
+        incremental: 使用 db 中的目录索引，只读取 mtime 变化过的目录 (见 DirectoryIndex)；.result 为遍历统计
+        """
+        exts = {e.lower() for e in extensions} if extensions else None
+
+        def run(emit, should_stop):
+            if not incremental:
+                for rec in Utils.walk_files(root_dir, exts, should_stop):
+                    emit(rec)
+                return None
+            index = DirectoryIndex(self.db)
+            for rec in index.walk(root_dir, exts, should_stop):
+                emit(rec)
+            return index.stats
+
+        return self._stream(run)
+
+    def hash_files(self, files, sample=False, workers=DEFAULT_HASH_WORKERS, io_mode='auto',
+                   chunk_size=STAGE3_CHUNK_SIZE):
+        """
+        逐个产出 (FileRecord, 哈希)，读取失败的哈希为 None。
+        files: FileTable、FileRecord 或路径的可迭代对象；按 chunk_size 分块交给 HashEngine 并行计算，
+               每块算完即产出，块内顺序与输入一致
+        sample: True 为头尾采样哈希，False 为全量 MD5
+        """
+        def run(emit, should_stop):
+            table = FileTable.of(files)
+            engine = HashEngine(workers, io_mode=io_mode)
+            for start in range(0, len(table), chunk_size):
+                if should_stop(): return
+                chunk = list(table.records(range(start, min(start + chunk_size, len(table)))))
+                hashes = engine.hash_files(chunk, sample=sample, should_stop=should_stop)
+                if should_stop(): return
+                for rec, h in zip(chunk, hashes):
+                    emit((rec, h))
+
+        return self._stream(run)
+
+    def duplicates(self, root_dir, mode='strict', extensions=None, progress_callback=None, **options):
+        """
+        逐条产出去重扫描的结果 dict (与 CoreLogic.run_dedup_scan 相同)，不写入 db 的 scan_results。
+        .result 为扫描报告，被取消时为 None。
+        options: 传给 run_dedup_scan 的 workers / resume / incremental / image_distance / io_mode 等。
+        progress_callback 在工作线程中调用，需要时用 loop.call_soon_threadsafe 转回事件循环
+        """
+        def run(emit, should_stop):
+            def sink(items):
+                count = size = 0
+                for d in items:
+                    emit(d)
+                    count += 1
+                    size += d['size']
+                return count, size
+
+            return CoreLogic.run_dedup_scan(root_dir, mode, self.db, extensions=extensions,
+                                            progress_callback=progress_callback, should_stop=should_stop,
+                                            sink=sink, **options)
+
+        return self._stream(run)
+
+    def groups(self, root_dir, mode='strict', extensions=None, progress_callback=None, **options):
+        """
+        按重复组产出: {'group', 'keep', 'reason', 'files': [结果 dict, ...], 'size': 可释放字节数}。
+        各模式的结果按组连续产出，这里只缓存当前这一组
+        """
+        def run(emit, should_stop):
+            current = None
+
+            def sink(items):
+                nonlocal current
+                count = size = 0
+                for d in items:
+                    key = (d['group'], d['keep'])
+                    if current and current['key'] != key:
+                        emit(self._group(current))
+                        current = None
+                    if current is None:
+                        current = {'key': key, 'group': d['group'], 'keep': d['keep'], 'reason': d['reason'],
+                                   'files': [], 'size': 0}
+                    current['files'].append(d)
+                    current['size'] += d['size']
+                    count += 1
+                    size += d['size']
+                if current: emit(self._group(current))
+                current = None
+                return count, size
+
+            return CoreLogic.run_dedup_scan(root_dir, mode, self.db, extensions=extensions,
+                                            progress_callback=progress_callback, should_stop=should_stop,
+                                            sink=sink, **options)
+
+        return self._stream(run)
+
+    @staticmethod
+    def _group(current):
+        return {k: v for k, v in current.items() if k != 'key'}
+
+    async def scan_many(self, roots, mode='strict', concurrency=DEFAULT_ROOT_CONCURRENCY, grouped=False,
+                        **options):
+        """
+        在同一个事件循环中并发扫描多个根目录 (最多 concurrency 个同时进行)，
+        产出 (root, 结果 dict 或分组 dict)；每个根目录结束时产出 (root, {'type': 'summary', ...报告})，
+        出错时产出 (root, {'type': 'error', 'error': 信息})。汇合队列同样有界，消费慢时各扫描一起暂停
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        merged = asyncio.Queue(self.queue_size * self.batch_size)
+        done = object()
+
+        async def scan_root(root):
+            try:
+                async with semaphore:
+                    stream = (self.groups if grouped else self.duplicates)(root, mode, **options)
+                    async with stream:
+                        async for item in stream:
+                            await merged.put((root, item))
+                    if stream.result is not None:
+                        await merged.put((root, dict(stream.result, type='summary')))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await merged.put((root, {'type': 'error', 'error': str(e)}))
+            await merged.put((root, done))
+
+        tasks = [asyncio.ensure_future(scan_root(root)) for root in roots]
+        remaining = len(tasks)
+        try:
+            while remaining:
+                root, item = await merged.get()
+                if item is done:
+                    remaining -= 1
+                    continue
+                yield root, item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,232 @@
+"""
+性能基准: 生成可复现的模拟 WeChat Files 目录树，并测量各扫描阶段的耗时。
+
+    python benchmark.py --sizes 10000,100000 --seed 42 -o bench.json
+    python benchmark.py --generate-only /tmp/wechat_tree --files 100000
+
+结果为 JSON，可以在不同版本之间直接对比。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from core import CoreLogic, FileTable, Utils
+from db_manager import DatabaseManager
+
+DOC_EXTS = ['.docx', '.xlsx', '.pptx', '.pdf', '.zip', '.mp4']
+VERSION_SUFFIXES = ['(1)', '(2)', '（1）', '_副本', ' - Copy', '_2']
+WORDS = ['报告', '合同', '季度', '总结', '方案', '会议纪要', '预算', '项目', '设计稿', '发票',
+         'report', 'final', 'draft', 'invoice', 'plan', 'meeting', 'budget', 'v2', 'scan', 'IMG']
+
+
+class TreeGenerator:
+    """
+    按种子生成模拟目录树:
+    wxid_xxx/FileStorage/File/YYYY-MM/      文档 (含 name(1).docx、_副本 等版本及跨账号转发副本)
+    wxid_xxx/FileStorage/MsgAttach/<hash>/Image|Thumb/YYYY-MM/<hash>.dat
+    """
+
+    def __init__(self, root, n_files, seed=42, accounts=3, doc_ratio=0.3, dup_ratio=0.15,
+                 version_ratio=0.1, median_doc_kb=64, median_img_kb=8, max_size_mb=8, max_age_days=730):
+        self.root = root
+        self.n_files = n_files
+        self.rng = random.Random(seed)
+        self.accounts = [f"wxid_{self.rng.getrandbits(48):012x}" for _ in range(accounts)]
+        self.doc_ratio = doc_ratio
+        self.dup_ratio = dup_ratio
+        self.version_ratio = version_ratio
+        self.median_doc = median_doc_kb * 1024
+        self.median_img = median_img_kb * 1024
+        self.max_size = max_size_mb * 1024 * 1024
+        self.max_age = max_age_days * 86400
+        self.now = time.time()
+        self.created = []  # (path, size)
+
+    def _size(self, median):
+        # 对数正态分布，截断到 [1, max_size]
+        return max(1, min(self.max_size, int(self.rng.lognormvariate(0, 1.2) * median)))
+
+    def _payload(self, size):
+        seed = self.rng.getrandbits(64).to_bytes(8, 'little')
+        block = seed * 512
+        return (block * (size // len(block) + 1))[:size]
+
+    def _write(self, path, data, mtime):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        os.utime(path, (mtime, mtime))
+        self.created.append((path, len(data)))
+
+    def _month_dir(self, mtime):
+        return datetime.fromtimestamp(mtime).strftime('%Y-%m')
+
+    def generate(self):
+        rng = self.rng
+        while len(self.created) < self.n_files:
+            account = rng.choice(self.accounts)
+            mtime = self.now - rng.uniform(0, self.max_age)
+            base = os.path.join(self.root, account, 'FileStorage')
+
+            if rng.random() < self.doc_ratio:
+                ext = rng.choice(DOC_EXTS)
+                name = ''.join(rng.sample(WORDS, rng.randint(1, 3))) + str(rng.randint(1, 999))
+                data = self._payload(self._size(self.median_doc))
+                self._write(os.path.join(base, 'File', self._month_dir(mtime), name + ext), data, mtime)
+
+                r = rng.random()
+                if r < self.dup_ratio:
+                    # 转发: 相同内容出现在另一个账号
+                    other = os.path.join(self.root, rng.choice(self.accounts), 'FileStorage', 'File',
+                                         self._month_dir(mtime), name + ext)
+                    if not os.path.exists(other):
+                        self._write(other, data, mtime + rng.uniform(0, 86400))
+                elif r < self.dup_ratio + self.version_ratio:
+                    # 版本: 名字带后缀，内容有少量差异
+                    suffix = rng.choice(VERSION_SUFFIXES)
+                    changed = bytearray(data)
+                    for _ in range(max(1, len(changed) // 4096)):
+                        changed[rng.randrange(len(changed))] ^= 0xFF
+                    changed += self._payload(rng.randint(0, max(1, len(data) // 10)))
+                    self._write(os.path.join(base, 'File', self._month_dir(mtime), name + suffix + ext),
+                                bytes(changed), mtime + rng.uniform(0, 7 * 86400))
+            else:
+                chat = f"{rng.getrandbits(64):016x}"
+                kind = rng.choice(['Image', 'Thumb'])
+                median = self.median_img if kind == 'Image' else self.median_img // 4
+                data = self._payload(self._size(median))
+                path = os.path.join(base, 'MsgAttach', chat, kind, self._month_dir(mtime),
+                                    f"{rng.getrandbits(64):016x}.dat")
+                self._write(path, data, mtime)
+                if rng.random() < self.dup_ratio:
+                    other_chat = f"{rng.getrandbits(64):016x}"
+                    self._write(os.path.join(base, 'MsgAttach', other_chat, kind, self._month_dir(mtime),
+                                             f"{rng.getrandbits(64):016x}.dat"), data, mtime)
+        return self.created
+
+
+def timed(name, n_files, fn, results, **extra):
+    start = time.perf_counter()
+    value = fn()
+    elapsed = time.perf_counter() - start
+    entry = {'bench': name, 'files': n_files, 'seconds': round(elapsed, 4),
+             'files_per_sec': round(n_files / elapsed, 1) if elapsed > 0 else None}
+    entry.update(extra)
+    results.append(entry)
+    print(f"  {name:<28} {elapsed:8.3f}s", file=sys.stderr)
+    return value
+
+
+def run_size(n_files, args, workdir, results):
+    root = os.path.join(workdir, f"tree_{n_files}")
+    print(f"[{n_files}] 生成目录树: {root}", file=sys.stderr)
+    gen = TreeGenerator(root, n_files, seed=args.seed, accounts=args.accounts,
+                        median_doc_kb=args.median_doc_kb, median_img_kb=args.median_img_kb)
+    start = time.perf_counter()
+    created = gen.generate()
+    total_bytes = sum(size for _, size in created)
+    results.append({'bench': 'generate', 'files': len(created), 'bytes': total_bytes,
+                    'seconds': round(time.perf_counter() - start, 4)})
+
+    # 1. 单文件哈希
+    sample = random.Random(args.seed).sample(created, min(len(created), args.hash_sample))
+    sample_bytes = sum(size for _, size in sample)
+    for use_sample in (True, False):
+        timed(f"get_file_hash(sample={use_sample})", len(sample),
+              lambda: [Utils.get_file_hash(p, sample=use_sample) for p, _ in sample], results,
+              bytes=sample_bytes)
+
+    # 2. 严格模式完整流程 (冷缓存 / 热缓存)
+    db_path = os.path.join(workdir, f"bench_{n_files}.db")
+    db = DatabaseManager(db_path)
+    for label in ('cold_cache', 'warm_cache'):
+        report = timed(f"strict_scan[{label}]", len(created),
+                       lambda: CoreLogic.run_dedup_scan(root, 'strict', db, workers=args.workers,
+                                                        io_mode=args.io), results)
+        results[-1]['duplicates'] = report['dup_count']
+        results[-1]['stages'] = report['metrics']['stages']
+
+    # 3. 混合策略
+    records = timed("walk_files", len(created), lambda: FileTable.of(Utils.walk_files(root)), results)
+    found = timed("scan_mixed_strategy", len(records), lambda: CoreLogic.scan_mixed_strategy(records), results)
+    results[-1]['duplicates'] = len(found)
+    db.close()
+
+    # 4. 冷数据扫描
+    targets = Utils.detect_wechat_paths(root, "FileStorage/MsgAttach")
+    cold = timed("scan_cold_files_multi_path", len(records),
+                 lambda: CoreLogic.scan_cold_files_multi_path(targets, args.cold_days), results)
+    results[-1]['matched'] = len(cold)
+
+    # 5. 迁移 (会改变目录树，放在最后)
+    quarantine = os.path.join(workdir, f"quarantine_{n_files}")
+    moved = timed("move_files", len(cold), lambda: CoreLogic.move_files(cold, quarantine, "bench"), results)
+    results[-1]['moved'] = moved[1]
+    results[-1]['bytes'] = moved[2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='WeChat Cleaner 性能基准')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='文件数量，逗号分隔')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--accounts', type=int, default=3)
+    parser.add_argument('--median-doc-kb', type=int, default=64)
+    parser.add_argument('--median-img-kb', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--io', choices=['auto', 'parallel', 'sequential'], default='auto')
+    parser.add_argument('--hash-sample', type=int, default=2000, help='单文件哈希基准抽取的文件数')
+    parser.add_argument('--cold-days', type=int, default=180)
+    parser.add_argument('--workdir', help='生成目录树的位置，默认使用临时目录')
+    parser.add_argument('--keep', action='store_true', help='结束后保留生成的目录树')
+    parser.add_argument('--generate-only', metavar='DIR', help='只生成目录树到 DIR (配合 --files)')
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('-o', '--output', help='JSON 结果文件，默认输出到标准输出')
+    args = parser.parse_args(argv)
+
+    if args.generate_only:
+        created = TreeGenerator(args.generate_only, args.files, seed=args.seed, accounts=args.accounts,
+                                median_doc_kb=args.median_doc_kb, median_img_kb=args.median_img_kb).generate()
+        print(f"已生成 {len(created)} 个文件: {args.generate_only}", file=sys.stderr)
+        return 0
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='wechat_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    try:
+        for n in (int(s) for s in args.sizes.split(',') if s):
+            run_size(n, args, workdir, results)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = {
+        'meta': {
+            'seed': args.seed,
+            'sizes': args.sizes,
+            'workers': args.workers,
+            'io': args.io,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+    text = json.dumps(output, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
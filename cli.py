@@ -0,0 +1,427 @@
+"""
+命令行入口 (无需 PyQt5)，适合在服务器上用 cron 批量扫描多个微信号目录。
+
+示例:
+    python cli.py strict "/data/WeChat Files" --detect --format ndjson -o result.ndjson
+    python cli.py fuzzy /backup/wxid_a /backup/wxid_b --jobs 2
+    python cli.py image "/data/WeChat Files" --detect --distance 4   # 相似图片，需要 Pillow
+    python cli.py strict "/data/WeChat Files" --detect --incremental # 只进入有变化的目录
+    python cli.py watch "/data/WeChat Files" --detect --interval 5   # 持续监视，新到的重复文件立即输出
+    python cli.py estimate "/data/WeChat Files" --detect --budget 10 # 完整扫描前快速估算可释放空间
+    python cli.py cold "/data/WeChat Files" --detect --days 180
+    python cli.py cold "/data/WeChat Files" --detect --days 30 --budget 50G  # 只选出释放 50GB 所需的最冷文件
+    python cli.py cold "/data/WeChat Files" --detect --archive-to /mnt/usb    # 打包进分卷 ZIP 并删除源文件
+    python cli.py restore /mnt/usb/wechat_cold_180days_20240101_120000 /path/to/file.dat
+    python cli.py lookup ~/Downloads/new_file.pdf     # 查询跨账号内容索引
+    python cli.py lookup --shared --min-size 1048576  # 列出在多个微信号中重复的内容
+    python cli.py report --format json                # 按原因 / 类型 / 微信号 / 修改时间汇总最近一次扫描的结果
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+
+class ResultWriter:
+    """线程安全的结果输出: ndjson 逐行写出; json 汇总后在结束时一次写出"""
+
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        self.lock = threading.Lock()
+        self.roots = {}
+
+    def record(self, root, item):
+        with self.lock:
+            if self.fmt == 'ndjson':
+                self.stream.write(json.dumps(dict(item, root=root), ensure_ascii=False) + '\n')
+            else:
+                self.roots.setdefault(root, {'root': root, 'items': [], 'summary': None})['items'].append(item)
+
+    def summary(self, root, summary):
+        with self.lock:
+            if self.fmt == 'ndjson':
+                self.stream.write(json.dumps(dict(summary, type='summary', root=root), ensure_ascii=False) + '\n')
+                self.stream.flush()
+            else:
+                self.roots.setdefault(root, {'root': root, 'items': [], 'summary': None})['summary'] = summary
+
+    def close(self):
+        if self.fmt == 'json':
+            json.dump({'roots': list(self.roots.values())}, self.stream, ensure_ascii=False, indent=2)
+            self.stream.write('\n')
+        self.stream.flush()
+
+
+def resolve_roots(roots, detect, target_sub):
+    from core import Utils
+    if not detect:
+        return [os.path.abspath(r) for r in roots]
+    found = []
+    for r in roots:
+        found.extend(os.path.abspath(p) for p in Utils.detect_wechat_paths(r, target_sub))
+    return found
+
+
+def run_dedup(args, roots, writer, db):
+    """
+    各根目录的结果边输出边写入 db 的 scan_results (本次运行的全部根目录替换上一次的结果)，
+    全部结束后按 run_report 的维度输出汇总，之后也可用 report 子命令或图形界面查看
+    """
+    from core import CoreLogic
+    db.clear_results()
+    db.disown_checkpoints()
+
+    def scan_root(root):
+        def sink(duplicates):
+            def emitted():
+                for d in duplicates:
+                    writer.record(root, {'type': 'duplicate', 'file': d['file'], 'keep': d['keep'],
+                                         'size': d['size'], 'reason': d['reason'], 'group': d['group']})
+                    yield d
+            return db.insert_results(emitted())
+
+        start = time.time()
+        log = (lambda msg: print(f"[{root}] {msg}", file=sys.stderr)) if args.verbose else None
+        report = CoreLogic.run_dedup_scan(root, args.command, db, extensions=args.ext,
+                                          workers=args.workers, progress_callback=log, sink=sink,
+                                          resume=not args.restart, incremental=args.incremental,
+                                          image_distance=getattr(args, 'distance', None), io_mode=args.io)
+        report['elapsed'] = round(time.time() - start, 3)
+        writer.summary(root, report)
+        return report
+
+    failed = run_parallel(scan_root, roots, args.jobs)
+    run_report(args, writer, db)
+    return failed
+
+
+def run_watch(args, roots, writer, db):
+    """一直运行到 Ctrl+C 或达到 --polls 轮，每发现一个重复文件输出一行"""
+    from watcher import DirectoryWatcher
+
+    def on_duplicate(d):
+        root = next((r for r in roots if d['file'].startswith(os.path.join(r, ''))), '')
+        writer.record(root, {'type': 'duplicate', 'file': d['file'], 'keep': d['keep'],
+                             'size': d['size'], 'reason': d['reason'], 'group': d['group']})
+        writer.stream.flush()
+
+    log = (lambda msg: print(msg, file=sys.stderr)) if args.verbose else None
+    watcher = DirectoryWatcher(db, roots, extensions=args.ext, interval=args.interval,
+                               on_duplicate=on_duplicate, progress_callback=log)
+    try:
+        watcher.run(max_polls=args.polls)
+    except KeyboardInterrupt:
+        pass
+    writer.summary('watch', {'roots': roots, 'polls': watcher.polls, 'new_files': watcher.new_files,
+                             'dup_count': watcher.dup_count, 'dup_size': watcher.dup_size})
+    return 0
+
+
+def run_estimate(args, roots, writer):
+    from estimator import SpaceEstimator
+
+    def scan_root(root):
+        log = (lambda msg: print(f"[{root}] {msg}", file=sys.stderr)) if args.verbose else None
+        report = SpaceEstimator(time_budget=args.budget, seed=args.seed).estimate(
+            root, extensions=args.ext, progress_callback=log)
+        writer.summary(root, report)
+        return report
+
+    return run_parallel(scan_root, roots, args.jobs)
+
+
+def parse_size(text):
+    """'50G' / '512M' / '1.5T' / 纯字节数 -> 字节数"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    text = text.strip().upper().rstrip('B')
+    try:
+        if text and text[-1] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无法识别的大小: {text}")
+
+
+def archive_cold(args, root, paths, stats):
+    """--archive-to: 把选出的冷数据打包进分卷 ZIP，统计写入 stats"""
+    from core import CoreLogic, ContentIndex
+    if not args.archive_to or not paths: return
+    # 并行归档的各根目录按微信号 (或目录名) 区分归档目录
+    label = ContentIndex.account_of(root) or os.path.basename(os.path.normpath(root)) or 'root'
+    label = ''.join(c if c.isalnum() or c in '-_' else '_' for c in label)
+    folder, count, raw, stored, errors = CoreLogic.archive_files(
+        paths, args.archive_to, f"cold_{args.days}days_{label}", compression=args.compression,
+        volume_size=args.volume_size)
+    for path, error in errors:
+        print(f"[{root}] 未归档 {path}: {error}", file=sys.stderr)
+    stats.update(archive=folder, archived=count, archived_bytes=raw, archive_size=stored,
+                 archive_errors=len(errors))
+
+
+def run_cold(args, roots, writer):
+    from core import CoreLogic
+
+    if args.budget:
+        # 空间目标对全部根目录整体生效，只遍历一次并在同一个堆中挑选
+        start = time.time()
+        stats = {}
+        paths = []
+        for rec in CoreLogic.select_cold_files(roots, args.budget, args.days, stats=stats,
+                                               assume_write_once=args.assume_write_once):
+            writer.record('budget', {'type': 'cold', 'file': rec.path, 'size': rec.size,
+                                     'mtime': rec.mtime_ns / 1e9})
+            paths.append(rec.path)
+        archive_cold(args, 'budget', paths, stats)
+        stats['budget'] = args.budget
+        stats['elapsed'] = round(time.time() - start, 3)
+        writer.summary('budget', stats)
+        return 0
+
+    def scan_root(root):
+        start = time.time()
+        stats = {}
+        paths = []
+        for rec in CoreLogic.iter_cold_files([root], args.days, stats=stats,
+                                             assume_write_once=args.assume_write_once):
+            writer.record(root, {'type': 'cold', 'file': rec.path, 'size': rec.size,
+                                 'mtime': rec.mtime_ns / 1e9})
+            if args.archive_to: paths.append(rec.path)
+        archive_cold(args, root, paths, stats)
+        stats['elapsed'] = round(time.time() - start, 3)
+        writer.summary(root, stats)
+        return stats
+
+    return run_parallel(scan_root, roots, args.jobs)
+
+
+def run_lookup(args, writer, db):
+    """查询内容索引 (由 strict / fuzzy 扫描增量建立)，不重新遍历目录"""
+    from core import ContentIndex
+    index = ContentIndex(db)
+    failed = 0
+    for path in args.files:
+        try:
+            matches = index.lookup(path, register=not args.no_register)
+        except OSError as e:
+            failed += 1
+            print(f"[{path}] 错误: {e}", file=sys.stderr)
+            continue
+        writer.record('lookup', {'type': 'match', 'file': os.path.abspath(path),
+                                 'matches': [{'file': p, 'account': a} for p, a in matches]})
+
+    if args.shared:
+        groups = total = 0
+        for size, h, members in index.iter_cross_account_groups(args.min_size):
+            writer.record('shared', {'type': 'shared', 'size': size, 'hash': h,
+                                     'files': [{'file': p, 'account': a} for p, a in members],
+                                     'reclaimable': size * (len(members) - 1)})
+            groups += 1
+            total += size * (len(members) - 1)
+        writer.summary('shared', {'groups': groups, 'reclaimable': total})
+    return failed
+
+
+def run_report(args, writer, db):
+    """汇总数据库中当前的扫描结果 (图形界面或命令行扫描写入的 scan_results)，聚合全部在 SQL 中完成"""
+    for dim, rows in db.get_result_report().items():
+        for key, count, size, inc_count, inc_size in rows:
+            writer.record('report', {'type': 'breakdown', 'dimension': dim, 'key': key, 'count': count,
+                                     'size': size, 'included_count': inc_count, 'included_size': inc_size})
+    count, size = db.get_result_summary()
+    writer.summary('report', {'count': count, 'size': size})
+    return 0
+
+
+def run_restore(args, writer):
+    """按归档清单还原文件；不指定文件时列出清单 (可用 --match 过滤)，--all 还原全部"""
+    from archiver import ArchiveManifest, ARCHIVE_MANIFEST
+    if not os.path.exists(os.path.join(args.archive, ARCHIVE_MANIFEST)):
+        print(f"{args.archive} 中没有 {ARCHIVE_MANIFEST}", file=sys.stderr)
+        return 2
+    manifest = ArchiveManifest(args.archive)
+    try:
+        if not args.files and not args.all:
+            for path, size, volume in manifest.find(args.match):
+                writer.record(args.archive, {'type': 'archived', 'file': path, 'size': size, 'volume': volume})
+            volumes, files, raw, stored = manifest.summary()
+            writer.summary(args.archive, {'volumes': volumes, 'files': files, 'size': raw, 'archive_size': stored})
+            return 0
+        paths = None if args.all else [os.path.abspath(p) for p in args.files]
+        count, size, errors = manifest.restore(paths, target_root=args.to, overwrite=args.overwrite)
+        for path, error in errors:
+            writer.record(args.archive, {'type': 'error', 'file': path, 'error': error})
+        writer.summary(args.archive, {'restored': count, 'size': size, 'errors': len(errors)})
+        return 1 if errors else 0
+    finally:
+        manifest.close()
+
+
+def run_parallel(fn, roots, jobs):
+    from concurrent.futures import ThreadPoolExecutor
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = {pool.submit(fn, root): root for root in roots}
+        for fut, root in futures.items():
+            try:
+                fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{root}] 错误: {e}", file=sys.stderr)
+    return failed
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='wechat-cleaner', description='微信文件重复/冷数据扫描 (命令行版)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def common(p):
+        p.add_argument('roots', nargs='+', help='扫描根目录，可以是 WeChat Files 或具体微信号目录')
+        p.add_argument('--detect', action='store_true', help='通过 detect_wechat_paths 自动展开各微信号的子目录')
+        p.add_argument('--jobs', type=int, default=2, help='同时扫描的根目录数')
+        p.add_argument('--format', choices=['json', 'ndjson'], default='ndjson')
+        p.add_argument('-o', '--output', help='输出文件，默认写到标准输出')
+        p.add_argument('-v', '--verbose', action='store_true', help='在标准错误输出进度')
+
+    for mode, help_text in (('strict', '严格去重 (内容完全一致)'), ('fuzzy', '混合策略 (小文件严格 + 大文件版本识别)'),
+                            ('image', '相似图片 (感知哈希，含 .dat 图片，需要 Pillow)')):
+        p = sub.add_parser(mode, help=help_text)
+        common(p)
+        p.add_argument('--ext', type=lambda s: [e if e.startswith('.') else '.' + e for e in s.split(',') if e],
+                       help='只扫描这些后缀，逗号分隔，如 .docx,.pdf')
+        p.add_argument('--workers', type=int, default=4, help='每个根目录的哈希线程数')
+        p.add_argument('--db', default='wechat_files.db', help='指纹缓存与扫描结果数据库')
+        p.add_argument('--restart', action='store_true', help='忽略上次中断留下的断点，重新扫描')
+        p.add_argument('--io', choices=['auto', 'parallel', 'sequential'], default='auto',
+                       help='哈希读取方式: auto 在机械硬盘 / USB 硬盘上自动改为按 inode 顺序单线程读取')
+        p.add_argument('--incremental', action='store_true',
+                       help='用目录索引增量遍历，只进入 mtime 变化过的目录 (假定附件写入后不再原地修改)')
+        if mode == 'image':
+            p.add_argument('--distance', type=int, default=None,
+                           help='判为相似的最大海明距离 (0~63，默认 4)')
+
+    p = sub.add_parser('watch', help='持续监视目录，新到的文件与已有文件内容相同时立即输出 (轮询，无需重新扫描)')
+    common(p)
+    p.add_argument('--ext', type=lambda s: [e if e.startswith('.') else '.' + e for e in s.split(',') if e],
+                   help='只监视这些后缀，逗号分隔')
+    p.add_argument('--db', default='wechat_files.db', help='目录索引与内容索引所在的数据库')
+    p.add_argument('--interval', type=float, default=5.0, help='轮询间隔 (秒)')
+    p.add_argument('--polls', type=int, default=None, help='检查该轮数后退出，默认一直运行')
+
+    p = sub.add_parser('estimate', help='完整扫描前快速估算严格 / 混合模式可释放的空间 (抽样，带置信区间)')
+    common(p)
+    p.add_argument('--ext', type=lambda s: [e if e.startswith('.') else '.' + e for e in s.split(',') if e],
+                   help='只统计这些后缀，逗号分隔')
+    p.add_argument('--budget', type=float, default=10.0, help='抽样哈希的时间预算 (秒)，不含遍历')
+    p.add_argument('--seed', type=int, default=None, help='随机种子，便于复现')
+
+    p = sub.add_parser('lookup', help='在跨账号内容索引中查找重复内容 (索引由 strict / fuzzy 扫描建立)')
+    p.add_argument('files', nargs='*', help='要查询的文件')
+    p.add_argument('--shared', action='store_true', help='列出在多个微信号中都出现的内容')
+    p.add_argument('--min-size', type=int, default=1, help='--shared 时忽略小于该字节数的文件')
+    p.add_argument('--no-register', action='store_true', help='只查询，不把查询的文件登记进索引')
+    p.add_argument('--db', default='wechat_files.db')
+    p.add_argument('--format', choices=['json', 'ndjson'], default='ndjson')
+    p.add_argument('-o', '--output', help='输出文件，默认写到标准输出')
+
+    p = sub.add_parser('report', help='按原因 / 类型 / 微信号 / 修改时间汇总当前的扫描结果')
+    p.add_argument('--db', default='wechat_files.db')
+    p.add_argument('--format', choices=['json', 'ndjson'], default='ndjson')
+    p.add_argument('-o', '--output', help='输出文件，默认写到标准输出')
+
+    p = sub.add_parser('cold', help='查找长期未修改的冷数据')
+    common(p)
+    p.add_argument('--days', type=int, default=180, help='只考虑超过该天数未修改的文件 (--budget 时可设为 0)')
+    p.add_argument('--budget', type=parse_size, default=None,
+                   help='空间目标，如 50G: 按 (天数 × 大小) 只选出达到目标所需的最冷文件，而不是全部冷数据')
+    p.add_argument('--assume-write-once', action='store_true', help='跳过晚于阈值的 YYYY-MM 月份目录')
+    p.add_argument('--archive-to', help='把找到的冷数据打包为分卷 ZIP 存放到该目录，并删除源文件')
+    p.add_argument('--compression', choices=['deflate', 'lzma'], default='deflate',
+                   help='压缩方式: deflate 较快，lzma 压缩率更高')
+    p.add_argument('--volume-size', type=parse_size, default=None, help='每卷原始数据上限，默认 1G')
+
+    p = sub.add_parser('restore', help='按归档清单还原单个文件，不解开整卷')
+    p.add_argument('archive', help='归档目录 (含 archive_manifest.db)')
+    p.add_argument('files', nargs='*', help='要还原的原始路径；不指定时列出归档内容')
+    p.add_argument('--all', action='store_true', help='还原全部文件')
+    p.add_argument('--match', help='列出时按 SQL LIKE 模式过滤路径，如 %%/2023-05/%%')
+    p.add_argument('--to', help='还原到该目录下 (保留原始路径结构)，默认还原到原位置')
+    p.add_argument('--overwrite', action='store_true', help='覆盖已存在的文件')
+    p.add_argument('--format', choices=['json', 'ndjson'], default='ndjson')
+    p.add_argument('-o', '--output', help='输出文件，默认写到标准输出')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'lookup':
+        return main_lookup(args)
+    if args.command == 'report':
+        return main_db_command(args, run_report)
+    if args.command == 'restore':
+        stream = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        writer = ResultWriter(stream, args.format)
+        try:
+            failed = run_restore(args, writer)
+            writer.close()
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        return failed
+    target_sub = 'FileStorage/MsgAttach' if args.command == 'cold' else 'FileStorage'
+    roots = resolve_roots(args.roots, args.detect, target_sub)
+    if not roots:
+        print("未找到可扫描的目录。", file=sys.stderr)
+        return 2
+
+    stream = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    writer = ResultWriter(stream, args.format)
+    try:
+        if args.command == 'cold':
+            failed = run_cold(args, roots, writer)
+        elif args.command == 'estimate':
+            failed = run_estimate(args, roots, writer)
+        else:
+            from db_manager import DatabaseManager
+            db = DatabaseManager(args.db)
+            try:
+                if args.command == 'watch':
+                    failed = run_watch(args, roots, writer, db)
+                else:
+                    failed = run_dedup(args, roots, writer, db)
+            finally:
+                db.close()
+        writer.close()
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    return 1 if failed else 0
+
+
+def main_lookup(args):
+    if not args.files and not args.shared:
+        print("请指定要查询的文件，或使用 --shared。", file=sys.stderr)
+        return 2
+    return main_db_command(args, run_lookup)
+
+
+def main_db_command(args, run):
+    """只读写数据库、不遍历目录的子命令"""
+    from db_manager import DatabaseManager
+    stream = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    writer = ResultWriter(stream, args.format)
+    db = DatabaseManager(args.db)
+    try:
+        failed = run(args, writer, db)
+        writer.close()
+    finally:
+        db.close()
+        if stream is not sys.stdout:
+            stream.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1620 @@
+import os
+import sys
+import hashlib
+import threading
+import time
+import re
+import difflib
+import bisect
+import heapq
+from array import array
+from collections import Counter, defaultdict, namedtuple
+from contextlib import contextmanager
+
+from zip_fingerprint import ZIP_EXTS, ZipFingerprint
+
+SAMPLE_SIZE = 64 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+# 机械硬盘上不超过该大小的文件，采样哈希改为一次顺序读完再取头尾，省去一次寻道
+SAMPLE_COALESCE_MAX = 512 * 1024
+DEFAULT_HASH_WORKERS = 4
+DEFAULT_BYTES_IN_FLIGHT = 256 * 1024 * 1024
+STAGE2_CHUNK_SIZE = 20000
+STAGE3_CHUNK_SIZE = 2000
+DEFAULT_MOVE_WORKERS = 4
+MOVE_JOURNAL_DB = "wechat_move_journal.db"
+CHECKPOINT_EVERY = 5000
+CHECKPOINT_MAX_AGE = 3 * 86400
+# 增量遍历: 目录 mtime 距遍历开始不足该时长时不记录，文件系统时间粒度较粗 (FAT 为 2 秒)
+DIR_MTIME_SLACK_NS = 2 * 10**9
+MONTH_DIR_RE = re.compile(r'^\d{4}-\d{2}$')
+# 混合策略: 小于该大小的文件做严格去重，其余按文件名识别版本
+SMALL_FILE_LIMIT = 1 * 1024 * 1024
+# 允许按文件名识别版本的后缀
+FUZZY_SAFE_EXTS = {'.doc', '.docx', '.pdf', '.ppt', '.pptx', '.xls', '.xlsx', '.mp4', '.mov', '.avi', '.zip', '.rar'}
+
+# 遍历时一次性取得的文件元数据，后续各阶段不再重复 stat
+FileRecord = namedtuple('FileRecord', 'path size mtime_ns inode dev')
+
+
+class Utils:
+    @staticmethod
+    def format_size(size):
+        for unit in ['B', 'KB', 'MB', 'GB']:
+            if size < 1024: return f"{size:.2f} {unit}"
+            size /= 1024
+        return f"{size:.2f} TB"
+
+    @staticmethod
+    def get_file_hash(filepath, sample=True, file_size=None, buf=None, coalesce=False):
+        """
+        sample=True : 头尾采样 MD5，文件不大于 2*SAMPLE_SIZE 时等同全量哈希
+        sample=False: 分块流式读取的全量 MD5
+        file_size   : 已知的文件大小，传入时省去一次 stat
+        buf         : 可复用的 bytearray 缓冲区 (readinto 读入，不为每块分配新对象)，默认新建 HASH_CHUNK_SIZE
+        coalesce    : 采样时文件不大于 SAMPLE_COALESCE_MAX 则一次顺序读完再取头尾 (机械硬盘)，结果不变
+        """
+        try:
+            if file_size is None:
+                file_size = os.path.getsize(filepath)
+            if file_size <= 2 * SAMPLE_SIZE:
+                sample = False
+            if buf is None:
+                buf = bytearray(HASH_CHUNK_SIZE)
+            view = memoryview(buf)
+
+            with open(filepath, 'rb', buffering=0) as f:
+                h = hashlib.md5()
+                if not sample:
+                    IOScheduler.advise(f.fileno(), 0, 0, 'sequential')
+                    while True:
+                        n = f.readinto(view)
+                        if not n: break
+                        h.update(view[:n])
+                    return h.hexdigest()
+
+                if coalesce and file_size <= min(SAMPLE_COALESCE_MAX, len(buf)):
+                    n = Utils._readinto_full(f, view[:file_size])
+                    h.update(view[:min(n, SAMPLE_SIZE)])
+                    h.update(view[max(0, n - SAMPLE_SIZE):n])
+                    return h.hexdigest()
+
+                IOScheduler.advise(f.fileno(), 0, 0, 'random')
+                n = Utils._readinto_full(f, view[:SAMPLE_SIZE])
+                h.update(view[:n])
+                f.seek(-SAMPLE_SIZE, 2)
+                n = Utils._readinto_full(f, view[:SAMPLE_SIZE])
+                h.update(view[:n])
+                return h.hexdigest()
+        except Exception:
+            return None
+
+    @staticmethod
+    def _readinto_full(f, view):
+        """无缓冲的 readinto 可能只读到一部分，读满 view 或到文件末尾为止"""
+        total = 0
+        while total < len(view):
+            n = f.readinto(view[total:])
+            if not n: break
+            total += n
+        return total
+
+    @staticmethod
+    def format_scan_report(report):
+        if not report['total']:
+            return "未找到符合条件的文件。"
+        return (f"扫描完成！\n模式: {report['mode']}\n"
+                f"文件总数: {report['total']}\n"
+                f"可清理数: {report['dup_count']}\n"
+                f"释放空间: {Utils.format_size(report['dup_size'])}\n"
+                f"缓存命中: {report['cache_hits']}/{report['cache_lookups']}")
+
+    @staticmethod
+    def format_metrics(metrics):
+        """把 ScanMetrics.as_dict() 格式化为逐阶段一行的耗时分布"""
+        lines = [f"总耗时 {metrics['elapsed']:.2f}s"]
+        for st in metrics['stages']:
+            line = f"  {st['stage']:<12}{st['seconds']:8.2f}s  {st['files']} 个"
+            if st['files_per_sec']:
+                line += f" ({st['files_per_sec']:.0f} 个/秒)"
+            if st['bytes_read']:
+                line += f"  读取 {Utils.format_size(st['bytes_read'])}"
+            if st['cache_hits']:
+                line += f"  缓存命中 {st['cache_hits']} (省去约 {st['syscalls_avoided']} 次系统调用)"
+            lines.append(line)
+        if metrics['peak_rss_kb']:
+            lines.append(f"峰值内存 {Utils.format_size(metrics['peak_rss_kb'] * 1024)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def format_estimate(report):
+        """把 SpaceEstimator.estimate() 的报告格式化为各模式一行的估计值与置信区间"""
+        lines = [f"快速估算 ({report['elapsed']:.1f}s，共 {report['total_files']} 个文件 / "
+                 f"{Utils.format_size(report['total_size'])}，抽样读取 {report['files_hashed']} 个文件):"]
+        for mode, title in (('strict', '严格去重'), ('fuzzy', '混合策略')):
+            est = report[mode]
+            if est['exact']:
+                lines.append(f"  {title}: 约 {Utils.format_size(est['estimate'])} (已全部核对)")
+            else:
+                lines.append(f"  {title}: 约 {Utils.format_size(est['estimate'])} "
+                             f"({report['confidence']:.0%} 置信区间 {Utils.format_size(est['low'])} ~ "
+                             f"{Utils.format_size(est['high'])})")
+        return "\n".join(lines)
+
+    REPORT_TITLES = {'kind': '按原因', 'ext': '按类型', 'account': '按微信号', 'age': '按修改时间'}
+    AGE_LABELS = {'0-30': '30 天内', '30-90': '1-3 个月', '90-180': '3-6 个月', '180-365': '6-12 个月',
+                  '365-730': '1-2 年', '730+': '2 年以上', None: '未知'}
+
+    @staticmethod
+    def format_result_report(report, top=10):
+        """把 DatabaseManager.get_result_report() 格式化为逐维度的可清理空间分布，每个维度最多 top 行"""
+        lines = []
+        for dim, rows in report.items():
+            if not rows: continue
+            lines.append(f"{Utils.REPORT_TITLES.get(dim, dim)}:")
+            for key, count, size, inc_count, inc_size in rows[:top]:
+                if dim == 'age':
+                    label = Utils.AGE_LABELS.get(key, key)
+                elif not key:
+                    label = '(无后缀)' if dim == 'ext' else '(未知)'
+                else:
+                    label = key
+                lines.append(f"  {label:<16}{inc_count:>8} 个  {Utils.format_size(inc_size):>12}"
+                             f"  (共 {count} 个, {Utils.format_size(size)})")
+            if len(rows) > top:
+                lines.append(f"  … 另有 {len(rows) - top} 项")
+        return "\n".join(lines)
+
+    @staticmethod
+    def stat_record(filepath):
+        st = os.stat(filepath)
+        return FileRecord(filepath, st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev)
+
+    @staticmethod
+    def to_records(files):
+        """兼容旧接口: 路径列表转为 FileRecord 列表，无法访问的文件被丢弃"""
+        records = []
+        for f in files:
+            if isinstance(f, FileRecord):
+                records.append(f)
+                continue
+            try:
+                records.append(Utils.stat_record(f))
+            except OSError:
+                pass
+        return records
+
+    @staticmethod
+    def walk_files(root_dir, extensions=None, should_stop=None, stack=None, on_dir_done=None):
+        """
+        基于 os.scandir 的单次遍历，逐个产出 FileRecord。
+        不跟随符号链接；extensions 为小写后缀集合时只产出匹配的文件。
+        stack      : 待遍历目录栈，传入时原地修改，可用于从断点继续遍历
+        on_dir_done: 每个目录处理完后调用，此时 stack 与已产出的文件是一致的断点
+        """
+        if stack is None:
+            stack = [root_dir]
+        while stack:
+            if should_stop and should_stop(): return
+            current = stack.pop()
+            try:
+                it = os.scandir(current)
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        if extensions and os.path.splitext(entry.name)[1].lower() not in extensions:
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    yield FileRecord(entry.path, st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev)
+            if on_dir_done: on_dir_done()
+
+    @staticmethod
+    def detect_wechat_paths(root_dir, target_sub="FileStorage/MsgAttach"):
+        targets = []
+        if not os.path.exists(root_dir): return targets
+        root_dir = os.path.normpath(root_dir)
+
+        if "FileStorage" in root_dir:
+            return [root_dir]
+
+        if os.path.exists(os.path.join(root_dir, "FileStorage")):
+            p = os.path.join(root_dir, target_sub)
+            if os.path.exists(p): targets.append(p)
+            return targets
+
+        try:
+            for item in os.listdir(root_dir):
+                full_path = os.path.join(root_dir, item)
+                if os.path.isdir(full_path) and (item.startswith("wxid_") or item == "All Users" or item == "Applet"):
+                    p = os.path.join(full_path, target_sub)
+                    if os.path.exists(p):
+                        targets.append(p)
+        except Exception:
+            pass
+        return targets
+
+
+class FileTable:
+    """
+    百万级文件的紧凑内存表 (列式存储)，替代 FileRecord 列表:
+    - 目录路径去重后按 dir_id 只保存一份，每个文件只保存 dir_id 和文件名
+    - dir_id / size / mtime_ns / inode / dev 存放在 array 列中，不为每个文件创建元组和整数对象
+    各阶段按下标处理文件，只在需要时用 record(i) 临时生成 FileRecord。
+    """
+    U64_MASK = (1 << 64) - 1
+
+    def __init__(self):
+        self.dirs = []
+        self.dir_index = {}
+        self.dir_ids = array('I')
+        self.names = []
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self.inodes = array('Q')
+        self.devs = array('Q')
+        self._names_by_dir = None
+
+    @classmethod
+    def of(cls, files):
+        """FileTable 原样返回；FileRecord 或路径列表转为 FileTable，无法访问的路径被丢弃"""
+        if isinstance(files, cls):
+            return files
+        table = cls()
+        for f in files:
+            if isinstance(f, FileRecord):
+                table.append(f)
+                continue
+            try:
+                table.append(Utils.stat_record(f))
+            except OSError:
+                pass
+        return table
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, path):
+        if self._names_by_dir is None:
+            # 按目录建立文件名集合，只引用已有的字符串，比整路径集合省内存
+            by_dir = defaultdict(set)
+            for dir_id, name in zip(self.dir_ids, self.names):
+                by_dir[dir_id].add(name)
+            self._names_by_dir = by_dir
+        dir_path, name = os.path.split(path)
+        dir_id = self.dir_index.get(dir_path)
+        return dir_id is not None and name in self._names_by_dir.get(dir_id, ())
+
+    def add_dir(self, dir_path):
+        dir_id = self.dir_index.get(dir_path)
+        if dir_id is None:
+            dir_id = self.dir_index[dir_path] = len(self.dirs)
+            self.dirs.append(dir_path)
+        return dir_id
+
+    def append(self, rec):
+        dir_path, name = os.path.split(rec.path)
+        self.dir_ids.append(self.add_dir(dir_path))
+        self.names.append(name)
+        self.sizes.append(rec.size)
+        self.mtimes.append(rec.mtime_ns)
+        # Windows 的 ReFS 上 st_ino 可能超过 64 位
+        self.inodes.append(rec.inode & self.U64_MASK)
+        self.devs.append(rec.dev & self.U64_MASK)
+        self._names_by_dir = None
+
+    def extend(self, records):
+        for rec in records:
+            self.append(rec)
+
+    def path(self, i):
+        return os.path.join(self.dirs[self.dir_ids[i]], self.names[i])
+
+    def ext(self, i):
+        return os.path.splitext(self.names[i])[1].lower()
+
+    def record(self, i):
+        return FileRecord(self.path(i), self.sizes[i], self.mtimes[i], self.inodes[i], self.devs[i])
+
+    def records(self, indices=None):
+        for i in (range(len(self.names)) if indices is None else indices):
+            yield self.record(i)
+
+    def same_size(self, indices=None):
+        """返回大小与至少一个其他文件相同的下标 (array)，按大小升序，同大小内保持原顺序"""
+        sizes = self.sizes
+        order = sorted(range(len(sizes)) if indices is None else indices, key=sizes.__getitem__)
+        result = array('q')
+        start = 0
+        for k in range(1, len(order) + 1):
+            if k == len(order) or sizes[order[k]] != sizes[order[start]]:
+                if k - start > 1:
+                    result.extend(order[start:k])
+                start = k
+        return result
+
+
+class ScanMetrics:
+    """
+    分阶段性能统计: walk / size_bucket / sample_hash / full_hash / fuzzy_match / zip_fingerprint /
+    image_hash / image_match / db_save / move / archive。
+    同名阶段可多次进入，耗时与计数累加 (例如按块执行的全量哈希)。
+    每个阶段记录耗时、文件数、读取字节数、缓存命中数、因命中而省去的系统调用数和峰值内存。
+    """
+    STAGE_ORDER = ('walk', 'size_bucket', 'sample_hash', 'full_hash', 'fuzzy_match', 'zip_fingerprint',
+                   'image_hash', 'image_match', 'db_save', 'move', 'archive')
+
+    def __init__(self):
+        self.stages = {}
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+
+    @staticmethod
+    def peak_rss_kb():
+        """进程峰值常驻内存 (KB)；没有 resource 模块的平台 (Windows) 返回 None"""
+        try:
+            import resource
+        except ImportError:
+            return None
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 以字节为单位，Linux 以 KB 为单位
+        return rss // 1024 if sys.platform == 'darwin' else rss
+
+    @staticmethod
+    def hash_syscalls(size, sample):
+        """一次 get_file_hash 的系统调用数估计: open + read... + close (采样时另有 lseek)"""
+        if sample and size > 2 * SAMPLE_SIZE:
+            return 5
+        return 3 + size // HASH_CHUNK_SIZE
+
+    def _entry(self, name):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {'seconds': 0.0, 'files': 0, 'bytes_read': 0,
+                                         'cache_hits': 0, 'syscalls_avoided': 0, 'peak_rss_kb': None}
+        return entry
+
+    def add(self, name, seconds=0.0, files=0, bytes_read=0, cache_hits=0, syscalls_avoided=0):
+        entry = self._entry(name)
+        entry['seconds'] += seconds
+        entry['files'] += files
+        entry['bytes_read'] += bytes_read
+        entry['cache_hits'] += cache_hits
+        entry['syscalls_avoided'] += syscalls_avoided
+        if seconds:
+            # 只在阶段结束时采样内存，避免逐文件调用 getrusage
+            entry['peak_rss_kb'] = self.peak_rss_kb()
+
+    @contextmanager
+    def stage(self, name, files=0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, seconds=time.perf_counter() - start, files=files)
+
+    def consume(self, name, items, sink):
+        """
+        sink(items) 消费结果生成器 (例如写库) 时，生成器内部的耗时已计入各扫描阶段，
+        这里只把剩余的、消费方自身的耗时计入 name 阶段。返回 sink 的返回值
+        """
+        inside = 0.0
+
+        def timed():
+            nonlocal inside
+            it = iter(items)
+            while True:
+                t = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    inside += time.perf_counter() - t
+                    return
+                inside += time.perf_counter() - t
+                yield item
+
+        start = time.perf_counter()
+        result = sink(timed())
+        files = result[0] if isinstance(result, tuple) else 0
+        self.add(name, seconds=time.perf_counter() - start - inside, files=files)
+        return result
+
+    def as_dict(self):
+        order = {name: i for i, name in enumerate(self.STAGE_ORDER)}
+        stages = []
+        for name in sorted(self.stages, key=lambda n: order.get(n, len(order))):
+            entry = dict(self.stages[name], stage=name)
+            entry['seconds'] = round(entry['seconds'], 4)
+            entry['files_per_sec'] = round(entry['files'] / entry['seconds'], 1) if entry['seconds'] > 0 else None
+            stages.append(entry)
+        return {'started_at': self.started_at, 'elapsed': round(time.perf_counter() - self.start, 4),
+                'peak_rss_kb': self.peak_rss_kb(), 'stages': stages}
+
+
+class HashCache:
+    """
+    文件指纹缓存: (size, mtime, inode) 未变化时直接复用上次计算的哈希。
+    """
+
+    def __init__(self, db, root_dir, flush_every=None, preload=True):
+        """
+        preload=True : 一次读入 root_dir 下的全部指纹
+        preload=False: 只在 prefetch() 时按需读取本次要哈希的文件，百万级目录下内存占用小得多
+        """
+        self.db = db
+        self.root_dir = root_dir
+        self.flush_every = flush_every
+        self.preload = preload
+        self.entries = db.load_fingerprints(root_dir) if db and preload else {}
+        self.dirty = {}
+        self.hits = 0
+        self.misses = 0
+
+    def prefetch(self, records):
+        """按需加载模式下，批量读入这些文件的缓存记录"""
+        if not self.db or self.preload: return
+        missing = [r.path for r in records if r.path not in self.entries and r.path not in self.dirty]
+        if missing:
+            self.entries.update(self.db.get_fingerprints(missing))
+
+    def lookup(self, record, sample=True):
+        """record: FileRecord。命中返回哈希，否则返回 None"""
+        stat_key = (record.size, record.mtime_ns, record.inode)
+        entry = self.dirty.get(record.path) or self.entries.get(record.path)
+        if not entry or tuple(entry[:3]) != stat_key:
+            self.misses += 1
+            return None
+
+        # 头尾采样已覆盖整个文件时，采样哈希即全量哈希
+        is_small = record.size <= 2 * SAMPLE_SIZE
+        cached = entry[3] if sample and not is_small else entry[4]
+        if cached:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return cached
+
+    def store(self, record, sample, h):
+        stat_key = (record.size, record.mtime_ns, record.inode)
+        filepath = record.path
+        entry = self.dirty.get(filepath) or self.entries.get(filepath)
+        if entry and tuple(entry[:3]) == stat_key:
+            sample_hash, full_hash = entry[3], entry[4]
+        else:
+            sample_hash, full_hash = None, None
+        if stat_key[0] <= 2 * SAMPLE_SIZE:
+            sample_hash = full_hash = h
+        elif sample:
+            sample_hash = h
+        else:
+            full_hash = h
+        self.dirty[filepath] = stat_key + (sample_hash, full_hash)
+        # 定期落盘，进程崩溃时已算出的哈希不会丢失
+        if self.flush_every and len(self.dirty) >= self.flush_every:
+            self.flush()
+
+    def get_hash(self, record, sample=True):
+        self.prefetch([record])
+        cached = self.lookup(record, sample)
+        if cached:
+            return cached
+        h = Utils.get_file_hash(record.path, sample=sample, file_size=record.size)
+        if h: self.store(record, sample, h)
+        return h
+
+    def flush(self):
+        if not self.db or not self.dirty: return
+        self.db.save_fingerprints([(p,) + v for p, v in self.dirty.items()])
+        self.entries.update(self.dirty)
+        self.dirty = {}
+
+    def evict_missing(self, seen_paths):
+        """
+        剔除本次遍历未出现且已不存在的文件记录
+        seen_paths: 本次遍历到的路径，支持 in 判断即可 (集合或 FileTable)
+        """
+        if not self.db: return 0
+        paths = self.entries if self.preload else self.db.iter_fingerprint_paths(self.root_dir)
+        gone = [p for p in paths if p not in seen_paths and not os.path.exists(p)]
+        self.db.evict_fingerprints(gone)
+        for p in gone:
+            self.entries.pop(p, None)
+        return len(gone)
+
+
+class ContentIndex:
+    """
+    跨账号、跨扫描根目录的全局内容索引 (db 的 content_index 表):
+    - 每次扫描遍历后增量登记全部文件的 (路径, 大小, 修改时间, 微信号)，未变化的记录不改写
+    - 全量哈希只在出现同大小的候选时才计算并写回；扫描中算出的全量哈希经 HashCache 落盘时自动补入
+    新到的文件只需按 (大小, 哈希) 查索引，不必重新遍历其他账号。
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def account_of(path):
+        """路径所属的微信号目录 (FileStorage 的上一级，或 wxid_ 开头的目录名)，无法判断时返回空串"""
+        parts = os.path.normpath(path).split(os.sep)
+        if 'FileStorage' in parts:
+            i = parts.index('FileStorage')
+            if i > 0: return parts[i - 1]
+        for part in parts:
+            if part.startswith('wxid_'): return part
+        return ''
+
+    def update(self, files):
+        """登记一批文件 (FileTable / FileRecord / 路径)，微信号按目录只解析一次。返回登记条数"""
+        table = FileTable.of(files)
+        accounts = [self.account_of(d) for d in table.dirs]
+        return self.db.update_content_index(
+            (table.path(i), table.sizes[i], table.mtimes[i], accounts[table.dir_ids[i]])
+            for i in range(len(table))
+        )
+
+    def evict_missing(self, root_dir, seen_paths):
+        """剔除 root_dir 下本次遍历未出现且已不存在的记录"""
+        gone = [p for p in self.db.iter_content_paths(root_dir)
+                if p not in seen_paths and not os.path.exists(p)]
+        self.db.evict_content(gone)
+        return len(gone)
+
+    def _resolve(self, size, rows):
+        """
+        为 rows (lookup_content 的返回) 中尚未计算的记录补算全量哈希并写回索引。
+        已删除的文件从索引中剔除，已修改的跳过 (等下次扫描重新登记)。返回 [(path, account, full_hash)]
+        """
+        resolved, updates, gone = [], [], []
+        for path, mtime_ns, account, full_hash in rows:
+            if not full_hash:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    gone.append(path)
+                    continue
+                if st.st_size != size or st.st_mtime_ns != mtime_ns: continue
+                full_hash = Utils.get_file_hash(path, sample=False, file_size=size)
+                if not full_hash: continue
+                updates.append((full_hash, path, size, mtime_ns))
+            resolved.append((path, account, full_hash))
+        self.db.set_content_hashes(updates)
+        self.db.evict_content(gone)
+        return resolved
+
+    def lookup(self, path, register=True):
+        """
+        查找与 path 内容相同的已索引文件: [(path, account), ...]
+        索引中没有同大小的文件时直接返回，不读取文件内容。register: 同时把 path 登记进索引
+        """
+        return self.lookup_record(Utils.stat_record(os.path.abspath(path)), register)[1]
+
+    def lookup_record(self, rec, register=True):
+        """同 lookup，rec 为绝对路径的 FileRecord；返回 (path 的全量哈希, [(path, account), ...])，没有匹配时哈希可能为 None"""
+        path = rec.path
+        if register: self.update([rec])
+        if rec.size == 0: return None, []
+
+        rows = self.db.lookup_content(rec.size)
+        if not any(r[0] != path for r in rows): return None, []
+        if not any(r[0] == path for r in rows):
+            rows.append((path, rec.mtime_ns, self.account_of(path), None))
+        resolved = self._resolve(rec.size, rows)
+        own = next((h for p, _, h in resolved if p == path), None)
+        if not own: return None, []
+        return own, [(p, account) for p, account, h in resolved if p != path and h == own]
+
+    def lookup_hash(self, size, full_hash):
+        """已知大小和全量 MD5 时直接走索引: [(path, account), ...]"""
+        return [(r[0], r[2]) for r in self.db.lookup_content(size, full_hash)]
+
+    def iter_cross_account_groups(self, min_size=1, should_stop=None):
+        """
+        产出跨账号的重复内容: (size, full_hash, [(path, account), ...])，组内至少涉及两个微信号。
+        只对在多个账号中都出现过的大小补算哈希
+        """
+        for size in self.db.get_shared_sizes(min_size):
+            if should_stop and should_stop(): return
+            groups = defaultdict(list)
+            for path, account, h in self._resolve(size, self.db.lookup_content(size)):
+                groups[h].append((path, account))
+            for h, members in groups.items():
+                if len({account for _, account in members}) > 1:
+                    yield size, h, members
+
+
+class ScanCheckpoint:
+    """
+    长时间扫描的断点续扫，以 root + mode + 后缀集合为键保存在 db 中:
+    - 遍历: 每新发现 CHECKPOINT_EVERY 个文件，在目录边界把待遍历目录栈和新文件在同一事务中落盘
+    - 哈希: 由 HashCache 定期写入指纹表，续扫时直接命中缓存
+    - 结果: 断点拥有 scan_results 时 (期间没有其他扫描清空结果)，续扫不清空，已保存的文件跳过
+    停止或出错时保留断点，扫描完成后删除；超过 CHECKPOINT_MAX_AGE 的断点视为过期。
+    续扫沿用断点中的文件元数据，断点之后才新增的文件要等下一次完整扫描才会出现。
+    """
+
+    def __init__(self, db, root_dir, mode, extensions=None, every=CHECKPOINT_EVERY):
+        self.db = db
+        self.root_dir = root_dir
+        self.mode = mode
+        self.key = self.make_key(root_dir, mode, extensions)
+        self.extensions = ','.join(sorted({e.lower() for e in extensions})) if extensions else ''
+        self.every = every
+        self.state = None
+        self.owns_results = False
+
+    @staticmethod
+    def make_key(root_dir, mode, extensions=None):
+        exts = ','.join(sorted({e.lower() for e in extensions})) if extensions else '*'
+        return f"{os.path.abspath(root_dir)}|{mode}|{exts}"
+
+    def load(self, max_age=CHECKPOINT_MAX_AGE):
+        """读取断点: {phase, frontier, file_count, owns_results, updated_at}，没有或已过期时返回 None"""
+        state = self.db.load_checkpoint(self.key)
+        if state and time.time() - state['updated_at'] > max_age:
+            self.db.delete_checkpoint(self.key)
+            state = None
+        self.state = state
+        self.owns_results = bool(state and state['owns_results'])
+        return state
+
+    def discard(self):
+        self.db.delete_checkpoint(self.key)
+        self.state = None
+        self.owns_results = False
+
+    def _save(self, phase, frontier, new_records):
+        self.db.save_checkpoint(self.key, self.root_dir, self.mode, self.extensions, phase,
+                                list(frontier), new_records, self.owns_results)
+
+    def walk(self, extensions=None, should_stop=None, dir_index=None):
+        """
+        遍历根目录 (有断点时从断点继续)，返回包含全部文件的 FileTable。
+        dir_index: 没有断点时改用 DirectoryIndex 增量遍历。目录索引本身就是遍历的续扫状态，
+                   不再把全部文件复制进断点表；中断后重新增量遍历，已算的哈希仍由 HashCache 命中
+        """
+        table = FileTable()
+        if dir_index is not None and not self.state:
+            table.extend(dir_index.walk(self.root_dir, extensions, should_stop))
+            return table
+        if self.state:
+            table.extend(FileRecord(*row) for row in self.db.load_checkpoint_files(self.key))
+            stack = self.state['frontier'] if self.state['phase'] == 'walk' else []
+        else:
+            stack = [self.root_dir]
+        saved = len(table)
+
+        def save(phase):
+            nonlocal saved
+            self._save(phase, stack, list(table.records(range(saved, len(table)))))
+            saved = len(table)
+
+        def on_dir_done():
+            if len(table) - saved >= self.every:
+                save('walk')
+
+        table.extend(Utils.walk_files(self.root_dir, extensions, should_stop, stack=stack, on_dir_done=on_dir_done))
+        # 被中止时 stack 中还有未遍历的目录
+        save('walk' if stack else 'hash')
+        return table
+
+    def finish(self):
+        self.db.delete_checkpoint(self.key)
+
+
+class DirectoryIndex:
+    """
+    增量遍历 (db 的 dir_index / dir_files 表): 记录每个目录的 mtime、子项数和其中文件的元数据。
+    目录中新增、删除或改名条目都会改变目录自身的 mtime，mtime 未变的目录沿用上次记录的文件和子目录，
+    只需 stat 目录本身，省去 scandir 和逐个文件的 stat；变化的目录才重新读取。
+    依赖微信附件写入后不再原地修改: 原地改写不会改变目录 mtime，
+    这类文件的大小和修改时间沿用旧记录，需要时用完整扫描刷新。
+    mtime 距遍历开始不足 DIR_MTIME_SLACK_NS 的目录记为 -1，下次一定重新读取，避免同一时间粒度内的后续修改被漏掉
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.stats = {}
+
+    def walk(self, root_dir, extensions=None, should_stop=None, new_files=None, cached=True):
+        """
+        与 Utils.walk_files 相同地逐个产出 FileRecord: 先产出重新读取的目录中的文件，再产出沿用记录的。
+        new_files: 传入列表时，追加与上次记录相比新增或变化的文件 (root_dir 尚无索引时不追加)
+        cached   : False 时不产出沿用记录的文件，只更新索引 (监视模式只关心变化)
+        完整遍历结束后才更新索引，被 should_stop 中止时索引保持不变
+        """
+        root_dir = os.path.normpath(os.path.abspath(root_dir))
+        known = self.db.load_dir_index(root_dir)
+        stats = self.stats = {'dirs': 0, 'rescanned_dirs': 0, 'reused_dirs': 0,
+                              'scanned_files': 0, 'reused_files': 0, 'new_files': 0, 'baseline': not known}
+        children = defaultdict(list)
+        for path, (parent, _, _) in known.items():
+            children[parent].append(path)
+        fresh_after = time.time_ns() - DIR_MTIME_SLACK_NS
+
+        def wanted(name):
+            return not extensions or os.path.splitext(name)[1].lower() in extensions
+
+        reused, dir_rows, file_rows = set(), [], []
+        stack = [(root_dir, None)]
+        while stack:
+            if should_stop and should_stop(): return
+            current, parent = stack.pop()
+            try:
+                st = os.stat(current)
+            except OSError:
+                continue
+            stats['dirs'] += 1
+            entry = known.get(current)
+            if entry and entry[1] == st.st_mtime_ns:
+                reused.add(current)
+                stats['reused_dirs'] += 1
+                stack.extend((child, current) for child in children[current])
+                continue
+
+            previous = self.db.get_dir_files(current) if entry and new_files is not None else {}
+            try:
+                it = os.scandir(current)
+            except OSError:
+                continue
+            count = 0
+            with it:
+                for e in it:
+                    try:
+                        if e.is_dir(follow_symlinks=False):
+                            stack.append((e.path, current))
+                            count += 1
+                            continue
+                        if not e.is_file(follow_symlinks=False):
+                            continue
+                        est = e.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    count += 1
+                    row = (est.st_size, est.st_mtime_ns, est.st_ino, est.st_dev)
+                    file_rows.append((current, e.name, *row))
+                    if not wanted(e.name): continue
+                    rec = FileRecord(e.path, *row)
+                    if new_files is not None and known and previous.get(e.name, (None, None))[:2] != row[:2]:
+                        new_files.append(rec)
+                        stats['new_files'] += 1
+                    stats['scanned_files'] += 1
+                    yield rec
+            stats['rescanned_dirs'] += 1
+            dir_rows.append((current, parent, st.st_mtime_ns if st.st_mtime_ns < fresh_after else -1, count))
+
+        for dir_path, name, size, mtime_ns, inode, dev in (self.db.iter_dir_files(root_dir) if cached else ()):
+            if should_stop and should_stop(): return
+            if dir_path in reused and wanted(name):
+                stats['reused_files'] += 1
+                yield FileRecord(os.path.join(dir_path, name), size, mtime_ns, inode, dev)
+
+        visited = reused.union(row[0] for row in dir_rows)
+        self.db.save_dir_index(dir_rows, file_rows, [d for d in known if d not in visited])
+        # 重新读取的目录中的文件 (不论后缀) 同步登记到内容索引，未变化的记录不会改写；
+        # 索引中的其余文件在其目录上次被读取时已登记
+        ContentIndex(self.db).update(FileRecord(os.path.join(d, name), *row) for d, name, *row in file_rows)
+
+
+class IOScheduler:
+    """
+    哈希阶段的 I/O 调度:
+    - 通过 /sys/dev/block/<major>:<minor> (指向 /sys/block 下的设备) 的 queue/rotational 判断是否为机械硬盘，
+      USB 移动硬盘同样会报告为 rotational
+    - 机械硬盘上按 (设备, inode) 排序后单线程顺序读取: 同一目录先后写入的文件 inode 相邻，
+      数据块通常也相邻，磁头基本单向移动；并行读取只会让磁头在多个文件间来回寻道
+    - 读取当前文件时用 posix_fadvise(WILLNEED) 让内核提前读入下一个文件
+    非 Linux 平台或无法判断的设备 (网络盘、tmpfs 等) 视为非机械硬盘，保持并行读取。
+    """
+    _rotational = {}
+
+    @classmethod
+    def is_rotational(cls, dev):
+        """dev: st_dev"""
+        cached = cls._rotational.get(dev)
+        if cached is not None: return cached
+        result = False
+        if sys.platform.startswith('linux'):
+            base = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+            # 分区没有自己的 queue 目录，取其所在磁盘的
+            for path in (os.path.join(base, 'queue', 'rotational'), os.path.join(base, '..', 'queue', 'rotational')):
+                try:
+                    with open(path) as f:
+                        result = f.read().strip() == '1'
+                    break
+                except (OSError, ValueError):
+                    continue
+        cls._rotational[dev] = result
+        return result
+
+    @staticmethod
+    def advise(fd, offset, length, advice):
+        """posix_fadvise 的包装，advice: 'sequential' / 'random' / 'willneed'；不支持的平台忽略"""
+        if not hasattr(os, 'posix_fadvise'): return
+        flag = {'sequential': 'POSIX_FADV_SEQUENTIAL', 'random': 'POSIX_FADV_RANDOM',
+                'willneed': 'POSIX_FADV_WILLNEED'}[advice]
+        try:
+            os.posix_fadvise(fd, offset, length, getattr(os, flag))
+        except (OSError, AttributeError):
+            pass
+
+    @staticmethod
+    def prefetch_ranges(size, sample):
+        """
+        预读区间 (offset, length): 采样哈希为头尾两段 (小文件合并为整个文件)；
+        全量哈希只预读开头几块，之后由 POSIX_FADV_SEQUENTIAL 的顺序预读接管
+        """
+        if not sample:
+            return [(0, min(size, HASH_CHUNK_SIZE * 4))]
+        if size <= SAMPLE_COALESCE_MAX:
+            return [(0, size)]
+        return [(0, SAMPLE_SIZE), (size - SAMPLE_SIZE, SAMPLE_SIZE)]
+
+    @classmethod
+    def prefetch(cls, rec, sample):
+        """提示内核预读 rec 即将被读取的区间，读取在后台进行"""
+        if not hasattr(os, 'posix_fadvise'): return
+        try:
+            fd = os.open(rec.path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            for offset, length in cls.prefetch_ranges(rec.size, sample):
+                cls.advise(fd, offset, length, 'willneed')
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def order(jobs):
+        """jobs: (idx, FileRecord, cost)，按 (设备, inode) 排序"""
+        jobs.sort(key=lambda job: (job[1].dev, job[1].inode))
+
+
+class HashEngine:
+    """
+    基于线程池的并行哈希引擎。
+    workers            : 并发读取线程数 (hashlib 处理大块数据时会释放 GIL)
+    max_bytes_in_flight: 同时处于读取中的字节数上限，避免大文件把 I/O 队列塞满
+    io_mode            : 'auto' 在机械硬盘上改为按 inode 顺序单线程读取 (见 IOScheduler)；
+                         'parallel' / 'sequential' 强制指定
+    结果顺序与输入顺序一致。
+    """
+
+    def __init__(self, workers=DEFAULT_HASH_WORKERS, max_bytes_in_flight=DEFAULT_BYTES_IN_FLIGHT, hash_cache=None,
+                 metrics=None, io_mode='auto'):
+        self.workers = max(1, int(workers))
+        self.max_bytes_in_flight = max_bytes_in_flight
+        self.hash_cache = hash_cache
+        self.metrics = metrics
+        self.io_mode = io_mode
+        self._local = threading.local()
+
+    def _hash_one(self, path, sample, size):
+        # 每个线程复用自己的读缓冲区
+        buf = getattr(self._local, 'buf', None)
+        if buf is None:
+            buf = self._local.buf = bytearray(HASH_CHUNK_SIZE)
+        return Utils.get_file_hash(path, sample=sample, file_size=size, buf=buf)
+
+    def is_sequential(self, jobs):
+        if self.io_mode != 'auto':
+            return self.io_mode == 'sequential'
+        return any(IOScheduler.is_rotational(dev) for dev in {job[1].dev for job in jobs})
+
+    def hash_files(self, files, sample=True, progress_callback=None, should_stop=None):
+        """
+        files: FileRecord 列表; progress_callback(done, total)
+        返回与 files 对齐的哈希列表，失败或被取消的项为 None
+        设置了 metrics 时，耗时计入 sample_hash / full_hash 阶段
+        """
+        if self.metrics is None:
+            return self._hash_files(files, sample, progress_callback, should_stop)
+        with self.metrics.stage('sample_hash' if sample else 'full_hash', files=len(files)):
+            return self._hash_files(files, sample, progress_callback, should_stop)
+
+    def _hash_files(self, files, sample, progress_callback, should_stop):
+        total = len(files)
+        results = [None] * total
+        jobs = []  # (idx, record, cost)
+        hits = 0
+        syscalls_avoided = 0
+
+        if self.hash_cache:
+            self.hash_cache.prefetch(files)
+        for idx, rec in enumerate(files):
+            if self.hash_cache:
+                cached = self.hash_cache.lookup(rec, sample)
+                if cached:
+                    results[idx] = cached
+                    hits += 1
+                    syscalls_avoided += ScanMetrics.hash_syscalls(rec.size, sample)
+                    continue
+            cost = min(rec.size, 2 * SAMPLE_SIZE) if sample else rec.size
+            jobs.append((idx, rec, cost))
+
+        if self.metrics is not None:
+            self.metrics.add('sample_hash' if sample else 'full_hash', cache_hits=hits,
+                             syscalls_avoided=syscalls_avoided)
+        done = total - len(jobs)
+        if progress_callback: progress_callback(done, total)
+
+        def finish(job, h):
+            idx, rec, cost = job
+            results[idx] = h
+            if self.metrics is not None:
+                self.metrics.add('sample_hash' if sample else 'full_hash', bytes_read=cost)
+            if h and self.hash_cache:
+                self.hash_cache.store(rec, sample, h)
+
+        sequential = self.is_sequential(jobs)
+        if sequential or self.workers == 1:
+            if sequential:
+                IOScheduler.order(jobs)
+                if sample:
+                    # 合并读取的小文件整个读入
+                    jobs = [(idx, rec, rec.size if rec.size <= SAMPLE_COALESCE_MAX else cost)
+                            for idx, rec, cost in jobs]
+            buf = bytearray(HASH_CHUNK_SIZE)
+            for k, job in enumerate(jobs):
+                if should_stop and should_stop(): break
+                rec = job[1]
+                if sequential and k + 1 < len(jobs):
+                    IOScheduler.prefetch(jobs[k + 1][1], sample)
+                finish(job, Utils.get_file_hash(rec.path, sample=sample, file_size=rec.size, buf=buf,
+                                                coalesce=sequential))
+                done += 1
+                if progress_callback and done % 100 == 0: progress_callback(done, total)
+            if progress_callback: progress_callback(done, total)
+            return results
+
+        # 按需导入，命令行版只做冷数据扫描时不必加载线程池相关模块
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        pending = {}
+        in_flight = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            def drain(block_until):
+                nonlocal in_flight, done
+                while pending and block_until():
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        job = pending.pop(fut)
+                        in_flight -= job[2]
+                        done += 1
+                        if not fut.cancelled():
+                            finish(job, fut.result())
+                    if progress_callback: progress_callback(done, total)
+
+            for job in jobs:
+                if should_stop and should_stop(): break
+                # 字节预算不足时等待已提交的任务完成；单个超大文件在队列为空时照常提交
+                drain(lambda: in_flight + job[2] > self.max_bytes_in_flight or len(pending) >= self.workers * 4)
+                pending[pool.submit(self._hash_one, job[1].path, sample, job[1].size)] = job
+                in_flight += job[2]
+
+            if should_stop and should_stop():
+                for fut in pending:
+                    fut.cancel()
+            drain(lambda: True)
+
+        return results
+
+
+class FuzzyMatcher:
+    """
+    文件名模糊分组索引，分组结果与逐对调用 is_name_similar 的滑动窗口完全一致:
+    - 每个文件名只规范化一次，规范名完全相同的直接走哈希桶
+    - 其余候选用字符倒排索引 + 前缀过滤生成。ratio() 的上界是两名字字符多重集的交集，
+      按全局稀有度排序字符后，交集至少为 o 的两个名字，其最稀有的 k 个公共字符必然落在
+      各自长度为 len - o + k 的前缀内 (k = min(2, o))，因此只需索引前缀并要求前缀
+      至少共享 k 个字符，不会漏掉任何满足阈值的配对
+    - 候选再依次经过长度上界、字符交集上界和 SequenceMatcher.ratio 校验
+    items 需按大小升序排列，元素为 (name, size)。
+    """
+
+    def __init__(self, items, threshold=0.6, size_ratio=1.3):
+        self.threshold = threshold
+        self.size_ratio = size_ratio
+        self.sizes = [size for _, size in items]
+        self.keys = [CoreLogic.normalize_filename(name) for name, _ in items]
+
+        self.exact = defaultdict(list)
+        for idx, key in enumerate(self.keys):
+            self.exact[key].append(idx)
+
+        # 多重集转为集合: 第 k 次出现的字符 c 记为 (c, k)
+        tokens = []
+        self.token_sets = []
+        freq = defaultdict(int)
+        for key in self.keys:
+            seen = defaultdict(int)
+            toks = []
+            for c in key:
+                toks.append((c, seen[c]))
+                seen[c] += 1
+            tokens.append(toks)
+            self.token_sets.append(frozenset(toks))
+            for t in toks:
+                freq[t] += 1
+
+        self.postings = defaultdict(list)
+        self.prefixes = []
+        self.min_overlaps = []
+        rank = {t: r for r, t in enumerate(sorted(freq, key=lambda t: (freq[t], t)))}
+        for idx, toks in enumerate(tokens):
+            toks.sort(key=rank.__getitem__)
+            min_overlap = self._min_overlap(len(toks))
+            self.min_overlaps.append(min_overlap)
+            prefix = toks[:len(toks) - min_overlap + self.MIN_SHARED]
+            self.prefixes.append(prefix)
+            for t in prefix:
+                self.postings[t].append(idx)
+
+    MIN_SHARED = 2
+
+    def _min_overlap(self, length):
+        # 能与长度为 length 的名字达到阈值的配对，字符交集必须大于 th*length/(2-th)
+        return max(1, int(self.threshold * length / (2 - self.threshold)))
+
+    def _candidates(self, i, hi):
+        if self.threshold <= 0:
+            return list(range(i + 1, hi))
+        found = set()
+        for idx in self.exact[self.keys[i]]:
+            if i < idx < hi: found.add(idx)
+
+        shared = Counter()
+        for t in self.prefixes[i]:
+            post = self.postings[t]
+            lo = bisect.bisect_right(post, i)
+            up = bisect.bisect_left(post, hi, lo)
+            shared.update(post[lo:up])
+        if self.min_overlaps[i] >= self.MIN_SHARED:
+            found.update(idx for idx, cnt in shared.items() if cnt >= self.MIN_SHARED)
+        else:
+            # 双方都是极短名字时，交集下界只有 1
+            base_overlap, min_overlaps = self.min_overlaps[i], self.min_overlaps
+            found.update(idx for idx, cnt in shared.items()
+                         if cnt >= min(self.MIN_SHARED, max(base_overlap, min_overlaps[idx])))
+        return sorted(found)
+
+    def groups(self):
+        """按原滑动窗口的顺序产出分组 (索引列表，首个为基准文件)"""
+        n = len(self.keys)
+        visited = [False] * n
+        th = self.threshold
+        for i in range(n):
+            if visited[i]: continue
+            visited[i] = True
+            group = [i]
+            base_key = self.keys[i]
+            base_tokens = self.token_sets[i]
+            hi = bisect.bisect_right(self.sizes, self.sizes[i] * self.size_ratio, i + 1)
+            matcher = difflib.SequenceMatcher(None, base_key, '')
+
+            for j in self._candidates(i, hi):
+                if visited[j]: continue
+                key = self.keys[j]
+                if key != base_key:
+                    total = len(base_key) + len(key)
+                    if 2.0 * min(len(base_key), len(key)) / total <= th: continue
+                    if 2.0 * len(base_tokens & self.token_sets[j]) / total <= th: continue
+                    matcher.set_seq2(key)
+                    if matcher.ratio() <= th: continue
+                group.append(j)
+                visited[j] = True
+
+            if len(group) > 1:
+                yield group
+
+
+class ColdBudgetSelector:
+    """
+    按空间目标挑选冷数据: 流式接收 FileRecord，用 (未修改天数 × 大小) 作为冷度评分，
+    只保留评分最高、总大小刚好达到 budget_bytes 的最少一组文件。
+    小根堆中的文件始终是已见文件按评分排序的前缀: 新文件入堆后，只要去掉评分最低的一个仍能达到目标
+    就将其弹出，因此内存只与选中的文件数有关，与目录树大小无关。
+    所有文件加起来仍不足目标时，全部选中
+    """
+
+    def __init__(self, budget_bytes, now=None):
+        self.budget = budget_bytes
+        self.now_ns = int((now if now is not None else time.time()) * 1e9)
+        self.heap = []
+        self.total = 0
+
+    def score(self, rec):
+        age_days = max(0, self.now_ns - rec.mtime_ns) / (86400 * 1e9)
+        return age_days * rec.size
+
+    def offer(self, rec):
+        if rec.size <= 0: return
+        heapq.heappush(self.heap, (self.score(rec), rec))
+        self.total += rec.size
+        while self.heap and self.total - self.heap[0][1].size >= self.budget:
+            self.total -= heapq.heappop(self.heap)[1].size
+
+    def selected(self):
+        """选中的 FileRecord，按评分从高到低"""
+        return [rec for _, rec in sorted(self.heap, reverse=True)]
+
+
+class CoreLogic:
+    @staticmethod
+    def normalize_filename(filename):
+        """
+        使用正则提取文件核心名，去除常见后缀。
+        """
+        name, ext = os.path.splitext(filename)
+        name = re.sub(r'\(\d+\)$', '', name)
+        name = re.sub(r'（\d+）$', '', name)
+        name = re.sub(r'_副本$', '', name)
+        name = re.sub(r' - Copy$', '', name)
+        name = re.sub(r'_\d+$', '', name)
+        return name.strip().lower()
+
+    @staticmethod
+    def is_name_similar(name1, name2, threshold=0.6):
+        core1 = CoreLogic.normalize_filename(name1)
+        core2 = CoreLogic.normalize_filename(name2)
+
+        if core1 == core2:
+            return True
+
+        return difflib.SequenceMatcher(None, core1, core2).ratio() > threshold
+
+    @staticmethod
+    def exact_keep_key(path):
+        """内容完全一致的一组文件保留路径最短的一份，等长时取字典序最小的，结果与遍历顺序无关"""
+        return len(path), path
+
+    @staticmethod
+    def iter_exact_duplicates(files_list, hash_cache=None, progress_callback=None,
+                              value_callback=None, should_stop=None, engine=None,
+                              chunk_size=STAGE3_CHUNK_SIZE, metrics=None, indices=None):
+        """
+        分阶段精确去重:
+        1. 按文件大小分桶，大小唯一的文件直接排除
+        2. 对同大小文件计算头尾采样哈希
+        3. 仅对采样哈希冲突的文件计算全量哈希
+        files_list: FileTable (也兼容 FileRecord 列表或路径列表)
+        indices: 只处理 FileTable 中的这些下标，默认全部
+        逐组产出 (full_hash, [FileRecord, ...])。第 3 阶段按采样组分块处理，
+        每块算完即产出，调用方可以边扫描边保存结果。
+        metrics: 可选的 ScanMetrics，记录分桶阶段耗时 (哈希阶段由 engine 记录)
+        """
+        if metrics is None:
+            metrics = ScanMetrics()
+        if engine is None:
+            engine = HashEngine(workers=1, hash_cache=hash_cache, metrics=metrics)
+        table = FileTable.of(files_list)
+        sizes = table.sizes
+
+        def reporter(start, span, offset=0, total_all=None):
+            if not value_callback: return None
+
+            def report(done, total):
+                total = total_all or total
+                if total: value_callback(start + int((offset + done) / total * span))
+            return report
+
+        # Stage 1: 大小分桶 (按大小排序下标，不为每个文件建立列表项)
+        if progress_callback: progress_callback("阶段 1/3: 按大小分组...")
+        with metrics.stage('size_bucket', files=len(table) if indices is None else len(indices)):
+            candidates = table.same_size(indices)
+
+        # Stage 2: 头尾采样。候选已按大小排序，逐个大小段在段内按采样哈希分组，
+        # 只保留有冲突的组，不为每个候选文件保留哈希
+        if progress_callback: progress_callback(f"阶段 2/3: 采样哈希 {len(candidates)} 个同大小文件...")
+        sample_groups = []
+        run_map = {}
+        run_size = None
+        for start in range(0, len(candidates), STAGE2_CHUNK_SIZE):
+            chunk = candidates[start:start + STAGE2_CHUNK_SIZE]
+            hashes = engine.hash_files([table.record(i) for i in chunk], sample=True,
+                                       progress_callback=reporter(10, 50, start, len(candidates)),
+                                       should_stop=should_stop)
+            if should_stop and should_stop(): return
+            for i, h in zip(chunk, hashes):
+                if not h: continue
+                if sizes[i] != run_size:
+                    sample_groups.extend(g for g in run_map.values() if len(g) > 1)
+                    run_map.clear()
+                    run_size = sizes[i]
+                run_map.setdefault(h, []).append(i)
+        sample_groups.extend(g for g in run_map.values() if len(g) > 1)
+        del candidates, run_map
+
+        # Stage 3: 采样冲突的文件做全量哈希。全量哈希相同的文件必然在同一采样组内，
+        # 因此可以按采样组分块计算、分块产出
+        total = sum(len(group) for group in sample_groups)
+        if progress_callback: progress_callback(f"阶段 3/3: 全量哈希 {total} 个候选文件...")
+
+        done = 0
+        idx = 0
+        while idx < len(sample_groups):
+            chunk = []
+            while idx < len(sample_groups) and (not chunk or len(chunk) + len(sample_groups[idx]) <= chunk_size):
+                chunk.extend(sample_groups[idx])
+                idx += 1
+            records = [table.record(i) for i in chunk]
+            hashes = engine.hash_files(records, sample=False,
+                                       progress_callback=reporter(60, 30, done, total), should_stop=should_stop)
+            if should_stop and should_stop(): return
+            done += len(chunk)
+
+            hash_map = defaultdict(list)
+            for rec, h in zip(records, hashes):
+                if h: hash_map[h].append(rec)
+            for h, recs in hash_map.items():
+                if len(recs) > 1:
+                    yield h, recs
+
+    @staticmethod
+    def find_exact_duplicates(files_list, hash_cache=None, progress_callback=None,
+                              value_callback=None, should_stop=None, engine=None, metrics=None):
+        """返回 {full_hash: [FileRecord, ...]}，只包含重复组"""
+        return dict(CoreLogic.iter_exact_duplicates(
+            files_list, hash_cache=hash_cache, progress_callback=progress_callback,
+            value_callback=value_callback, should_stop=should_stop, engine=engine, metrics=metrics
+        ))
+
+    @staticmethod
+    def iter_strict_strategy(files_list, hash_cache=None, progress_callback=None,
+                             value_callback=None, should_stop=None, engine=None, metrics=None):
+        """严格模式: 逐条产出内容完全一致的重复文件，保留路径最短的一份"""
+        for h, recs in CoreLogic.iter_exact_duplicates(
+                files_list, hash_cache=hash_cache, progress_callback=progress_callback,
+                value_callback=value_callback, should_stop=should_stop, engine=engine,
+                metrics=metrics):
+            recs.sort(key=lambda r: CoreLogic.exact_keep_key(r.path))
+            keep = recs[0]
+            for r in recs[1:]:
+                yield {'file': r.path, 'keep': keep.path, 'size': r.size, 'mtime_ns': r.mtime_ns,
+                       'reason': 'strict_md5', 'group': h}
+
+    @staticmethod
+    def iter_mixed_strategy(files_list, progress_callback=None, hash_cache=None, engine=None,
+                            should_stop=None, metrics=None):
+        """
+        小文件 (<1MB) -> Strict MD5
+        大文件 (>=1MB) -> Fuzzy Logic；docx / xlsx / pptx / zip 的分组再用中央目录指纹确认 (见 zip_fingerprint)
+        files_list: FileTable (也兼容 FileRecord 列表或路径列表)
+        hash_cache: 可选的 HashCache，命中时跳过重新读取文件
+        engine: 可选的 HashEngine，用于并行计算哈希
+        metrics: 可选的 ScanMetrics，记录各阶段耗时
+        逐条产出结果字典，便于边扫描边保存
+        """
+        if metrics is None:
+            metrics = ScanMetrics()
+        table = FileTable.of(files_list)
+        sizes = table.sizes
+
+        # 1. 分流 (只保存下标)
+        small_files = array('q')
+        large_files = array('q')
+        for i in range(len(table)):
+            if sizes[i] < SMALL_FILE_LIMIT:
+                small_files.append(i)
+            else:
+                large_files.append(i)
+
+        if small_files:
+            if progress_callback: progress_callback("分析小文件 (MD5)...")
+            for h, recs in CoreLogic.iter_exact_duplicates(table, hash_cache=hash_cache,
+                                                           should_stop=should_stop, engine=engine,
+                                                           metrics=metrics, indices=small_files):
+                recs.sort(key=lambda r: CoreLogic.exact_keep_key(r.path))
+                keep = recs[0]
+                for r in recs[1:]:
+                    yield {
+                        'file': r.path, 'keep': keep.path, 'size': r.size, 'mtime_ns': r.mtime_ns,
+                        'reason': 'small_file_strict', 'group': h
+                    }
+            if should_stop and should_stop(): return
+
+        if large_files:
+            if progress_callback: progress_callback("分析大文件 (Fuzzy)...")
+            ext_groups = {}
+            for i in large_files:
+                ext = table.ext(i)
+                if ext not in ext_groups: ext_groups[ext] = []
+                ext_groups[ext].append(i)
+
+            names = table.names
+            mtimes = table.mtimes
+            for ext, members in ext_groups.items():
+                if should_stop and should_stop(): return
+                if len(members) < 2: continue
+
+                if ext not in FUZZY_SAFE_EXTS:
+                    continue
+
+                members.sort(key=sizes.__getitem__)
+                # 先算完整个后缀的分组再产出，写库耗时不会混进 fuzzy_match 阶段
+                with metrics.stage('fuzzy_match', files=len(members)):
+                    groups = list(FuzzyMatcher([(names[i], sizes[i]) for i in members]).groups())
+
+                scores = {}
+                if ext in ZIP_EXTS and groups:
+                    # 只读文件末尾的中央目录，名字相似但成员内容不同的文件被移出分组
+                    start = time.perf_counter()
+                    groups, scores, n_read, n_bytes = ZipFingerprint.confirm_groups(
+                        groups, lambda k: table.path(members[k]), lambda k: sizes[members[k]])
+                    metrics.add('zip_fingerprint', seconds=time.perf_counter() - start,
+                                files=n_read, bytes_read=n_bytes)
+
+                for group in groups:
+                    base = members[group[0]]
+                    current_group = [members[k] for k in group]
+                    current_group.sort(key=mtimes.__getitem__, reverse=True)
+                    keep_path = table.path(current_group[0])
+                    score = {members[k]: s for k, s in scores.items()}
+                    for i in current_group[1:]:
+                        zip_note = f", zip={score[i]:.2f}" if i in score else ""
+                        yield {
+                            'file': table.path(i), 'keep': keep_path, 'size': sizes[i], 'mtime_ns': mtimes[i],
+                            'reason': f"fuzzy_ver (base={names[base]}{zip_note})",
+                            'group': f"{ext}_{sizes[base]}"
+                        }
+
+    @staticmethod
+    def scan_mixed_strategy(files_list, progress_callback=None, hash_cache=None, engine=None, metrics=None):
+        return list(CoreLogic.iter_mixed_strategy(
+            files_list, progress_callback=progress_callback, hash_cache=hash_cache, engine=engine,
+            metrics=metrics
+        ))
+
+    @staticmethod
+    def iter_cold_files(target_paths, days_threshold, should_stop=None, stats=None, assume_write_once=False):
+        """
+        流式产出超过 days_threshold 天未修改的文件 (FileRecord)。
+        stats: 可选 dict，实时累加 scanned / matched / bytes / skipped_dirs
+        assume_write_once: 微信附件写入后不再修改，名为 YYYY-MM 的月份目录晚于阈值时，
+          其中都是近期收到的文件，整棵子树直接跳过不再遍历。其余文件仍逐个比较 mtime
+        """
+        if stats is None: stats = {}
+        for key in ('scanned', 'matched', 'bytes', 'skipped_dirs'):
+            stats.setdefault(key, 0)
+        cutoff = time.time() - days_threshold * 86400
+        cutoff_ns = int(cutoff * 1e9)
+        cutoff_month = time.strftime('%Y-%m', time.localtime(cutoff))
+
+        for root_dir in target_paths:
+            stack = [root_dir]
+            while stack:
+                if should_stop and should_stop(): return
+                current = stack.pop()
+                try:
+                    it = os.scandir(current)
+                except OSError:
+                    continue
+                with it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if assume_write_once and MONTH_DIR_RE.match(entry.name) and entry.name > cutoff_month:
+                                    stats['skipped_dirs'] += 1
+                                    continue
+                                stack.append(entry.path)
+                                continue
+                            if not entry.is_file(follow_symlinks=False):
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        stats['scanned'] += 1
+                        if st.st_mtime_ns < cutoff_ns:
+                            stats['matched'] += 1
+                            stats['bytes'] += st.st_size
+                            yield FileRecord(entry.path, st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev)
+
+    @staticmethod
+    def scan_cold_files_multi_path(target_paths, days_threshold):
+        return [rec.path for rec in CoreLogic.iter_cold_files(target_paths, days_threshold)]
+
+    @staticmethod
+    def select_cold_files(target_paths, budget_bytes, days_threshold=0, should_stop=None, stats=None,
+                          assume_write_once=False):
+        """
+        空间目标模式: 在超过 days_threshold 天未修改的文件中，选出冷度评分 (天数 × 大小) 最高、
+        总大小达到 budget_bytes 的最少文件 (见 ColdBudgetSelector)。
+        返回按评分从高到低排列的 FileRecord 列表；stats 额外记录 selected / selected_bytes
+        """
+        if stats is None: stats = {}
+        selector = ColdBudgetSelector(budget_bytes)
+        for rec in CoreLogic.iter_cold_files(target_paths, days_threshold, should_stop=should_stop,
+                                             stats=stats, assume_write_once=assume_write_once):
+            selector.offer(rec)
+        stats['selected'] = len(selector.heap)
+        stats['selected_bytes'] = selector.total
+        return selector.selected()
+
+    @staticmethod
+    def run_dedup_scan(root_dir, mode, db, extensions=None, workers=DEFAULT_HASH_WORKERS,
+                       max_bytes_in_flight=DEFAULT_BYTES_IN_FLIGHT, progress_callback=None,
+                       value_callback=None, should_stop=None, sink=None, resume=True, image_distance=None,
+                       io_mode='auto', incremental=False):
+        """
+        完整的去重扫描流程 (不依赖 Qt)，ScannerThread 与命令行共用。
+        mode: 'strict'、'fuzzy' (混合策略) 或 'image' (相似图片，需要 Pillow，见 image_dedup)
+        image_distance: image 模式下判为相似的最大海明距离，默认 IMAGE_HASH_DISTANCE
+        io_mode: 哈希阶段的读取方式，见 HashEngine
+        sink: 消费结果生成器并返回 (条数, 字节数) 的函数；默认清空并写入 db 的 scan_results
+        resume: 同一 root + mode + 后缀的扫描留有断点时从断点继续 (见 ScanCheckpoint)；False 时丢弃断点
+        incremental: 用目录索引增量遍历，只进入 mtime 变化过的目录 (见 DirectoryIndex)
+        返回报告 dict (含 run_id 与分阶段统计 metrics)；被 should_stop 中止时返回 None。
+        无论完成、中止还是出错，分阶段统计都会写入 db 的 scan_runs 表
+        """
+        def say(msg):
+            if progress_callback: progress_callback(msg)
+
+        def value(v):
+            if value_callback: value_callback(v)
+
+        metrics = ScanMetrics()
+        image_deduper = None
+        if mode == 'image':
+            # 缺少 Pillow 时在清空旧结果之前就报错
+            from image_dedup import ImageDeduper, IMAGE_EXTS, IMAGE_HASH_DISTANCE
+            extensions = extensions or IMAGE_EXTS
+            image_deduper = ImageDeduper(db, workers=workers, metrics=metrics,
+                                         distance=IMAGE_HASH_DISTANCE if image_distance is None else image_distance)
+
+        # 缓存以绝对路径为键，避免相对路径导致重复记录
+        root_dir = os.path.abspath(root_dir)
+        checkpoint = ScanCheckpoint(db, root_dir, mode, extensions)
+        if resume:
+            state = checkpoint.load()
+        else:
+            checkpoint.discard()
+            state = None
+        if state:
+            say(f"从上次中断处继续扫描 (已遍历 {state['file_count']} 个文件)")
+
+        prev_count = prev_size = 0
+        if sink is None:
+            if checkpoint.owns_results:
+                # 续扫: 保留已写入的结果，只追加新的
+                saved_paths = db.get_result_paths()
+                prev_count, prev_size = db.get_result_summary()
+                def sink(items):
+                    return db.insert_results(d for d in items if d['file'] not in saved_paths)
+            else:
+                db.clear_results()
+                db.disown_checkpoints()
+                sink = db.insert_results
+            checkpoint.owns_results = True
+
+        hash_cache = HashCache(db, root_dir, flush_every=CHECKPOINT_EVERY, preload=False)
+        report = {'root': root_dir, 'mode': mode, 'total': 0,
+                  'dup_count': 0, 'dup_size': 0, 'cache_hits': 0, 'cache_lookups': 0}
+        status = 'error'
+        try:
+            engine = HashEngine(workers, max_bytes_in_flight, hash_cache=hash_cache, metrics=metrics,
+                                io_mode=io_mode)
+
+            say(f"正在遍历目录: {root_dir} ...")
+            value(5)
+
+            exts = {e.lower() for e in extensions} if extensions else None
+            dir_index = DirectoryIndex(db) if incremental else None
+            with metrics.stage('walk'):
+                all_files = checkpoint.walk(exts, should_stop=should_stop, dir_index=dir_index)
+            if dir_index and dir_index.stats:
+                stats = dir_index.stats
+                # 沿用记录的目录省去一次 scandir，其中的文件各省去一次 stat
+                metrics.add('walk', syscalls_avoided=stats['reused_dirs'] + stats['reused_files'])
+                say(f"增量遍历: 重新读取 {stats['rescanned_dirs']} 个目录，沿用 {stats['reused_dirs']} 个未变化的目录")
+            metrics.add('walk', files=len(all_files))
+            report['total'] = len(all_files)
+            if should_stop and should_stop():
+                status = 'stopped'
+                return None
+
+            # 登记到跨账号内容索引，之后新到的文件不必重新遍历即可查重；
+            # 增量遍历已在遍历时登记了重新读取的目录中的文件，沿用记录的目录无需再写
+            content_index = ContentIndex(db)
+            walked_incrementally = bool(dir_index and dir_index.stats)
+            if not walked_incrementally:
+                with metrics.stage('db_save'):
+                    content_index.update(all_files)
+
+            if not all_files:
+                status = 'done'
+                return report
+
+            say(f"发现 {len(all_files)} 个文件，开始分析...")
+            if mode == 'strict':
+                duplicates = CoreLogic.iter_strict_strategy(
+                    all_files, hash_cache=hash_cache, progress_callback=progress_callback,
+                    value_callback=value_callback, should_stop=should_stop, engine=engine,
+                    metrics=metrics
+                )
+            elif image_deduper:
+                duplicates = image_deduper.iter_duplicates(
+                    all_files, progress_callback=progress_callback, value_callback=value_callback,
+                    should_stop=should_stop
+                )
+            else:
+                value(30)
+                duplicates = CoreLogic.iter_mixed_strategy(
+                    all_files, progress_callback=progress_callback, hash_cache=hash_cache,
+                    engine=engine, should_stop=should_stop, metrics=metrics
+                )
+
+            # 结果边产出边分批落盘，不在内存中堆积
+            count, size = metrics.consume('db_save', duplicates, sink)
+            report['dup_count'], report['dup_size'] = prev_count + count, prev_size + size
+            if should_stop and should_stop():
+                status = 'stopped'
+                return None
+
+            hash_cache.flush()
+            hash_cache.evict_missing(all_files)
+            # 增量遍历时已删除文件的索引记录在查询时 (ContentIndex._resolve) 才剔除，不逐个检查
+            if not walked_incrementally:
+                content_index.evict_missing(root_dir, all_files)
+            if image_deduper: image_deduper.evict_missing(root_dir, all_files)
+            value(100)
+            status = 'done'
+            return report
+        finally:
+            # 中途停止或出错时也保留已计算的哈希
+            hash_cache.flush()
+            if status == 'done':
+                checkpoint.finish()
+            report['cache_hits'] = hash_cache.hits
+            report['cache_lookups'] = hash_cache.hits + hash_cache.misses
+            report['metrics'] = metrics.as_dict()
+            report['run_id'] = db.save_scan_run(root_dir, mode, status, report, report['metrics'])
+
+    @staticmethod
+    def move_files(file_list, target_base_dir, operation_name="cleanup", db=None,
+                   workers=DEFAULT_MOVE_WORKERS, progress_callback=None):
+        """
+        迁移文件到隔离目录，返回 (存放目录, 迁移数, 字节数)。
+        db 为空时，迁移日志保存在 target_base_dir/wechat_move_journal.db 中，可用于继续或撤销。
+        迁移耗时作为 move 阶段写入同一个 db 的 scan_runs 表
+        """
+        from db_manager import DatabaseManager
+        from file_ops import MoveEngine
+        os.makedirs(target_base_dir, exist_ok=True)
+        if db is None:
+            db = DatabaseManager(os.path.join(target_base_dir, MOVE_JOURNAL_DB))
+        engine = MoveEngine(db, workers=workers, progress_callback=progress_callback)
+        metrics = ScanMetrics()
+        with metrics.stage('move'):
+            dest_root, count, size = engine.move(file_list, target_base_dir, operation_name)
+        metrics.add('move', files=count)
+        db.save_scan_run(dest_root, f"move:{operation_name}", 'done',
+                         {'total': len(file_list), 'dup_count': count, 'dup_size': size}, metrics.as_dict())
+        return dest_root, count, size
+
+    @staticmethod
+    def archive_files(file_list, target_base_dir, operation_name="archive", db=None, workers=DEFAULT_MOVE_WORKERS,
+                      compression='deflate', volume_size=None, progress_callback=None):
+        """
+        打包模式的迁移: 文件写入分卷 ZIP 并删除源文件 (见 archiver.ArchiveWriter)，
+        归档目录中的 archive_manifest.db 可用于单个文件还原。
+        返回 (归档目录, 归档数, 原始字节数, 卷总大小, [(路径, 错误), ...])；db 不为空时耗时写入 scan_runs 表
+        """
+        from archiver import ArchiveWriter, ARCHIVE_VOLUME_SIZE
+        os.makedirs(target_base_dir, exist_ok=True)
+        writer = ArchiveWriter(workers=workers, compression=compression,
+                               volume_size=volume_size or ARCHIVE_VOLUME_SIZE, progress_callback=progress_callback)
+        metrics = ScanMetrics()
+        with metrics.stage('archive'):
+            dest_root, count, raw, stored, errors = writer.archive(file_list, target_base_dir, operation_name)
+        metrics.add('archive', files=count, bytes_read=raw)
+        if db is not None:
+            db.save_scan_run(dest_root, f"archive:{operation_name}", 'done',
+                             {'total': len(file_list), 'dup_count': count, 'dup_size': raw}, metrics.as_dict())
+        return dest_root, count, raw, stored, errors
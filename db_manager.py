@@ -1,15 +1,45 @@
 import sqlite3
 import os
+import json
+import time
 import threading
+from itertools import islice
+
+from core import ContentIndex
+
+RESULT_BATCH_SIZE = 5000
+RESULT_PAGE_SIZE = 10000
+# 结果表允许排序的列，防止拼接任意 SQL
+RESULT_SORT_COLUMNS = ('id', 'filepath', 'original_path', 'size', 'reason', 'group_id', 'ext', 'included')
+# 汇总报表的维度: 后缀 / 微信号 / 原因类别 / 修改时间
+REPORT_DIMENSIONS = ('kind', 'ext', 'account', 'age')
+# 按修改时间分段的上限 (天)，更早的归入 '730+'
+AGE_BUCKET_DAYS = (30, 90, 180, 365, 730)
+
 
 class DatabaseManager:
     def __init__(self, db_path='wechat_files.db'):
         self.db_path = db_path
         self.lock = threading.Lock()
+        self.conn = None
         self._init_db()
 
     def _get_conn(self):
-        return sqlite3.connect(self.db_path, check_same_thread=False)
+        # 整个生命周期复用同一个连接，跨线程访问由 self.lock 串行化
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('PRAGMA temp_store=MEMORY')
+            self.conn.execute('PRAGMA cache_size=-65536')
+            self.conn.execute('PRAGMA mmap_size=268435456')
+        return self.conn
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
 
     def _init_db(self):
         with self.lock:
@@ -19,40 +49,859 @@ class DatabaseManager:
             CREATE TABLE IF NOT EXISTS scan_results (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 filepath TEXT,
-                original_path TEXT, 
+                original_path TEXT,
+                size INTEGER,
+                reason TEXT,
+                group_id TEXT,
+                ext TEXT,
+                included INTEGER NOT NULL DEFAULT 1,
+                account TEXT,
+                kind TEXT,
+                mtime_ns INTEGER
+            )
+            ''')
+            self._migrate_results(conn)
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_group ON scan_results (group_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_size ON scan_results (size)')
+            # 单列索引隐含 rowid，ORDER BY col, id 可以直接按索引顺序分页
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_ext ON scan_results (ext)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_included ON scan_results (included)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_reason ON scan_results (reason)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_filepath ON scan_results (filepath)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_original ON scan_results (original_path)')
+            # 汇报用的覆盖索引: GROUP BY 只扫描索引，不回表
+            for dim, column in (('ext', 'ext'), ('account', 'account'), ('kind', 'kind'), ('age', 'mtime_ns')):
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_report_{dim} ON scan_results ({column}, included, size)')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS file_fingerprints (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                sample_hash TEXT,
+                full_hash TEXT
+            )
+            ''')
+            # 跨账号内容索引: 记录所有扫描过的文件，full_hash 在首次需要时才计算
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS content_index (
+                path TEXT PRIMARY KEY,
                 size INTEGER,
-                reason TEXT, 
-                group_id TEXT
+                mtime_ns INTEGER,
+                account TEXT,
+                full_hash TEXT
+            )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_content_hash ON content_index (size, full_hash)')
+            # 相似图片模式的感知哈希缓存，phash 为 16 位十六进制，无法解码的图片为 NULL
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS image_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                phash TEXT,
+                width INTEGER,
+                height INTEGER
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS move_runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                operation TEXT,
+                dest_root TEXT,
+                created_at TEXT,
+                status TEXT
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS move_journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id INTEGER,
+                src TEXT,
+                dest TEXT,
+                size INTEGER,
+                status TEXT,
+                error TEXT
+            )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_journal_run ON move_journal (run_id, status)')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                root TEXT,
+                mode TEXT,
+                status TEXT,
+                started_at REAL,
+                elapsed REAL,
+                total_files INTEGER,
+                dup_count INTEGER,
+                dup_size INTEGER,
+                cache_hits INTEGER,
+                cache_lookups INTEGER,
+                peak_rss_kb INTEGER
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_stages (
+                run_id INTEGER,
+                stage TEXT,
+                seconds REAL,
+                files INTEGER,
+                bytes_read INTEGER,
+                cache_hits INTEGER,
+                syscalls_avoided INTEGER,
+                peak_rss_kb INTEGER
+            )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stages_run ON scan_stages (run_id)')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_checkpoints (
+                scan_key TEXT PRIMARY KEY,
+                root TEXT,
+                mode TEXT,
+                extensions TEXT,
+                phase TEXT,
+                frontier TEXT,
+                owns_results INTEGER,
+                updated_at REAL
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_checkpoint_files (
+                scan_key TEXT,
+                path TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                dev INTEGER
+            )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_checkpoint_files ON scan_checkpoint_files (scan_key)')
+            # 增量遍历的目录索引: mtime_ns 为 -1 表示下次必须重新读取该目录
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS dir_index (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime_ns INTEGER,
+                child_count INTEGER,
+                updated_at REAL
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS dir_files (
+                dir TEXT,
+                name TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                dev INTEGER,
+                PRIMARY KEY (dir, name)
             )
             ''')
             conn.commit()
-            conn.close()
+
+    @staticmethod
+    def _migrate_results(conn):
+        # 旧版本数据库的 scan_results 没有 ext / included / account / kind / mtime_ns 列
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(scan_results)')}
+        if 'ext' not in columns:
+            conn.execute('ALTER TABLE scan_results ADD COLUMN ext TEXT')
+            conn.create_function('file_ext', 1, lambda p: os.path.splitext(p or '')[1].lower())
+            conn.execute('UPDATE scan_results SET ext = file_ext(filepath)')
+        if 'included' not in columns:
+            conn.execute('ALTER TABLE scan_results ADD COLUMN included INTEGER NOT NULL DEFAULT 1')
+        if 'account' not in columns:
+            conn.execute('ALTER TABLE scan_results ADD COLUMN account TEXT')
+            conn.create_function('file_account', 1, lambda p: ContentIndex.account_of(p or ''))
+            conn.execute('UPDATE scan_results SET account = file_account(filepath)')
+        if 'kind' not in columns:
+            conn.execute('ALTER TABLE scan_results ADD COLUMN kind TEXT')
+            conn.execute("UPDATE scan_results SET kind = CASE WHEN instr(reason, ' ') > 0 "
+                         "THEN substr(reason, 1, instr(reason, ' ') - 1) ELSE reason END")
+        if 'mtime_ns' not in columns:
+            # 旧结果没有修改时间，按时间汇总时归入“未知”
+            conn.execute('ALTER TABLE scan_results ADD COLUMN mtime_ns INTEGER')
 
     def clear_results(self):
         with self.lock:
             conn = self._get_conn()
             conn.execute('DELETE FROM scan_results')
             conn.commit()
-            conn.close()
+
+    @staticmethod
+    def _result_row(d):
+        # 扫描阶段已带回文件大小和修改时间，缺失大小时才回退到 stat
+        size = d['size'] if 'size' in d else os.path.getsize(d['file'])
+        return (d['file'], d.get('keep', ''), size, d['reason'], d['group'], os.path.splitext(d['file'])[1].lower(),
+                ContentIndex.account_of(d['file']), d['reason'].split(' ', 1)[0], d.get('mtime_ns'))
+
+    def insert_results(self, duplicates, batch_size=RESULT_BATCH_SIZE):
+        """
+        分批写入扫描结果，duplicates 可以是生成器，扫描过程中即可边产出边落盘。
+        返回 (写入条数, 总字节数)
+        """
+        count = 0
+        total_size = 0
+        it = iter(duplicates)
+        while True:
+            # 从生成器取数据时不持有锁，生成器内部可能还要访问数据库
+            batch = []
+            for d in islice(it, batch_size):
+                try:
+                    batch.append(self._result_row(d))
+                except OSError:
+                    continue
+            if not batch: break
+            with self.lock:
+                conn = self._get_conn()
+                conn.executemany(
+                    'INSERT INTO scan_results (filepath, original_path, size, reason, group_id, ext, '
+                    'account, kind, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    batch
+                )
+                conn.commit()
+            count += len(batch)
+            total_size += sum(row[2] for row in batch)
+        return count, total_size
+
+    def get_result_paths(self):
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT filepath FROM scan_results')
+            return {r[0] for r in cursor.fetchall()}
+
+    def get_result_summary(self):
+        """返回 (结果条数, 总字节数)"""
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM scan_results')
+            return cursor.fetchone()
 
     def save_duplicates(self, duplicates_list):
+        self.insert_results(duplicates_list)
+
+    def get_results(self):
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT filepath, original_path, size, reason FROM scan_results')
+            return cursor.fetchall()
+
+    def get_results_page(self, after_id=0, limit=RESULT_PAGE_SIZE, included_only=False):
+        """按主键游标分页: 返回 id > after_id 的下一页 (id, filepath, original_path, size, reason)"""
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute(
+                'SELECT id, filepath, original_path, size, reason FROM scan_results '
+                f'WHERE id > ? {"AND included = 1 " if included_only else ""}ORDER BY id LIMIT ?', (after_id, limit)
+            )
+            return cursor.fetchall()
+
+    def iter_results(self, page_size=RESULT_PAGE_SIZE, included_only=False):
+        """逐页读取 get_results 的内容，内存占用与结果总数无关; included_only 时跳过被用户排除的行"""
+        last_id = 0
+        while True:
+            page = self.get_results_page(last_id, page_size, included_only)
+            if not page: return
+            for row in page:
+                yield row[1:]
+            last_id = page[-1][0]
+
+    # ---- 结果浏览: 筛选 / 排序 / 包含标记都在 SQL 中完成 ----
+    # filters: {'ext': '.pdf', 'reason': 前缀 (如 'fuzzy_ver'), 'group': group_id,
+    #           'min_size': 字节, 'max_size': 字节, 'included': True/False}
+
+    @staticmethod
+    def _result_where(filters):
+        clauses, params = [], []
+        filters = filters or {}
+        if filters.get('ext') is not None:
+            clauses.append('ext = ?')
+            params.append(filters['ext'])
+        if filters.get('reason'):
+            # 前缀区间查询可以走 reason 索引 (LIKE 默认不区分大小写，用不上索引)
+            prefix = filters['reason']
+            clauses.append('reason >= ? AND reason < ?')
+            params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+        if filters.get('group'):
+            clauses.append('group_id = ?')
+            params.append(filters['group'])
+        if filters.get('min_size') is not None:
+            clauses.append('size >= ?')
+            params.append(filters['min_size'])
+        if filters.get('max_size') is not None:
+            clauses.append('size <= ?')
+            params.append(filters['max_size'])
+        if filters.get('included') is not None:
+            clauses.append('included = ?')
+            params.append(int(filters['included']))
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def count_results(self, filters=None):
+        """返回符合筛选条件的 (条数, 总字节数, 包含条数, 包含字节数)"""
+        where, params = self._result_where(filters)
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(included), 0), '
+                f'COALESCE(SUM(size * included), 0) FROM scan_results{where}', params
+            )
+            return cursor.fetchone()
+
+    def get_results_window(self, filters=None, order_by='id', descending=False, offset=0, limit=256,
+                           after=None, before=None, from_end=False):
+        """
+        按筛选和排序取一段结果，供表格视图按需分页读取
+        返回 [(id, filepath, original_path, size, reason, group_id, ext, included), ...]
+        after / before: 键集分页的锚点 (排序列的值, id)，取紧接在该行之后 / 之前的 limit 行，
+                        沿排序索引直接定位，不必像 OFFSET 那样先扫过前面的全部行
+        from_end      : 没有锚点时 offset 从末尾倒数，跳到靠后的位置时只需扫过后面的行
+        """
+        if order_by not in RESULT_SORT_COLUMNS:
+            raise ValueError(f"不支持的排序列: {order_by}")
+        where, params = self._result_where(filters)
+        anchor = after if after is not None else before
+        # 从后往前取时反向排序，取出后再翻转回来
+        backward = before is not None or (anchor is None and from_end)
+        desc = descending != backward
+        direction = 'DESC' if desc else 'ASC'
+        if anchor is not None:
+            op = '<' if desc else '>'
+            if order_by == 'id':
+                clause, values = f'id {op} ?', [anchor[1]]
+            else:
+                clause, values = f'({order_by}, id) {op} (?, ?)', list(anchor)
+            where = f'{where} AND {clause}' if where else f' WHERE {clause}'
+            params = params + values
+            offset = 0
+        order = 'id' if order_by == 'id' else f'{order_by} {direction}, id'
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute(
+                'SELECT id, filepath, original_path, size, reason, group_id, ext, included FROM scan_results'
+                f'{where} ORDER BY {order} {direction} LIMIT ? OFFSET ?',
+                params + [limit, offset]
+            )
+            rows = cursor.fetchall()
+        if backward: rows.reverse()
+        return rows
+
+    def get_result_extensions(self):
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT DISTINCT ext FROM scan_results ORDER BY ext')
+            return [r[0] for r in cursor.fetchall()]
+
+    def set_included(self, ids, included):
+        """按主键设置包含/排除标记"""
+        if not ids: return
+        with self.lock:
+            conn = self._get_conn()
+            conn.executemany('UPDATE scan_results SET included = ? WHERE id = ?', [(int(included), i) for i in ids])
+            conn.commit()
+
+    def set_included_where(self, filters, included):
+        """把符合筛选条件的全部结果设为包含/排除，返回受影响的行数"""
+        where, params = self._result_where(filters)
+        with self.lock:
+            conn = self._get_conn()
+            cursor = conn.execute(f'UPDATE scan_results SET included = ?{where}', [int(included)] + params)
+            conn.commit()
+            return cursor.rowcount
+
+    @staticmethod
+    def _prefix_range(root_dir):
+        # 路径前缀区间查询，可以走主键索引: [root/, root0)
+        prefix = os.path.join(os.path.normpath(root_dir), '')
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def load_fingerprints(self, root_dir):
+        """
+        读取 root_dir 下所有文件的指纹缓存: {path: (size, mtime_ns, inode, sample_hash, full_hash)}
+        """
+        low, high = self._prefix_range(root_dir)
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute(
+                'SELECT path, size, mtime_ns, inode, sample_hash, full_hash FROM file_fingerprints '
+                'WHERE path >= ? AND path < ?', (low, high)
+            )
+            return {r[0]: tuple(r[1:]) for r in cursor.fetchall()}
+
+    def get_fingerprints(self, paths, batch_size=500):
+        """按路径批量读取指纹: {path: (size, mtime_ns, inode, sample_hash, full_hash)}，不存在的路径不返回"""
+        found = {}
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            for i in range(0, len(paths), batch_size):
+                batch = paths[i:i + batch_size]
+                cursor.execute(
+                    f'SELECT path, size, mtime_ns, inode, sample_hash, full_hash FROM file_fingerprints '
+                    f'WHERE path IN ({",".join("?" * len(batch))})', batch
+                )
+                found.update((r[0], tuple(r[1:])) for r in cursor.fetchall())
+        return found
+
+    def _iter_paths(self, table, root_dir, page_size):
+        """逐页产出 table 中 root_dir 下的路径 (按路径游标分页)，table 只能是内部表名"""
+        low, high = self._prefix_range(root_dir)
+        last = None
+        while True:
+            with self.lock:
+                cursor = self._get_conn().cursor()
+                if last is None:
+                    cursor.execute(f'SELECT path FROM {table} WHERE path >= ? AND path < ? '
+                                   'ORDER BY path LIMIT ?', (low, high, page_size))
+                else:
+                    cursor.execute(f'SELECT path FROM {table} WHERE path > ? AND path < ? '
+                                   'ORDER BY path LIMIT ?', (last, high, page_size))
+                page = [r[0] for r in cursor.fetchall()]
+            if not page: return
+            yield from page
+            last = page[-1]
+
+    def iter_fingerprint_paths(self, root_dir, page_size=RESULT_PAGE_SIZE):
+        """逐页产出 root_dir 下缓存过的路径"""
+        return self._iter_paths('file_fingerprints', root_dir, page_size)
+
+    def save_fingerprints(self, rows):
+        """
+        rows: [(path, size, mtime_ns, inode, sample_hash, full_hash), ...]
+        算出的全量哈希同时补进 content_index 中大小和修改时间一致的记录
+        """
+        if not rows: return
         with self.lock:
             conn = self._get_conn()
-            data = [
-                (d['file'], d.get('keep', ''), os.path.getsize(d['file']), d['reason'], d['group'])
-                for d in duplicates_list if os.path.exists(d['file'])
-            ]
             conn.executemany(
-                'INSERT INTO scan_results (filepath, original_path, size, reason, group_id) VALUES (?, ?, ?, ?, ?)',
-                data
+                'INSERT OR REPLACE INTO file_fingerprints '
+                '(path, size, mtime_ns, inode, sample_hash, full_hash) VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            conn.executemany(
+                'UPDATE content_index SET full_hash = ? WHERE path = ? AND size = ? AND mtime_ns = ?',
+                [(r[5], r[0], r[1], r[2]) for r in rows if r[5]]
             )
             conn.commit()
-            conn.close()
 
-    def get_results(self):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute('SELECT filepath, original_path, size, reason FROM scan_results')
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
\ No newline at end of file
+    def evict_fingerprints(self, paths):
+        if not paths: return
+        with self.lock:
+            conn = self._get_conn()
+            conn.executemany('DELETE FROM file_fingerprints WHERE path = ?', [(p,) for p in paths])
+            conn.commit()
+
+    # ---- 图片感知哈希缓存 ----
+
+    def get_image_hashes(self, paths, batch_size=500):
+        """按路径批量读取: {path: (size, mtime_ns, phash, width, height)}"""
+        found = {}
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            for i in range(0, len(paths), batch_size):
+                batch = paths[i:i + batch_size]
+                cursor.execute(
+                    f'SELECT path, size, mtime_ns, phash, width, height FROM image_hashes '
+                    f'WHERE path IN ({",".join("?" * len(batch))})', batch
+                )
+                found.update((r[0], tuple(r[1:])) for r in cursor.fetchall())
+        return found
+
+    def save_image_hashes(self, rows):
+        """rows: [(path, size, mtime_ns, phash, width, height), ...]"""
+        if not rows: return
+        with self.lock:
+            conn = self._get_conn()
+            conn.executemany(
+                'INSERT OR REPLACE INTO image_hashes (path, size, mtime_ns, phash, width, height) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows
+            )
+            conn.commit()
+
+    def iter_image_hash_paths(self, root_dir, page_size=RESULT_PAGE_SIZE):
+        return self._iter_paths('image_hashes', root_dir, page_size)
+
+    def evict_image_hashes(self, paths):
+        if not paths: return
+        with self.lock:
+            conn = self._get_conn()
+            conn.executemany('DELETE FROM image_hashes WHERE path = ?', [(p,) for p in paths])
+            conn.commit()
+
+    # ---- 跨账号内容索引 (content index) ----
+
+    def update_content_index(self, rows, batch_size=RESULT_BATCH_SIZE):
+        """
+        增量写入 rows: 可迭代的 (path, size, mtime_ns, account)。
+        未变化的记录不改写；大小或修改时间变化时清空旧的 full_hash。返回处理条数
+        """
+        count = 0
+        it = iter(rows)
+        while True:
+            batch = list(islice(it, batch_size))
+            if not batch: break
+            with self.lock:
+                conn = self._get_conn()
+                conn.executemany(
+                    'INSERT INTO content_index (path, size, mtime_ns, account) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, '
+                    'account = excluded.account, full_hash = NULL '
+                    'WHERE size != excluded.size OR mtime_ns != excluded.mtime_ns',
+                    batch
+                )
+                conn.commit()
+            count += len(batch)
+        return count
+
+    def lookup_content(self, size, full_hash=None):
+        """
+        按大小 (及全量哈希) 走索引查找: [(path, mtime_ns, account, full_hash), ...]
+        full_hash 为 None 时返回该大小的全部记录，包括尚未计算哈希的
+        """
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            if full_hash is None:
+                cursor.execute('SELECT path, mtime_ns, account, full_hash FROM content_index WHERE size = ?',
+                               (size,))
+            else:
+                cursor.execute('SELECT path, mtime_ns, account, full_hash FROM content_index '
+                               'WHERE size = ? AND full_hash = ?', (size, full_hash))
+            return cursor.fetchall()
+
+    def set_content_hashes(self, rows):
+        """rows: [(full_hash, path, size, mtime_ns), ...]，只更新大小和修改时间仍一致的记录"""
+        if not rows: return
+        with self.lock:
+            conn = self._get_conn()
+            conn.executemany(
+                'UPDATE content_index SET full_hash = ? WHERE path = ? AND size = ? AND mtime_ns = ?', rows
+            )
+            conn.commit()
+
+    def iter_content_paths(self, root_dir, page_size=RESULT_PAGE_SIZE):
+        """逐页产出内容索引中 root_dir 下的路径"""
+        return self._iter_paths('content_index', root_dir, page_size)
+
+    def evict_content(self, paths):
+        if not paths: return
+        with self.lock:
+            conn = self._get_conn()
+            conn.executemany('DELETE FROM content_index WHERE path = ?', [(p,) for p in paths])
+            conn.commit()
+
+    def get_shared_sizes(self, min_size=1):
+        """在多个账号中都出现过的文件大小 (从大到小)，跨账号重复只可能出现在这些大小中"""
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT size FROM content_index WHERE size >= ? GROUP BY size '
+                           'HAVING COUNT(DISTINCT account) > 1 ORDER BY size DESC', (min_size,))
+            return [r[0] for r in cursor.fetchall()]
+
+    def get_content_index_summary(self):
+        """[(account, 文件数, 总字节数, 已计算哈希数), ...]"""
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT account, COUNT(*), COALESCE(SUM(size), 0), COUNT(full_hash) '
+                           'FROM content_index GROUP BY account ORDER BY account')
+            return cursor.fetchall()
+
+    # ---- 迁移日志 (move journal) ----
+    # move_runs.status   : running / done / undone
+    # move_journal.status: pending / done / failed / undone
+
+    def create_move_run(self, operation, dest_root, created_at, moves, batch_size=RESULT_BATCH_SIZE):
+        """先把整批迁移计划以 pending 状态写入日志，再开始动文件。moves: [(src, dest), ...]"""
+        with self.lock:
+            conn = self._get_conn()
+            cursor = conn.cursor()
+            cursor.execute('INSERT INTO move_runs (operation, dest_root, created_at, status) VALUES (?, ?, ?, ?)',
+                           (operation, dest_root, created_at, 'running'))
+            run_id = cursor.lastrowid
+            for i in range(0, len(moves), batch_size):
+                conn.executemany(
+                    "INSERT INTO move_journal (run_id, src, dest, status) VALUES (?, ?, ?, 'pending')",
+                    [(run_id, src, dest) for src, dest in moves[i:i + batch_size]]
+                )
+            conn.commit()
+            return run_id
+
+    def get_move_entries(self, run_id, statuses):
+        """返回 [(id, src, dest, size), ...]"""
+        marks = ','.join('?' * len(statuses))
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute(
+                f'SELECT id, src, dest, size FROM move_journal WHERE run_id = ? AND status IN ({marks}) ORDER BY id',
+                (run_id, *statuses)
+            )
+            return cursor.fetchall()
+
+    def update_move_entries(self, updates):
+        """updates: [(status, size, error, id), ...]"""
+        if not updates: return
+        with self.lock:
+            conn = self._get_conn()
+            conn.executemany('UPDATE move_journal SET status = ?, size = ?, error = ? WHERE id = ?', updates)
+            conn.commit()
+
+    def set_move_run_status(self, run_id, status):
+        with self.lock:
+            conn = self._get_conn()
+            conn.execute('UPDATE move_runs SET status = ? WHERE run_id = ?', (status, run_id))
+            conn.commit()
+
+    def get_move_runs(self, status=None):
+        """返回 [(run_id, operation, dest_root, created_at, status), ...]，最新的在前"""
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            if status:
+                cursor.execute('SELECT run_id, operation, dest_root, created_at, status FROM move_runs '
+                               'WHERE status = ? ORDER BY run_id DESC', (status,))
+            else:
+                cursor.execute('SELECT run_id, operation, dest_root, created_at, status FROM move_runs '
+                               'ORDER BY run_id DESC')
+            return cursor.fetchall()
+
+    def iter_exact_groups(self, reasons=('strict_md5', 'small_file_strict')):
+        """按 group_id 逐组产出内容完全一致且未被排除的结果: (group_id, [(filepath, original_path, size), ...])"""
+        marks = ','.join('?' * len(reasons))
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute(
+                f'SELECT group_id, filepath, original_path, size FROM scan_results '
+                f'WHERE reason IN ({marks}) AND included = 1 ORDER BY group_id, id', reasons
+            )
+            rows = cursor.fetchall()
+        group_id, members = None, []
+        for gid, filepath, original_path, size in rows:
+            if gid != group_id and members:
+                yield group_id, members
+                members = []
+            group_id = gid
+            members.append((filepath, original_path, size))
+        if members:
+            yield group_id, members
+
+    def get_result_breakdown(self, dimension, now=None):
+        """
+        按维度汇总 scan_results: [(key, 条数, 字节数, 包含条数, 包含字节数), ...]
+        dimension: kind / ext / account 按可清理字节数降序；age 的 key 为 '0-30'、'30-90' … '730+' (天)，
+        没有修改时间的旧结果为 None，按时间段顺序排列。
+        只扫描 (列, included, size) 覆盖索引，不读取表行，也不访问磁盘上的文件
+        """
+        params = []
+        if dimension == 'age':
+            now_ns = int((now if now is not None else time.time()) * 1e9)
+            cases, low = [], 0
+            for days in AGE_BUCKET_DAYS:
+                cases.append('WHEN mtime_ns >= ? THEN ?')
+                params += [now_ns - days * 86400 * 10 ** 9, f"{low}-{days}"]
+                low = days
+            key = f"CASE WHEN mtime_ns IS NULL THEN NULL {' '.join(cases)} ELSE '{low}+' END"
+        elif dimension in REPORT_DIMENSIONS:
+            key = dimension
+        else:
+            raise ValueError(f"未知的汇总维度: {dimension}")
+
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute(f'SELECT {key} AS k, included, COUNT(*), COALESCE(SUM(size), 0) '
+                           f'FROM scan_results GROUP BY k, included', params)
+            rows = cursor.fetchall()
+
+        merged = {}
+        for k, included, count, size in rows:
+            entry = merged.setdefault(k, [k, 0, 0, 0, 0])
+            entry[1] += count
+            entry[2] += size
+            if included:
+                entry[3] += count
+                entry[4] += size
+        result = [tuple(e) for e in merged.values()]
+        if dimension == 'age':
+            order = [f"{lo}-{hi}" for lo, hi in zip((0,) + AGE_BUCKET_DAYS, AGE_BUCKET_DAYS)]
+            order += [f"{AGE_BUCKET_DAYS[-1]}+", None]
+            result.sort(key=lambda e: order.index(e[0]))
+        else:
+            result.sort(key=lambda e: (-e[4], -e[2]))
+        return result
+
+    def get_result_report(self, now=None):
+        """全部维度的汇总: {dimension: get_result_breakdown(dimension)}"""
+        return {dim: self.get_result_breakdown(dim, now) for dim in REPORT_DIMENSIONS}
+
+    def delete_results(self, filepaths):
+        if not filepaths: return
+        with self.lock:
+            conn = self._get_conn()
+            conn.executemany('DELETE FROM scan_results WHERE filepath = ?', [(p,) for p in filepaths])
+            conn.commit()
+
+    # ---- 扫描统计 (scan telemetry) ----
+    # scan_runs.status: done / stopped / error
+
+    def save_scan_run(self, root, mode, status, report, metrics):
+        """保存一次扫描的汇总与分阶段统计 (ScanMetrics.as_dict() 的结果)，返回 run_id"""
+        with self.lock:
+            conn = self._get_conn()
+            cursor = conn.cursor()
+            cursor.execute(
+                'INSERT INTO scan_runs (root, mode, status, started_at, elapsed, total_files, dup_count, '
+                'dup_size, cache_hits, cache_lookups, peak_rss_kb) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (root, mode, status, metrics['started_at'], metrics['elapsed'], report.get('total', 0),
+                 report.get('dup_count', 0), report.get('dup_size', 0), report.get('cache_hits', 0),
+                 report.get('cache_lookups', 0), metrics['peak_rss_kb'])
+            )
+            run_id = cursor.lastrowid
+            conn.executemany(
+                'INSERT INTO scan_stages (run_id, stage, seconds, files, bytes_read, cache_hits, '
+                'syscalls_avoided, peak_rss_kb) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, st['stage'], st['seconds'], st['files'], st['bytes_read'], st['cache_hits'],
+                  st['syscalls_avoided'], st['peak_rss_kb']) for st in metrics['stages']]
+            )
+            conn.commit()
+            return run_id
+
+    def get_scan_runs(self, limit=20):
+        """返回 [(run_id, root, mode, status, started_at, elapsed, total_files, dup_count, dup_size), ...]，最新的在前"""
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT run_id, root, mode, status, started_at, elapsed, total_files, dup_count, dup_size '
+                           'FROM scan_runs ORDER BY run_id DESC LIMIT ?', (limit,))
+            return cursor.fetchall()
+
+    def get_scan_stages(self, run_id):
+        """返回 [(stage, seconds, files, bytes_read, cache_hits, syscalls_avoided, peak_rss_kb), ...]"""
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT stage, seconds, files, bytes_read, cache_hits, syscalls_avoided, peak_rss_kb '
+                           'FROM scan_stages WHERE run_id = ? ORDER BY rowid', (run_id,))
+            return cursor.fetchall()
+
+    # ---- 扫描断点 (scan checkpoint) ----
+    # scan_checkpoints.phase: walk (遍历未完成，frontier 为待遍历目录栈) / hash (遍历已完成)
+
+    def save_checkpoint(self, scan_key, root, mode, extensions, phase, frontier, new_records, owns_results,
+                        batch_size=RESULT_BATCH_SIZE):
+        """更新断点状态并追加新遍历到的文件 (FileRecord)，两者在同一事务中提交"""
+        with self.lock:
+            conn = self._get_conn()
+            conn.execute(
+                'INSERT OR REPLACE INTO scan_checkpoints '
+                '(scan_key, root, mode, extensions, phase, frontier, owns_results, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (scan_key, root, mode, extensions, phase, json.dumps(frontier, ensure_ascii=False),
+                 int(owns_results), time.time())
+            )
+            for i in range(0, len(new_records), batch_size):
+                conn.executemany(
+                    'INSERT INTO scan_checkpoint_files (scan_key, path, size, mtime_ns, inode, dev) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    [(scan_key, *rec) for rec in new_records[i:i + batch_size]]
+                )
+            conn.commit()
+
+    def load_checkpoint(self, scan_key):
+        """返回 {phase, frontier, file_count, owns_results, updated_at}，没有断点时返回 None"""
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT phase, frontier, owns_results, updated_at FROM scan_checkpoints '
+                           'WHERE scan_key = ?', (scan_key,))
+            row = cursor.fetchone()
+            if not row: return None
+            cursor.execute('SELECT COUNT(*) FROM scan_checkpoint_files WHERE scan_key = ?', (scan_key,))
+            return {'phase': row[0], 'frontier': json.loads(row[1]), 'owns_results': bool(row[2]),
+                    'updated_at': row[3], 'file_count': cursor.fetchone()[0]}
+
+    def load_checkpoint_files(self, scan_key):
+        """返回 [(path, size, mtime_ns, inode, dev), ...]"""
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT path, size, mtime_ns, inode, dev FROM scan_checkpoint_files '
+                           'WHERE scan_key = ? ORDER BY rowid', (scan_key,))
+            return cursor.fetchall()
+
+    def delete_checkpoint(self, scan_key):
+        with self.lock:
+            conn = self._get_conn()
+            conn.execute('DELETE FROM scan_checkpoints WHERE scan_key = ?', (scan_key,))
+            conn.execute('DELETE FROM scan_checkpoint_files WHERE scan_key = ?', (scan_key,))
+            conn.commit()
+
+    def disown_checkpoints(self):
+        """scan_results 被清空后，其他断点保存的部分结果已不存在，续扫时需要重新写入"""
+        with self.lock:
+            conn = self._get_conn()
+            conn.execute('UPDATE scan_checkpoints SET owns_results = 0')
+            conn.commit()
+
+    # ---- 目录索引 (dir index) ----
+
+    def load_dir_index(self, root_dir):
+        """读取 root_dir 及其下所有目录的记录: {path: (parent, mtime_ns, child_count)}"""
+        root_dir = os.path.normpath(root_dir)
+        low, high = self._prefix_range(root_dir)
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT path, parent, mtime_ns, child_count FROM dir_index '
+                           'WHERE path = ? OR (path >= ? AND path < ?)', (root_dir, low, high))
+            return {r[0]: tuple(r[1:]) for r in cursor.fetchall()}
+
+    def get_dir_files(self, dir_path):
+        """返回 {name: (size, mtime_ns, inode, dev)}"""
+        with self.lock:
+            cursor = self._get_conn().cursor()
+            cursor.execute('SELECT name, size, mtime_ns, inode, dev FROM dir_files WHERE dir = ?', (dir_path,))
+            return {r[0]: tuple(r[1:]) for r in cursor.fetchall()}
+
+    def iter_dir_files(self, root_dir, page_size=RESULT_PAGE_SIZE):
+        """逐页产出 root_dir 及其子目录下记录的文件: (dir, name, size, mtime_ns, inode, dev)，按 (dir, name) 游标分页"""
+        root_dir = os.path.normpath(root_dir)
+        yield from ((root_dir, name, *row) for name, row in sorted(self.get_dir_files(root_dir).items()))
+        low, high = self._prefix_range(root_dir)
+        last = (low, '')
+        while True:
+            with self.lock:
+                cursor = self._get_conn().cursor()
+                cursor.execute('SELECT dir, name, size, mtime_ns, inode, dev FROM dir_files '
+                               'WHERE (dir, name) > (?, ?) AND dir < ? ORDER BY dir, name LIMIT ?',
+                               (*last, high, page_size))
+                page = cursor.fetchall()
+            if not page: return
+            yield from page
+            last = page[-1][:2]
+
+    def save_dir_index(self, dir_rows, file_rows, stale_dirs=(), batch_size=RESULT_BATCH_SIZE):
+        """
+        在同一事务中更新目录索引:
+        dir_rows  : 重新读取过的目录 [(path, parent, mtime_ns, child_count), ...]，其文件记录整体替换为 file_rows 中的
+        file_rows : [(dir, name, size, mtime_ns, inode, dev), ...]
+        stale_dirs: 已不存在的目录，连同其文件记录一起删除
+        """
+        now = time.time()
+        with self.lock:
+            conn = self._get_conn()
+            for dirs in (list(stale_dirs), [row[0] for row in dir_rows]):
+                for i in range(0, len(dirs), batch_size):
+                    batch = [(d,) for d in dirs[i:i + batch_size]]
+                    conn.executemany('DELETE FROM dir_files WHERE dir = ?', batch)
+            stale = list(stale_dirs)
+            for i in range(0, len(stale), batch_size):
+                conn.executemany('DELETE FROM dir_index WHERE path = ?', [(d,) for d in stale[i:i + batch_size]])
+            for i in range(0, len(dir_rows), batch_size):
+                conn.executemany(
+                    'INSERT OR REPLACE INTO dir_index (path, parent, mtime_ns, child_count, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?)', [(*row, now) for row in dir_rows[i:i + batch_size]]
+                )
+            for i in range(0, len(file_rows), batch_size):
+                conn.executemany('INSERT OR REPLACE INTO dir_files (dir, name, size, mtime_ns, inode, dev) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)', file_rows[i:i + batch_size])
+            conn.commit()
+
+    def clear_dir_index(self, root_dir):
+        """删除 root_dir 下的目录索引，下次增量遍历退化为完整遍历"""
+        root_dir = os.path.normpath(root_dir)
+        low, high = self._prefix_range(root_dir)
+        with self.lock:
+            conn = self._get_conn()
+            conn.execute('DELETE FROM dir_index WHERE path = ? OR (path >= ? AND path < ?)', (root_dir, low, high))
+            conn.execute('DELETE FROM dir_files WHERE dir = ? OR (dir >= ? AND dir < ?)', (root_dir, low, high))
+            conn.commit()
@@ -0,0 +1,260 @@
+"""
+扫描前的可清理空间快速估算: 只遍历元数据 (大小、文件名)，再对按统计方法抽取的少量候选做头尾采样哈希，
+几秒内给出严格模式和混合模式可释放空间的估计值与置信区间，不必等待数小时的完整扫描。
+"""
+import bisect
+import math
+import os
+import random
+import time
+from collections import defaultdict
+from itertools import accumulate
+
+from core import (Utils, CoreLogic, FileTable, SAMPLE_SIZE, HASH_CHUNK_SIZE, SMALL_FILE_LIMIT,
+                  FUZZY_SAFE_EXTS)
+from zip_fingerprint import ZIP_EXTS, ZipFingerprint
+
+ESTIMATE_TIME_BUDGET = 10.0
+ESTIMATE_MIN_DRAWS = 100
+ESTIMATE_MAX_DRAWS = 5000
+# 各模式的置信区间半宽都不超过估计值的该比例时提前结束抽样
+ESTIMATE_TARGET_ERROR = 0.05
+# 同大小文件超过该数量时只哈希其中随机抽取的这么多个
+ESTIMATE_BUCKET_CAP = 64
+ESTIMATE_Z = 1.96
+FUZZY_SIZE_RATIO = 1.3
+
+
+class PPSSampler:
+    """
+    按上界加权的有放回抽样 (Hansen-Hurwitz 估计)。
+    每个抽样单元 (一组候选文件) 的可释放字节数 Y 在 [0, 上界 U] 内；按 U / ΣU 的概率抽取单元，
+    测得比例 r = Y / U，则 ΣU · mean(r) 是总量的无偏估计，方差为 ΣU² · var(r) / m。
+    已测过的单元真实值确定，区间再收紧到 [已确认的字节数, 剩余上界]；全部单元测完时即为精确值
+    units  : [(key, 上界字节数), ...]，上界必须大于 0
+    measure: key -> 该单元实际可释放的字节数
+    """
+
+    def __init__(self, units, measure, rng):
+        self.units = units
+        self.measure = measure
+        self.rng = rng
+        self.total = sum(upper for _, upper in units)
+        self.cumulative = list(accumulate(upper for _, upper in units))
+        self.known = {}
+        self.known_bytes = 0
+        self.known_upper = 0
+        self.ratio_sum = 0.0
+        self.ratio_sq_sum = 0.0
+        self.draws = 0
+
+    def draw(self):
+        idx = min(bisect.bisect_right(self.cumulative, self.rng.random() * self.total), len(self.units) - 1)
+        key, upper = self.units[idx]
+        if idx not in self.known:
+            self.known[idx] = min(max(self.measure(key), 0), upper)
+            self.known_bytes += self.known[idx]
+            self.known_upper += upper
+        r = self.known[idx] / upper
+        self.ratio_sum += r
+        self.ratio_sq_sum += r * r
+        self.draws += 1
+
+    @property
+    def exhausted(self):
+        return len(self.known) == len(self.units)
+
+    def estimate(self):
+        """返回 (估计值, 下界, 上界, 估计方差)"""
+        low = self.known_bytes
+        high = self.total - self.known_upper + self.known_bytes
+        m = self.draws
+        if self.exhausted or high <= low:
+            return low, low, low, 0.0
+        if m < 2:
+            # 样本不足，只能给出确定的上下界
+            return (low + high) / 2, low, high, ((high - low) / (2 * ESTIMATE_Z)) ** 2
+
+        mean = self.ratio_sum / m
+        var = max(0.0, (self.ratio_sq_sum - m * mean * mean) / (m - 1))
+        # 样本比例全部相同时样本方差为 0，按平滑后的比例给方差设下限，区间不会塌缩成一点
+        smoothed = (self.ratio_sum + 0.5) / (m + 1)
+        var = max(var, smoothed * (1 - smoothed) / m)
+        estimate = self.total * mean
+        return min(max(estimate, low), high), low, high, self.total ** 2 * var / m
+
+
+class SpaceEstimator:
+    """
+    估算 root_dir 下严格模式和混合模式分别能释放多少空间:
+    - 严格: 大小相同的文件按大小分组，每组是一个抽样单元，上界为 (n-1)·size；
+      抽中的组对成员做头尾采样哈希 (与完整扫描的第 2 阶段相同)，超过 ESTIMATE_BUCKET_CAP 个成员时
+      按随机子集中的重复比例推算。小文件 (< SMALL_FILE_LIMIT) 和大文件分层抽样
+    - 混合: 小文件部分即严格模式的小文件层；大文件按 (后缀, normalize_filename 规范名) 分组，
+      组内按大小窗口切分并保留最新的一份，与 FuzzyMatcher 的分组方式一致。docx / xlsx / pptx / zip
+      的分组再抽样读取中央目录确认，其余后缀的分组不读文件，结果是确定的。
+      只统计规范名完全相同的版本，名字仅相似的不计入，因此混合模式的估计偏保守
+    抽样在 time_budget 秒内按方差最大的层优先进行，返回 95% 置信区间
+    """
+
+    def __init__(self, time_budget=ESTIMATE_TIME_BUDGET, seed=None, max_draws=ESTIMATE_MAX_DRAWS,
+                 target_error=ESTIMATE_TARGET_ERROR, bucket_cap=ESTIMATE_BUCKET_CAP):
+        self.time_budget = time_budget
+        self.rng = random.Random(seed)
+        self.max_draws = max_draws
+        self.target_error = target_error
+        self.bucket_cap = bucket_cap
+        self.buf = bytearray(HASH_CHUNK_SIZE)
+        self.files_hashed = 0
+        self.bytes_read = 0
+
+    def estimate(self, root_dir, extensions=None, progress_callback=None, should_stop=None):
+        """返回报告 dict；被 should_stop 中止时返回 None"""
+        def say(msg):
+            if progress_callback: progress_callback(msg)
+
+        start = time.perf_counter()
+        root_dir = os.path.abspath(root_dir)
+        exts = {e.lower() for e in extensions} if extensions else None
+        say("遍历文件元数据...")
+        table = FileTable()
+        table.extend(Utils.walk_files(root_dir, exts, should_stop))
+        if should_stop and should_stop(): return None
+        walk_seconds = time.perf_counter() - start
+        say(f"共 {len(table)} 个文件，抽样估算中...")
+
+        small_units, large_units = self._size_units(table)
+        fuzzy_fixed, zip_units = self._name_units(table)
+        strata = {
+            'small': PPSSampler(small_units, lambda b: self._measure_bucket(table, b), self.rng),
+            'large': PPSSampler(large_units, lambda b: self._measure_bucket(table, b), self.rng),
+            'zip': PPSSampler(zip_units, lambda g: self._measure_zip_group(table, g), self.rng),
+        }
+        modes = {'strict': ('small', 'large'), 'fuzzy': ('small', 'zip')}
+
+        deadline = time.perf_counter() + self.time_budget
+        while time.perf_counter() < deadline:
+            if should_stop and should_stop(): return None
+            active = [s for s in strata.values() if not s.exhausted and s.draws < self.max_draws]
+            if not active: break
+            if all(s.draws >= ESTIMATE_MIN_DRAWS for s in active) and all(
+                    self._precise_enough(strata, names, fuzzy_fixed if mode == 'fuzzy' else 0)
+                    for mode, names in modes.items()):
+                break
+            # 样本数不足的层优先，其余按估计方差从大到小
+            sampler = max(active, key=lambda s: (s.draws < ESTIMATE_MIN_DRAWS, s.estimate()[3]))
+            sampler.draw()
+
+        sizes = table.sizes
+        report = {
+            'root': root_dir, 'total_files': len(table), 'total_size': sum(sizes),
+            'files_hashed': self.files_hashed, 'bytes_read': self.bytes_read,
+            'walk_seconds': round(walk_seconds, 3), 'elapsed': round(time.perf_counter() - start, 3),
+            'confidence': 0.95,
+        }
+        for mode, names in modes.items():
+            fixed = fuzzy_fixed if mode == 'fuzzy' else 0
+            est, low, high, _ = self._combine(strata, names, fixed)
+            report[mode] = {
+                'estimate': int(est), 'low': int(low), 'high': int(high),
+                'upper_bound': int(fixed + sum(strata[n].total for n in names)),
+                'units': sum(len(strata[n].units) for n in names),
+                'units_measured': sum(len(strata[n].known) for n in names),
+                'exact': low == high,
+            }
+        return report
+
+    @staticmethod
+    def _combine(strata, names, fixed=0):
+        """各层相互独立，估计值、确定上下界和方差分别相加，再用正态区间并截断到确定上下界内"""
+        est = low = high = float(fixed)
+        var = 0.0
+        for name in names:
+            e, lo, hi, v = strata[name].estimate()
+            est += e
+            low += lo
+            high += hi
+            var += v
+        half = ESTIMATE_Z * math.sqrt(var)
+        return est, max(low, est - half), min(high, est + half), var
+
+    def _precise_enough(self, strata, names, fixed):
+        est, low, high, _ = self._combine(strata, names, fixed)
+        return high - low <= 2 * self.target_error * max(est, 1)
+
+    @staticmethod
+    def _size_units(table):
+        """同大小分组 -> 小文件层和大文件层的抽样单元 (成员下标, 上界)；空文件不占空间，不参与"""
+        sizes = table.sizes
+        candidates = table.same_size()
+        small, large = [], []
+        start = 0
+        for k in range(1, len(candidates) + 1):
+            if k == len(candidates) or sizes[candidates[k]] != sizes[candidates[start]]:
+                size = sizes[candidates[start]]
+                if size > 0:
+                    bucket = candidates[start:k]
+                    (small if size < SMALL_FILE_LIMIT else large).append((bucket, (len(bucket) - 1) * size))
+                start = k
+        return small, large
+
+    @staticmethod
+    def _name_units(table):
+        """
+        混合模式的大文件部分: 返回 (不需读文件的确定字节数, ZIP 类分组的抽样单元)。
+        每个分组按大小升序排列，首个为基准，与 iter_mixed_strategy 一致保留修改时间最新的一份
+        """
+        sizes, mtimes, names = table.sizes, table.mtimes, table.names
+        by_key = defaultdict(list)
+        for i in range(len(table)):
+            if sizes[i] < SMALL_FILE_LIMIT: continue
+            ext = table.ext(i)
+            if ext in FUZZY_SAFE_EXTS:
+                by_key[(ext, CoreLogic.normalize_filename(names[i]))].append(i)
+
+        fixed, zip_units = 0, []
+        for (ext, _), members in by_key.items():
+            if len(members) < 2: continue
+            members.sort(key=sizes.__getitem__)
+            member_sizes = [sizes[i] for i in members]
+            lo = 0
+            while lo < len(members):
+                hi = bisect.bisect_right(member_sizes, member_sizes[lo] * FUZZY_SIZE_RATIO, lo + 1)
+                group = members[lo:hi]
+                lo = hi
+                if len(group) < 2: continue
+                reclaim = sum(sizes[i] for i in group) - sizes[max(group, key=mtimes.__getitem__)]
+                if ext in ZIP_EXTS:
+                    zip_units.append((group, reclaim))
+                else:
+                    fixed += reclaim
+        return fixed, zip_units
+
+    def _measure_bucket(self, table, bucket):
+        """对同大小分组 (或其随机子集) 做头尾采样哈希，按重复比例推算整组可释放的字节数"""
+        size = table.sizes[bucket[0]]
+        members = list(bucket)
+        if len(members) > self.bucket_cap:
+            members = self.rng.sample(members, self.bucket_cap)
+        hashes = set()
+        for i in members:
+            h = Utils.get_file_hash(table.path(i), sample=True, file_size=size, buf=self.buf)
+            # 读取失败的文件按不重复处理
+            hashes.add(h if h else ('unreadable', i))
+        self.files_hashed += len(members)
+        self.bytes_read += len(members) * min(size, 2 * SAMPLE_SIZE)
+        dup_ratio = (len(members) - len(hashes)) / (len(members) - 1)
+        return dup_ratio * (len(bucket) - 1) * size
+
+    def _measure_zip_group(self, table, group):
+        """读取分组成员的中央目录，按 ZipFingerprint.confirm_groups 确认后的分组计算可释放的字节数"""
+        sizes, mtimes = table.sizes, table.mtimes
+        confirmed, _, n_read, n_bytes = ZipFingerprint.confirm_groups(
+            [list(range(len(group)))], lambda k: table.path(group[k]), lambda k: sizes[group[k]])
+        self.files_hashed += n_read
+        self.bytes_read += n_bytes
+        reclaim = 0
+        for sub in confirmed:
+            members = [group[k] for k in sub]
+            reclaim += sum(sizes[i] for i in members) - sizes[max(members, key=mtimes.__getitem__)]
+        return reclaim
@@ -0,0 +1,264 @@
+import os
+import shutil
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+from core import DEFAULT_MOVE_WORKERS
+
+JOURNAL_FLUSH_EVERY = 500
+COMPARE_CHUNK_SIZE = 1024 * 1024
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+
+class MoveEngine:
+    """
+    带日志的文件迁移引擎:
+    - 按目标目录分组，每个目录只创建一次
+    - 源和目标在同一设备上时直接 os.rename
+    - 跨设备复制放到有界线程池中执行 (先写 .part 临时文件，再原子替换，最后删除源文件)
+    - 每个操作都记录在 SQLite 日志 (move_journal) 中，进程崩溃后可以继续或整体撤销
+    """
+
+    def __init__(self, db, workers=DEFAULT_MOVE_WORKERS, progress_callback=None):
+        self.db = db
+        self.workers = max(1, int(workers))
+        self.progress_callback = progress_callback
+
+    @staticmethod
+    def relative_dest(src_path):
+        """保持从 wxid_xxx 或 FileStorage 开始的目录结构，方便还原时直接剪切回去"""
+        rel_path = os.path.basename(src_path)
+        parts = src_path.split(os.sep)
+        for idx, part in enumerate(parts):
+            if part.startswith("wxid_") or part == "FileStorage":
+                rel_path = os.path.join(*parts[idx:])
+                break
+        return rel_path
+
+    def move(self, file_list, target_base_dir, operation_name="cleanup"):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        dest_root = os.path.join(target_base_dir, f"wechat_{operation_name}_{timestamp}")
+        os.makedirs(dest_root, exist_ok=True)
+        moves = [(src, os.path.join(dest_root, self.relative_dest(src))) for src in file_list]
+        run_id = self.db.create_move_run(operation_name, dest_root, timestamp, moves)
+        moved_count, total_size = self._execute(run_id, reverse=False)
+        self._write_log(run_id, dest_root, operation_name, timestamp)
+        return dest_root, moved_count, total_size
+
+    def resume(self, run_id):
+        """继续一个中断的迁移 (含上次失败的条目)，返回 (迁移数, 字节数)"""
+        return self._execute(run_id, reverse=False, statuses=('pending', 'failed'))
+
+    def undo(self, run_id):
+        """把一次迁移中已完成的文件全部移回原处，返回 (还原数, 字节数)"""
+        return self._execute(run_id, reverse=True)
+
+    def _execute(self, run_id, reverse, statuses=None):
+        if statuses is None:
+            statuses = ('done',) if reverse else ('pending',)
+        entries = self.db.get_move_entries(run_id, statuses)
+        if reverse:
+            # 先还原后迁移的文件
+            entries.reverse()
+        ok_status = 'undone' if reverse else 'done'
+
+        # 按目标目录分组
+        by_dir = defaultdict(list)
+        for entry_id, src, dest, size in entries:
+            if reverse:
+                src, dest = dest, src
+            by_dir[os.path.dirname(dest)].append((entry_id, src, dest))
+
+        total = len(entries)
+        done = 0
+        moved_count = 0
+        total_size = 0
+        updates = []
+
+        def record(entry_id, size, error):
+            nonlocal done, moved_count, total_size
+            done += 1
+            if error is None:
+                moved_count += 1
+                total_size += size
+                updates.append((ok_status, size, None, entry_id))
+            else:
+                updates.append(('done' if reverse else 'failed', size, error, entry_id))
+            if len(updates) >= JOURNAL_FLUSH_EVERY:
+                self.db.update_move_entries(updates)
+                updates.clear()
+            if self.progress_callback and (done % 100 == 0 or done == total):
+                self.progress_callback(done, total)
+
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            def drain(block_until):
+                while pending and block_until():
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        entry_id = pending.pop(fut)
+                        try:
+                            record(entry_id, fut.result(), None)
+                        except Exception as e:
+                            record(entry_id, 0, str(e))
+
+            for dest_dir, items in by_dir.items():
+                try:
+                    os.makedirs(dest_dir, exist_ok=True)
+                    dest_dev = os.stat(dest_dir).st_dev
+                except OSError as e:
+                    for entry_id, _, _ in items:
+                        record(entry_id, 0, str(e))
+                    continue
+
+                for entry_id, src, dest in items:
+                    try:
+                        st = os.stat(src)
+                    except OSError as e:
+                        # 上次运行可能已完成复制但未来得及写日志
+                        if os.path.exists(dest):
+                            record(entry_id, os.path.getsize(dest), None)
+                        else:
+                            record(entry_id, 0, str(e))
+                        continue
+
+                    if st.st_dev == dest_dev:
+                        try:
+                            os.rename(src, dest)
+                            record(entry_id, st.st_size, None)
+                        except OSError as e:
+                            record(entry_id, 0, str(e))
+                    else:
+                        drain(lambda: len(pending) >= self.workers * 2)
+                        pending[pool.submit(self._copy_across, src, dest, st.st_size)] = entry_id
+            drain(lambda: True)
+
+        self.db.update_move_entries(updates)
+        # 仍有未完成的条目时保持原状态: 撤销失败的文件留在 'done'，该次迁移仍可再次撤销
+        remaining = self.db.get_move_entries(run_id, ('done',) if reverse else ('pending',))
+        if not remaining:
+            self.db.set_move_run_status(run_id, 'undone' if reverse else 'done')
+        return moved_count, total_size
+
+    @staticmethod
+    def _copy_across(src, dest, size):
+        """跨设备迁移: 复制到临时文件 -> 原子改名 -> 删除源文件"""
+        tmp = dest + '.part'
+        shutil.copy2(src, tmp)
+        if os.path.getsize(tmp) != size:
+            os.remove(tmp)
+            raise IOError(f"复制后大小不一致: {src}")
+        os.replace(tmp, dest)
+        os.remove(src)
+        return size
+
+    def _write_log(self, run_id, dest_root, operation_name, timestamp):
+        # 保留纯文本日志，便于人工查看
+        log_path = os.path.join(dest_root, "move_log.txt")
+        with open(log_path, 'w', encoding='utf-8') as log:
+            log.write(f"Operation: {operation_name}\nTime: {timestamp}\nRun: {run_id}\n\n")
+            for _, src, dest, _ in self.db.get_move_entries(run_id, ('done',)):
+                log.write(f"MOVED: {src} -> {dest}\n")
+            for _, src, _, _ in self.db.get_move_entries(run_id, ('failed',)):
+                log.write(f"ERROR: {src}\n")
+
+
+class LinkDeduper:
+    """
+    链接去重: 不移动文件，把重复文件原地替换为指向保留文件的 reflink 克隆或硬链接。
+    - 只处理内容完全一致的分组 (scan_results 中 strict 类结果的 group_id)
+    - 替换前逐字节比对内容，防止扫描结果过期
+    - 先在同目录生成临时链接，再 os.replace 原子替换，任何一步失败原文件都不受影响
+    method: 'auto' (优先 reflink，不支持时用硬链接) / 'reflink' / 'hardlink'
+    """
+
+    def __init__(self, db, method='auto', progress_callback=None):
+        self.db = db
+        self.method = method
+        self.progress_callback = progress_callback
+        self.errors = []
+
+    def run(self, should_stop=None):
+        """
+        返回 (替换数, 释放字节数)；progress_callback(已处理数, 总数)。
+        should_stop 返回 True 时在当前文件处理完后停止，已替换的文件照常从结果中移除
+        """
+        groups = list(self.db.iter_exact_groups())
+        total = sum(len(members) for _, members in groups)
+        done = 0
+        linked = 0
+        reclaimed = 0
+        done_paths = []
+        for _, members in groups:
+            if should_stop and should_stop(): break
+            for filepath, keep, _ in members:
+                if should_stop and should_stop(): break
+                done += 1
+                if self.progress_callback and (done % 100 == 0 or done == total):
+                    self.progress_callback(done, total)
+                try:
+                    freed = self.link_one(filepath, keep)
+                except Exception as e:
+                    self.errors.append((filepath, str(e)))
+                    continue
+                if freed is None: continue
+                linked += 1
+                reclaimed += freed
+                done_paths.append(filepath)
+        # 已替换为链接的文件不应再被迁移
+        self.db.delete_results(done_paths)
+        return linked, reclaimed
+
+    def link_one(self, filepath, keep):
+        """替换单个文件，返回释放的字节数；已经是同一文件时返回 None"""
+        st_dup = os.stat(filepath)
+        st_keep = os.stat(keep)
+        if (st_dup.st_dev, st_dup.st_ino) == (st_keep.st_dev, st_keep.st_ino):
+            return None
+        if st_dup.st_dev != st_keep.st_dev:
+            raise OSError("不在同一文件系统，无法建立链接")
+        if st_dup.st_size != st_keep.st_size or not self.same_content(filepath, keep):
+            raise OSError("内容已变化，跳过")
+
+        tmp = os.path.join(os.path.dirname(filepath), f".{os.path.basename(filepath)}.wxlink.tmp")
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            if self.method in ('auto', 'reflink') and self._reflink(keep, tmp):
+                shutil.copystat(filepath, tmp)
+            elif self.method in ('auto', 'hardlink'):
+                os.link(keep, tmp)
+            else:
+                raise OSError("文件系统不支持 reflink")
+            os.replace(tmp, filepath)
+        finally:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+        # 还有其他硬链接指向原数据时并不会真正释放空间
+        return st_dup.st_size if st_dup.st_nlink == 1 else 0
+
+    @staticmethod
+    def _reflink(src, dest):
+        """尝试 FICLONE 克隆 (btrfs/xfs 等)，不支持时返回 False"""
+        try:
+            import fcntl
+        except ImportError:
+            return False
+        with open(src, 'rb') as fs, open(dest, 'wb') as fd:
+            try:
+                fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+                return True
+            except OSError:
+                pass
+        os.remove(dest)
+        return False
+
+    @staticmethod
+    def same_content(path1, path2):
+        with open(path1, 'rb') as f1, open(path2, 'rb') as f2:
+            while True:
+                b1 = f1.read(COMPARE_CHUNK_SIZE)
+                b2 = f2.read(COMPARE_CHUNK_SIZE)
+                if b1 != b2: return False
+                if not b1: return True
@@ -0,0 +1,317 @@
+"""
+相似图片去重 (包括微信 MsgAttach 中的 .dat 图片):
+- .dat 是原图逐字节异或同一个密钥字节的结果，密钥由文件头与常见图片格式的魔数比对得出
+- 每张图片计算 64 位差值哈希 (dHash)，重新压缩、缩放后的副本哈希只有少量位不同
+- 按海明距离查找相似图片: 有 NumPy 时按位段分桶后向量化比较，否则退回 BK 树
+Pillow 为必需的可选依赖 (pip install Pillow)；NumPy 可选，百万级图片时建议安装。
+"""
+import io
+import os
+import time
+from array import array
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from core import FileTable, ScanMetrics, DEFAULT_HASH_WORKERS
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+IMAGE_EXTS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.dat']
+IMAGE_HASH_DISTANCE = 4
+IMAGE_BATCH_SIZE = 1024
+IMAGE_MAX_FILE_SIZE = 64 * 1024 * 1024
+# 分桶比较时每次参与异或的元素上限，限制大桶的临时内存 (约 32MB)
+IMAGE_COMPARE_BLOCK = 4 * 1024 * 1024
+HASH_W, HASH_H = 9, 8
+
+IMAGE_MAGICS = [b'\xff\xd8\xff', b'\x89PNG', b'GIF8', b'II*\x00', b'MM\x00*', b'RIFF', b'BM']
+
+
+def popcount(x):
+    return bin(x).count('1')
+
+
+class DatDecoder:
+    """微信 .dat 图片: 整个文件与一个字节异或，解码后即原始 JPEG / PNG / GIF 等"""
+    _tables = {}
+
+    @staticmethod
+    def find_key(head):
+        """按文件头推算异或密钥，不是已知图片格式时返回 None"""
+        for magic in IMAGE_MAGICS:
+            if len(head) < len(magic): continue
+            key = head[0] ^ magic[0]
+            if all(head[i] ^ key == magic[i] for i in range(1, len(magic))):
+                return key
+        return None
+
+    @classmethod
+    def decode(cls, data):
+        key = cls.find_key(data[:4])
+        if key is None: return None
+        if key == 0: return data
+        table = cls._tables.get(key)
+        if table is None:
+            table = cls._tables[key] = bytes(b ^ key for b in range(256))
+        return data.translate(table)
+
+
+class BKTree:
+    """海明距离上的 BK 树，没有 NumPy 时用于查找相似哈希"""
+
+    def __init__(self):
+        self.root = None  # [hash, idx, {distance: child}]
+
+    def add(self, h, idx):
+        if self.root is None:
+            self.root = [h, idx, {}]
+            return
+        node = self.root
+        while True:
+            d = popcount(h ^ node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, idx, {}]
+                return
+            node = child
+
+    def query(self, h, radius):
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = popcount(h ^ node[0])
+            if d <= radius: found.append(node[1])
+            for cd, child in node[2].items():
+                if d - radius <= cd <= d + radius:
+                    stack.append(child)
+        return found
+
+
+class ImageDeduper:
+    """
+    相似图片扫描:
+    1. 线程池批量解码 (JPEG 用 draft 直接按 1/8 比例解码) 并计算 dHash，结果按 (size, mtime) 缓存在 db 中
+    2. 对去重后的哈希找出海明距离 <= distance 的配对，合并为连通分量
+    3. 每个分量保留分辨率最高 (其次文件最大、最新) 的图片，与它距离 <= distance 的其他图片判为重复
+    """
+
+    def __init__(self, db=None, workers=DEFAULT_HASH_WORKERS, distance=IMAGE_HASH_DISTANCE,
+                 batch_size=IMAGE_BATCH_SIZE, metrics=None):
+        if Image is None:
+            raise RuntimeError("相似图片模式需要 Pillow: pip install Pillow")
+        self.db = db
+        self.workers = max(1, int(workers))
+        self.distance = distance
+        self.batch_size = batch_size
+        self.metrics = metrics if metrics is not None else ScanMetrics()
+
+    @staticmethod
+    def load_pixels(path):
+        """返回 (9x8 灰度像素, 宽, 高, 读取字节数)；无法解码时像素为 None"""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read(IMAGE_MAX_FILE_SIZE + 1)
+        except OSError:
+            return None, 0, 0, 0
+        n = len(data)
+        if n > IMAGE_MAX_FILE_SIZE: return None, 0, 0, n
+        if path.lower().endswith('.dat'):
+            data = DatDecoder.decode(data)
+            if data is None: return None, 0, 0, n
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                width, height = img.size
+                img.draft('L', (HASH_W * 4, HASH_H * 4))
+                pixels = img.convert('L').resize((HASH_W, HASH_H), Image.BOX).tobytes()
+        except Exception:
+            # Pillow 对损坏或不支持的文件会抛出多种异常 (OSError / SyntaxError / ValueError ...)
+            return None, 0, 0, n
+        return pixels, width, height, n
+
+    @staticmethod
+    def dhash_batch(rows):
+        """一批 9x8 像素 -> 64 位 dHash (高位在前)；NumPy 与纯 Python 的结果一致"""
+        if not rows: return []
+        if np is not None:
+            a = np.frombuffer(b''.join(rows), dtype=np.uint8).reshape(len(rows), HASH_H, HASH_W)
+            bits = (a[:, :, 1:] > a[:, :, :-1]).reshape(len(rows), 64)
+            return np.packbits(bits, axis=1).view('>u8').ravel().tolist()
+        hashes = []
+        for row in rows:
+            h = 0
+            for y in range(HASH_H):
+                base = y * HASH_W
+                for x in range(HASH_W - 1):
+                    h = (h << 1) | (row[base + x + 1] > row[base + x])
+            hashes.append(h)
+        return hashes
+
+    def hash_table(self, table, indices, progress_callback=None, should_stop=None):
+        """
+        为 table 中 indices 指定的文件计算 dHash。
+        返回 (valid, phashes, pixels): 可解码文件的下标、对应的哈希和像素数 (都是 array)
+        """
+        valid, phashes, pixels = array('q'), array('Q'), array('q')
+        total = len(indices)
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for start in range(0, total, self.batch_size):
+                if should_stop and should_stop(): break
+                t = time.perf_counter()
+                batch = indices[start:start + self.batch_size]
+                paths = [table.path(k) for k in batch]
+                cached = self.db.get_image_hashes(paths) if self.db else {}
+
+                results, todo = {}, []
+                for k, path in zip(batch, paths):
+                    entry = cached.get(path)
+                    if entry and entry[0] == table.sizes[k] and entry[1] == table.mtimes[k]:
+                        # 无法解码的文件也缓存 (phash 为 NULL)，下次不再重复尝试
+                        results[k] = (int(entry[2], 16) if entry[2] else None, entry[3], entry[4])
+                    else:
+                        todo.append((k, path))
+
+                loaded = list(pool.map(self.load_pixels, [path for _, path in todo]))
+                decoded = [(k, path, r) for (k, path), r in zip(todo, loaded) if r[0] is not None]
+                rows = []
+                for (k, path, r), h in zip(decoded, self.dhash_batch([r[0] for _, _, r in decoded])):
+                    results[k] = (h, r[1], r[2])
+                for (k, path), r in zip(todo, loaded):
+                    h, w, ht = results.get(k, (None, 0, 0))
+                    rows.append((path, table.sizes[k], table.mtimes[k], None if h is None else f"{h:016x}", w, ht))
+                if self.db: self.db.save_image_hashes(rows)
+
+                for k in batch:
+                    r = results.get(k)
+                    if r and r[0] is not None:
+                        valid.append(k)
+                        phashes.append(r[0])
+                        pixels.append(r[1] * r[2])
+
+                done += len(batch)
+                self.metrics.add('image_hash', seconds=time.perf_counter() - t, files=len(todo),
+                                 bytes_read=sum(r[3] for r in loaded), cache_hits=len(batch) - len(todo))
+                if progress_callback: progress_callback(done, total)
+        return valid, phashes, pixels
+
+    def near_pairs(self, hashes):
+        """产出海明距离 <= distance 的下标对 (hashes 中无重复值)"""
+        if np is not None:
+            yield from self._near_pairs_numpy(hashes)
+            return
+        tree = BKTree()
+        for i, h in enumerate(hashes):
+            for j in tree.query(h, self.distance):
+                yield j, i
+            tree.add(h, i)
+
+    def _near_pairs_numpy(self, hashes):
+        # 鸽巢原理: 64 位分成 distance + 1 段，距离不超过 distance 的两个哈希至少有一段完全相同，
+        # 因此只需在每段取值相同的桶内两两比较
+        arr = np.array(hashes, dtype=np.uint64)
+        n_bands = self.distance + 1
+        bounds = [64 * b // n_bands for b in range(n_bands + 1)]
+        if hasattr(np, 'bitwise_count'):
+            count_bits = np.bitwise_count
+        else:
+            table = np.array([popcount(i) for i in range(256)], dtype=np.uint8)
+            def count_bits(x):
+                return table[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1)
+
+        for lo, hi in zip(bounds, bounds[1:]):
+            keys = (arr >> np.uint64(lo)) & np.uint64((1 << (hi - lo)) - 1)
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            ends = np.r_[starts[1:], len(sorted_keys)]
+            multi = ends - starts > 1
+            for s, e in zip(starts[multi].tolist(), ends[multi].tolist()):
+                idx = order[s:e]
+                sub = arr[idx]
+                block = max(1, IMAGE_COMPARE_BLOCK // len(idx))
+                for r0 in range(0, len(idx), block):
+                    dist = count_bits(sub[r0:r0 + block, None] ^ sub[None, :])
+                    rows, cols = np.nonzero(dist <= self.distance)
+                    upper = cols > rows + r0
+                    yield from zip(idx[rows[upper] + r0].tolist(), idx[cols[upper]].tolist())
+
+    def iter_duplicates(self, files_list, progress_callback=None, value_callback=None, should_stop=None):
+        """
+        files_list: FileTable (也兼容 FileRecord 列表或路径列表)，逐条产出结果字典
+        reason 为 "image_phash (d=距离)"，group 为保留图片的哈希
+        """
+        table = FileTable.of(files_list)
+        sizes, mtimes = table.sizes, table.mtimes
+        indices = array('q', range(len(table)))
+
+        def report(done, total):
+            if value_callback: value_callback(10 + int(done / total * 75))
+            if progress_callback and (done == total or done % (self.batch_size * 20) == 0):
+                progress_callback(f"图片感知哈希: {done}/{total}")
+
+        if progress_callback: progress_callback(f"计算 {len(indices)} 张图片的感知哈希...")
+        valid, phashes, pixels = self.hash_table(table, indices, report, should_stop)
+        if should_stop and should_stop(): return
+
+        if progress_callback: progress_callback(f"在 {len(valid)} 张可解码的图片中查找相似图片...")
+        with self.metrics.stage('image_match', files=len(valid)):
+            # 相同哈希先合并，只对不同的哈希值做距离比较
+            order = sorted(range(len(valid)), key=phashes.__getitem__)
+            uniq, starts = array('Q'), array('q')
+            for pos, j in enumerate(order):
+                if not uniq or phashes[j] != uniq[-1]:
+                    uniq.append(phashes[j])
+                    starts.append(pos)
+            starts.append(len(order))
+
+            parent = list(range(len(uniq)))
+            def find(u):
+                while parent[u] != u:
+                    parent[u] = parent[parent[u]]
+                    u = parent[u]
+                return u
+            for a, b in self.near_pairs(uniq):
+                ra, rb = find(a), find(b)
+                if ra != rb: parent[ra] = rb
+
+            components = defaultdict(list)
+            for u in range(len(uniq)):
+                components[find(u)].append(u)
+            groups = []
+            for comp in components.values():
+                members = [order[pos] for u in comp for pos in range(starts[u], starts[u + 1])]
+                if len(members) > 1:
+                    groups.append(members)
+
+        for members in groups:
+            if should_stop and should_stop(): return
+            keep = max(members, key=lambda j: (pixels[j], sizes[valid[j]], mtimes[valid[j]]))
+            keep_hash = phashes[keep]
+            keep_path = table.path(valid[keep])
+            for j in members:
+                if j == keep: continue
+                d = popcount(phashes[j] ^ keep_hash)
+                # 连通分量可能经由中间图片串联，只清理与保留图片本身足够接近的
+                if d > self.distance: continue
+                k = valid[j]
+                yield {
+                    'file': table.path(k), 'keep': keep_path, 'size': sizes[k], 'mtime_ns': mtimes[k],
+                    'reason': f"image_phash (d={d})", 'group': f"img_{keep_hash:016x}"
+                }
+
+    def evict_missing(self, root_dir, seen_paths):
+        """剔除 root_dir 下本次遍历未出现且已不存在的缓存记录"""
+        if not self.db: return 0
+        gone = [p for p in self.db.iter_image_hash_paths(root_dir)
+                if p not in seen_paths and not os.path.exists(p)]
+        self.db.evict_image_hashes(gone)
+        return len(gone)
@@ -0,0 +1,303 @@
+"""
+扫描结果浏览: 基于 SQLite 按需分页的表格模型，筛选、排序和包含/排除标记都下推到 SQL 中完成。
+"""
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableView, QComboBox, QLineEdit,
+                             QSpinBox, QPushButton, QLabel, QHeaderView, QAbstractItemView)
+
+from core import Utils
+
+VIEW_PAGE_SIZE = 256
+VIEW_MAX_PAGES = 64
+
+
+class ResultsTableModel(QAbstractTableModel):
+    """
+    懒加载的结果表模型:
+    - 行数来自 COUNT 查询，行数据按页 (VIEW_PAGE_SIZE 行) 在首次显示时读取，只缓存最近访问的若干页
+    - 排序与筛选交给 get_results_window 的索引查询，50 万行结果时内存占用也只与可见区域相当；
+      顺序滚动时以相邻页的边界行做键集分页，不随滚动位置变慢
+    - 第 0 列为可勾选的“包含”标记，修改后立即写回数据库
+    """
+    COLUMNS = [
+        ('包含', 'included'),
+        ('文件', 'filepath'),
+        ('保留文件', 'original_path'),
+        ('大小', 'size'),
+        ('原因', 'reason'),
+        ('分组', 'group_id'),
+        ('后缀', 'ext'),
+    ]
+    # 行内字段位置，与 get_results_window 的返回顺序一致
+    ID, FILEPATH, ORIGINAL, SIZE, REASON, GROUP, EXT, INCLUDED = range(8)
+    FIELD_OF_COLUMN = [INCLUDED, FILEPATH, ORIGINAL, SIZE, REASON, GROUP, EXT]
+    FIELD_OF_SORT = {'id': ID, 'filepath': FILEPATH, 'original_path': ORIGINAL, 'size': SIZE, 'reason': REASON,
+                     'group_id': GROUP, 'ext': EXT, 'included': INCLUDED}
+
+    summary_changed = pyqtSignal()
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.filters = {}
+        self.order_by = 'id'
+        self.descending = False
+        self.pages = OrderedDict()
+        self.row_count = 0
+        self.total = (0, 0)
+        self.included = (0, 0)
+        self.refresh()
+
+    def refresh(self, recount=True):
+        """丢弃已缓存的页；recount 为 False 时 (只改变排序) 不重新统计行数"""
+        self.beginResetModel()
+        self.pages.clear()
+        if recount:
+            count, size, inc_count, inc_size = self.db.count_results(self.filters)
+            self.total = (count, size)
+            self.included = (inc_count, inc_size)
+            self.row_count = count
+        self.endResetModel()
+        if recount:
+            self.summary_changed.emit()
+
+    def set_filters(self, filters):
+        self.filters = filters
+        self.refresh()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def _row(self, row):
+        page_no = row // VIEW_PAGE_SIZE
+        page = self.pages.get(page_no)
+        if page is None:
+            page = [list(r) for r in self._fetch_page(page_no)]
+            self.pages[page_no] = page
+            if len(self.pages) > VIEW_MAX_PAGES:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(page_no)
+        offset = row - page_no * VIEW_PAGE_SIZE
+        return page[offset] if offset < len(page) else None
+
+    def _anchor(self, record):
+        value = record[self.FIELD_OF_SORT[self.order_by]]
+        return None if value is None else (value, record[self.ID])
+
+    def _fetch_page(self, page_no):
+        """
+        相邻页已缓存时 (顺序滚动) 以其边界行为锚点做键集分页；
+        否则 (拖动滚动条跳转) 按 OFFSET 从较近的一端计算
+        """
+        start = page_no * VIEW_PAGE_SIZE
+        limit = min(VIEW_PAGE_SIZE, self.row_count - start)
+        if limit <= 0: return []
+        prev, following = self.pages.get(page_no - 1), self.pages.get(page_no + 1)
+        if prev and len(prev) == VIEW_PAGE_SIZE and self._anchor(prev[-1]):
+            return self.db.get_results_window(self.filters, self.order_by, self.descending, limit=limit,
+                                              after=self._anchor(prev[-1]))
+        if following and self._anchor(following[0]):
+            return self.db.get_results_window(self.filters, self.order_by, self.descending, limit=limit,
+                                              before=self._anchor(following[0]))
+        if start > self.row_count // 2:
+            return self.db.get_results_window(self.filters, self.order_by, self.descending,
+                                              self.row_count - start - limit, limit, from_end=True)
+        return self.db.get_results_window(self.filters, self.order_by, self.descending, start, limit)
+
+    def record_id(self, row):
+        record = self._row(row)
+        return record[self.ID] if record else None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid(): return None
+        record = self._row(index.row())
+        if record is None: return None
+        field = self.FIELD_OF_COLUMN[index.column()]
+
+        if field == self.INCLUDED:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if record[field] else Qt.Unchecked
+            return None
+        if role == Qt.DisplayRole:
+            return Utils.format_size(record[field]) if field == self.SIZE else record[field]
+        if role == Qt.ToolTipRole and field in (self.FILEPATH, self.ORIGINAL, self.REASON):
+            return record[field]
+        if role == Qt.TextAlignmentRole and field == self.SIZE:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole: return None
+        if orientation == Qt.Horizontal:
+            return self.COLUMNS[section][0]
+        return section + 1
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.isValid() and index.column() == 0:
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or index.column() != 0: return False
+        return self.set_rows_included([index.row()], value == Qt.Checked) > 0
+
+    def set_rows_included(self, rows, included):
+        """设置若干可见行的包含标记，返回实际改变的行数"""
+        changed = []
+        for row in rows:
+            record = self._row(row)
+            if record and bool(record[self.INCLUDED]) != included:
+                changed.append((row, record))
+        if not changed: return 0
+
+        self.db.set_included([record[self.ID] for _, record in changed], included)
+        sign = 1 if included else -1
+        count, size = self.included
+        for row, record in changed:
+            record[self.INCLUDED] = int(included)
+            count += sign
+            size += sign * record[self.SIZE]
+            cell = self.index(row, 0)
+            self.dataChanged.emit(cell, cell, [Qt.CheckStateRole])
+        self.included = (count, size)
+        self.summary_changed.emit()
+        return len(changed)
+
+    def set_all_included(self, included):
+        """把当前筛选条件下的全部结果设为包含/排除"""
+        self.db.set_included_where(self.filters, included)
+        self.refresh()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.order_by = self.COLUMNS[column][1] if column >= 0 else 'id'
+        self.descending = order == Qt.DescendingOrder
+        self.refresh(recount=False)
+
+
+class ResultsView(QWidget):
+    """结果浏览页: 筛选栏 + 虚拟化表格 + 批量包含/排除"""
+    REASONS = [('全部原因', None), ('严格去重 (MD5)', 'strict_md5'),
+               ('小文件严格去重', 'small_file_strict'), ('版本识别', 'fuzzy_ver'), ('相似图片', 'image_phash')]
+    INCLUDED = [('全部', None), ('仅包含', True), ('仅排除', False)]
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.model = ResultsTableModel(db, self)
+
+        layout = QVBoxLayout(self)
+
+        filter_layout = QHBoxLayout()
+        self.cmb_ext = QComboBox()
+        self.cmb_reason = QComboBox()
+        for label, value in self.REASONS:
+            self.cmb_reason.addItem(label, value)
+        self.cmb_included = QComboBox()
+        for label, value in self.INCLUDED:
+            self.cmb_included.addItem(label, value)
+        self.txt_group = QLineEdit()
+        self.txt_group.setPlaceholderText("分组 ID")
+        self.spin_min_size = QSpinBox()
+        self.spin_min_size.setRange(0, 1024 * 1024)
+        self.spin_min_size.setSuffix(" MB")
+        self.spin_min_size.setPrefix("≥ ")
+
+        filter_layout.addWidget(QLabel("后缀:"))
+        filter_layout.addWidget(self.cmb_ext)
+        filter_layout.addWidget(self.cmb_reason)
+        filter_layout.addWidget(self.txt_group)
+        filter_layout.addWidget(QLabel("大小:"))
+        filter_layout.addWidget(self.spin_min_size)
+        filter_layout.addWidget(self.cmb_included)
+        layout.addLayout(filter_layout)
+
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setWordWrap(False)
+        # 固定行高，滚动时不必逐行测量内容
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(22)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
+        self.table.setColumnWidth(1, 360)
+        self.table.setColumnWidth(2, 240)
+        layout.addWidget(self.table)
+
+        btn_layout = QHBoxLayout()
+        self.lbl_summary = QLabel()
+        btn_include_sel = QPushButton("包含所选")
+        btn_include_sel.clicked.connect(lambda: self.set_selected_included(True))
+        btn_exclude_sel = QPushButton("排除所选")
+        btn_exclude_sel.clicked.connect(lambda: self.set_selected_included(False))
+        btn_include_all = QPushButton("包含全部筛选结果")
+        btn_include_all.clicked.connect(lambda: self.model.set_all_included(True))
+        btn_exclude_all = QPushButton("排除全部筛选结果")
+        btn_exclude_all.clicked.connect(lambda: self.model.set_all_included(False))
+        btn_layout.addWidget(self.lbl_summary, 1)
+        btn_layout.addWidget(btn_include_sel)
+        btn_layout.addWidget(btn_exclude_sel)
+        btn_layout.addWidget(btn_include_all)
+        btn_layout.addWidget(btn_exclude_all)
+        layout.addLayout(btn_layout)
+
+        self.model.summary_changed.connect(self.update_summary)
+        self.cmb_ext.currentIndexChanged.connect(self.apply_filters)
+        self.cmb_reason.currentIndexChanged.connect(self.apply_filters)
+        self.cmb_included.currentIndexChanged.connect(self.apply_filters)
+        self.txt_group.editingFinished.connect(self.apply_filters)
+        self.spin_min_size.editingFinished.connect(self.apply_filters)
+
+        self.reload_extensions()
+        self.update_summary()
+
+    def reload_extensions(self):
+        current = self.cmb_ext.currentData()
+        self.cmb_ext.blockSignals(True)
+        self.cmb_ext.clear()
+        self.cmb_ext.addItem("全部", None)
+        for ext in self.db.get_result_extensions():
+            self.cmb_ext.addItem(ext or "(无后缀)", ext)
+        idx = self.cmb_ext.findData(current)
+        self.cmb_ext.setCurrentIndex(idx if idx >= 0 else 0)
+        self.cmb_ext.blockSignals(False)
+
+    def current_filters(self):
+        filters = {
+            'ext': self.cmb_ext.currentData(),
+            'reason': self.cmb_reason.currentData(),
+            'included': self.cmb_included.currentData(),
+            'group': self.txt_group.text().strip() or None,
+        }
+        if self.spin_min_size.value():
+            filters['min_size'] = self.spin_min_size.value() * 1024 * 1024
+        return filters
+
+    def apply_filters(self):
+        filters = self.current_filters()
+        if filters != self.model.filters:
+            self.model.set_filters(filters)
+
+    def refresh(self):
+        """新的扫描结果写入后调用"""
+        self.reload_extensions()
+        self.model.filters = self.current_filters()
+        self.model.refresh()
+
+    def set_selected_included(self, included):
+        rows = [idx.row() for idx in self.table.selectionModel().selectedRows()]
+        self.model.set_rows_included(rows, included)
+
+    def update_summary(self):
+        total_count, total_size = self.model.total
+        inc_count, inc_size = self.model.included
+        self.lbl_summary.setText(f"共 {total_count} 条 ({Utils.format_size(total_size)})，"
+                                 f"将清理 {inc_count} 条 ({Utils.format_size(inc_size)})")
@@ -1,318 +1,263 @@
-import os
-import hashlib
-import shutil
 import time
-import re
-import difflib
-from datetime import datetime
 from PyQt5.QtCore import QThread, pyqtSignal
+# 扫描核心在 core.py 中，不依赖 Qt；这里只保留 Qt 线程封装，并重新导出旧接口
+from core import (Utils, CoreLogic, HashCache, HashEngine, FuzzyMatcher, FileRecord, ScanMetrics,
+                  ScanCheckpoint, ColdBudgetSelector, DEFAULT_HASH_WORKERS, DEFAULT_BYTES_IN_FLIGHT, SAMPLE_SIZE)
+from estimator import SpaceEstimator, ESTIMATE_TIME_BUDGET
+from watcher import DirectoryWatcher, WATCH_INTERVAL
+from file_ops import LinkDeduper
 
 
-class Utils:
-    @staticmethod
-    def format_size(size):
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024: return f"{size:.2f} {unit}"
-            size /= 1024
-        return f"{size:.2f} TB"
+class ScannerThread(QThread):
+    progress_val = pyqtSignal(int)
+    progress_text = pyqtSignal(str)
+    finished = pyqtSignal(str)
+    error = pyqtSignal(str)
+    metrics = pyqtSignal(dict)  # ScanMetrics.as_dict() 加上 run_id / root / mode
+    exited = pyqtSignal()  # run() 返回前发出，无论完成、停止还是出错
+
+    def __init__(self, root_dir, mode, db, extensions=None,
+                 workers=DEFAULT_HASH_WORKERS, max_bytes_in_flight=DEFAULT_BYTES_IN_FLIGHT, resume=True,
+                 incremental=False):
+        super().__init__()
+        self.root_dir = root_dir
+        self.mode = mode
+        self.db = db
+        self.extensions = extensions
+        self.workers = workers
+        self.max_bytes_in_flight = max_bytes_in_flight
+        self.resume = resume
+        self.incremental = incremental
+        self.is_running = True
 
-    @staticmethod
-    def get_file_hash(filepath, sample=True):
+    def run(self):
         try:
-            file_size = os.path.getsize(filepath)
-            if file_size < 1 * 1024 * 1024:
-                sample = False
-
-            with open(filepath, 'rb') as f:
-                if not sample:
-                    return hashlib.md5(f.read()).hexdigest()
-
-                h = hashlib.md5()
-                h.update(f.read(8192))
-                f.seek(file_size // 2)
-                h.update(f.read(8192))
-                f.seek(-8192, 2)
-                h.update(f.read(8192))
-                return h.hexdigest()
-        except Exception:
-            return None
-
-    @staticmethod
-    def detect_wechat_paths(root_dir, target_sub="FileStorage/MsgAttach"):
-        targets = []
-        if not os.path.exists(root_dir): return targets
-        root_dir = os.path.normpath(root_dir)
-
-        if "FileStorage" in root_dir:
-            return [root_dir]
-
-        if os.path.exists(os.path.join(root_dir, "FileStorage")):
-            p = os.path.join(root_dir, target_sub)
-            if os.path.exists(p): targets.append(p)
-            return targets
+            report = CoreLogic.run_dedup_scan(
+                self.root_dir, self.mode, self.db, extensions=self.extensions,
+                workers=self.workers, max_bytes_in_flight=self.max_bytes_in_flight,
+                progress_callback=lambda msg: self.progress_text.emit(msg),
+                value_callback=lambda v: self.progress_val.emit(v),
+                should_stop=lambda: not self.is_running, resume=self.resume,
+                incremental=self.incremental
+            )
+            if report is None: return
+            self.metrics.emit(dict(report['metrics'], run_id=report['run_id'],
+                                   root=report['root'], mode=report['mode']))
+            self.finished.emit(Utils.format_scan_report(report))
+
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self.error.emit(f"错误: {str(e)}")
+        finally:
+            self.exited.emit()
+
+    def stop(self):
+        # 已完成的遍历和哈希保存在断点中，下次扫描同一目录时继续
+        self.is_running = False
+
+
+class WatcherThread(QThread):
+    """后台轮询目录索引，新到的文件与已有文件内容相同时立即写入扫描结果 (见 DirectoryWatcher)"""
+    progress_text = pyqtSignal(str)
+    found = pyqtSignal(list)
+    error = pyqtSignal(str)
+    exited = pyqtSignal()  # run() 返回前发出，无论正常停止还是出错
 
+    def __init__(self, root_dirs, db, extensions=None, interval=WATCH_INTERVAL):
+        super().__init__()
+        self.root_dirs = root_dirs
+        self.db = db
+        self.extensions = extensions
+        self.interval = interval
+        self.is_running = True
+
+    def run(self):
         try:
-            for item in os.listdir(root_dir):
-                full_path = os.path.join(root_dir, item)
-                if os.path.isdir(full_path) and (item.startswith("wxid_") or item == "All Users" or item == "Applet"):
-                    p = os.path.join(full_path, target_sub)
-                    if os.path.exists(p):
-                        targets.append(p)
-        except Exception:
-            pass
-        return targets
-
-
-class CoreLogic:
-    @staticmethod
-    def normalize_filename(filename):
-        """
-        使用正则提取文件核心名，去除常见后缀。
-        """
-        name, ext = os.path.splitext(filename)
-        name = re.sub(r'\(\d+\)$', '', name)
-        name = re.sub(r'（\d+）$', '', name)
-        name = re.sub(r'_副本$', '', name)
-        name = re.sub(r' - Copy$', '', name)
-        name = re.sub(r'_\d+$', '', name)
-        return name.strip().lower()
-
-    @staticmethod
-    def is_name_similar(name1, name2, threshold=0.6):
-        core1 = CoreLogic.normalize_filename(name1)
-        core2 = CoreLogic.normalize_filename(name2)
-
-        if core1 == core2:
-            return True
-
-        return difflib.SequenceMatcher(None, core1, core2).ratio() > threshold
-
-    @staticmethod
-    def scan_mixed_strategy(files_list, progress_callback=None):
-        """
-        小文件 (<1MB) -> Strict MD5
-        大文件 (>=1MB) -> Fuzzy Logic
-        """
-        small_files = []
-        large_files = []
-
-        # 1. 分流
-        for f in files_list:
-            try:
-                s = os.path.getsize(f)
-                if s < 1 * 1024 * 1024:
-                    small_files.append(f)
-                else:
-                    large_files.append(f)
-            except:
-                pass
-
-        results = []
-
-        if small_files:
-            if progress_callback: progress_callback("分析小文件 (MD5)...")
-            from collections import defaultdict
-            hash_map = defaultdict(list)
-
-            size_map = defaultdict(list)
-            for f in small_files:
-                size_map[os.path.getsize(f)].append(f)
-
-            for size, paths in size_map.items():
-                if len(paths) < 2: continue
-                for p in paths:
-                    h = Utils.get_file_hash(p, sample=False)
-                    if h: hash_map[h].append(p)
-
-            for h, paths in hash_map.items():
-                if len(paths) > 1:
-                    paths.sort(key=len)
-                    keep = paths[0]
-                    for p in paths[1:]:
-                        results.append({
-                            'file': p, 'keep': keep, 'reason': 'small_file_strict', 'group': h
-                        })
-
-        if large_files:
-            if progress_callback: progress_callback("分析大文件 (Fuzzy)...")
-            ext_groups = {}
-            for f in large_files:
-                ext = os.path.splitext(f)[1].lower()
-                if ext not in ext_groups: ext_groups[ext] = []
-                ext_groups[ext].append(f)
-
-            for ext, paths in ext_groups.items():
-                if len(paths) < 2: continue
-
-                is_fuzzy_safe = ext in ['.doc', '.docx', '.pdf', '.ppt', '.pptx',
-                                        '.xls', '.xlsx', '.mp4', '.mov', '.avi', '.zip', '.rar']
-
-                if not is_fuzzy_safe:
-                    continue
-
-                file_meta = []
-                for p in paths:
-                    try:
-                        stat = os.stat(p)
-                        file_meta.append(
-                            {'path': p, 'name': os.path.basename(p), 'size': stat.st_size, 'mtime': stat.st_mtime})
-                    except:
-                        continue
-
-                file_meta.sort(key=lambda x: x['size'])
-                visited = [False] * len(file_meta)
-
-                for i in range(len(file_meta)):
-                    if visited[i]: continue
-                    base = file_meta[i]
-                    current_group = [base]
-                    visited[i] = True
-
-                    for j in range(i + 1, len(file_meta)):
-                        if visited[j]: continue
-                        compare = file_meta[j]
-
-                        if compare['size'] > base['size'] * 1.3: break
-
-                        if CoreLogic.is_name_similar(base['name'], compare['name']):
-                            current_group.append(compare)
-                            visited[j] = True
-
-                    if len(current_group) > 1:
-                        current_group.sort(key=lambda x: x['mtime'], reverse=True)
-                        keep = current_group[0]
-                        for d in current_group[1:]:
-                            results.append({
-                                'file': d['path'], 'keep': keep['path'],
-                                'reason': f"fuzzy_ver (base={base['name']})",
-                                'group': f"{ext}_{base['size']}"
-                            })
-
-        return results
-
-    @staticmethod
-    def scan_cold_files_multi_path(target_paths, days_threshold):
-        cold_files = []
-        now = time.time()
-        threshold_sec = days_threshold * 86400
-        for root_dir in target_paths:
-            for root, _, files in os.walk(root_dir):
-                for file in files:
-                    full_path = os.path.join(root, file)
-                    try:
-                        mtime = os.path.getmtime(full_path)
-                        if (now - mtime) > threshold_sec:
-                            cold_files.append(full_path)
-                    except:
-                        pass
-        return cold_files
-
-    @staticmethod
-    def move_files(file_list, target_base_dir, operation_name="cleanup"):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        dest_root = os.path.join(target_base_dir, f"wechat_{operation_name}_{timestamp}")
-        os.makedirs(dest_root, exist_ok=True)
-        log_path = os.path.join(dest_root, "move_log.txt")
-        moved_count = 0
-        total_size = 0
-        with open(log_path, 'w', encoding='utf-8') as log:
-            log.write(f"Operation: {operation_name}\nTime: {timestamp}\n\n")
-            for src_path in file_list:
-                try:
-                    rel_path = os.path.basename(src_path)
-                    parts = src_path.split(os.sep)
-                    for idx, part in enumerate(parts):
-                        if part.startswith("wxid_") or part == "FileStorage":
-                            rel_path = os.path.join(*parts[idx:])
-                            break
-                    dest_path = os.path.join(dest_root, rel_path)
-                    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                    shutil.move(src_path, dest_path)
-                    log.write(f"MOVED: {src_path} -> {dest_path}\n")
-                    moved_count += 1
-                    total_size += os.path.getsize(dest_path)
-                except Exception as e:
-                    log.write(f"ERROR: {src_path} -> {str(e)}\n")
-        return dest_root, moved_count, total_size
+            watcher = DirectoryWatcher(self.db, self.root_dirs, extensions=self.extensions, interval=self.interval,
+                                       progress_callback=lambda msg: self.progress_text.emit(msg))
+            watcher.run(should_stop=lambda: not self.is_running,
+                        on_poll=lambda found: found and self.found.emit(found))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self.error.emit(f"错误: {str(e)}")
+        finally:
+            self.exited.emit()
 
+    def stop(self):
+        self.is_running = False
 
-class ScannerThread(QThread):
+
+class LinkDedupThread(QThread):
+    """后台执行链接去重 (见 LinkDeduper)，停止时已替换的文件保持替换后的状态"""
     progress_val = pyqtSignal(int)
     progress_text = pyqtSignal(str)
-    finished = pyqtSignal(str)
+    finished = pyqtSignal(dict)  # {'count', 'size', 'errors', 'stopped'}
     error = pyqtSignal(str)
 
-    def __init__(self, root_dir, mode, db, extensions=None):
+    def __init__(self, db, method='auto'):
         super().__init__()
-        self.root_dir = root_dir
-        self.mode = mode
         self.db = db
-        self.extensions = extensions
+        self.method = method
         self.is_running = True
 
     def run(self):
         try:
-            self.db.clear_results()
-            all_files = []
-
-            self.progress_text.emit(f"正在遍历目录: {self.root_dir} ...")
-            self.progress_val.emit(5)
-
-            for root, _, files in os.walk(self.root_dir):
-                if not self.is_running: return
-                for file in files:
-                    if self.extensions:
-                        ext = os.path.splitext(file)[1].lower()
-                        if ext not in self.extensions: continue
-                    all_files.append(os.path.join(root, file))
-
-            total_count = len(all_files)
-            if total_count == 0:
-                self.finished.emit("未找到符合条件的文件。")
-                return
-
-            self.progress_text.emit(f"发现 {total_count} 个文件，开始分析...")
-            duplicates_found = []
-
-            if self.mode == 'strict':
-                from collections import defaultdict
-                hash_map = defaultdict(list)
-                for i, f in enumerate(all_files):
-                    if not self.is_running: return
-                    if i % 100 == 0:
-                        self.progress_val.emit(int(i / total_count * 90))
-                        self.progress_text.emit(f"计算哈希: {i}/{total_count}")
-                    h = Utils.get_file_hash(f, sample=True)
-                    if h: hash_map[h].append(f)
-
-                for h, paths in hash_map.items():
-                    if len(paths) > 1:
-                        paths.sort(key=len)
-                        keep = paths[0]
-                        for p in paths[1:]:
-                            duplicates_found.append({'file': p, 'keep': keep, 'reason': 'strict_md5', 'group': h})
+            linker = LinkDeduper(self.db, method=self.method, progress_callback=self._on_progress)
+            count, size = linker.run(should_stop=lambda: not self.is_running)
+            self.finished.emit({'count': count, 'size': size, 'errors': linker.errors,
+                                'stopped': not self.is_running})
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self.error.emit(f"错误: {str(e)}")
+
+    def _on_progress(self, done, total):
+        self.progress_val.emit(int(done * 100 / total) if total else 100)
+        if done % 1000 == 0 or done == total:
+            self.progress_text.emit(f"链接去重: 已处理 {done}/{total} 个文件")
+
+    def stop(self):
+        self.is_running = False
+
+
+class ColdMoveThread(QThread):
+    """后台迁移或打包归档冷数据 (见 CoreLogic.move_files / archive_files)，进度按已处理文件数汇报"""
+    progress_val = pyqtSignal(int)
+    progress_text = pyqtSignal(str)
+    finished = pyqtSignal(dict)  # {'archive', 'folder', 'count', 'size', 'stored', 'errors'}
+    error = pyqtSignal(str)
+    exited = pyqtSignal()
+
+    def __init__(self, files, dest, operation_name, db, archive=False):
+        super().__init__()
+        self.files = files
+        self.dest = dest
+        self.operation_name = operation_name
+        self.db = db
+        self.archive = archive
+
+    def run(self):
+        try:
+            if self.archive:
+                folder, count, size, stored, errors = CoreLogic.archive_files(
+                    self.files, self.dest, self.operation_name, db=self.db, progress_callback=self._on_progress)
             else:
-                self.progress_val.emit(30)
-                duplicates_found = CoreLogic.scan_mixed_strategy(
-                    all_files,
-                    progress_callback=lambda msg: self.progress_text.emit(msg)
-                )
-
-            self.progress_text.emit("正在保存结果...")
-            self.db.save_duplicates(duplicates_found)
-            self.progress_val.emit(100)
-
-            dup_size = sum([os.path.getsize(d['file']) for d in duplicates_found if os.path.exists(d['file'])])
-            report = (f"扫描完成！\n模式: {self.mode}\n"
-                      f"文件总数: {total_count}\n"
-                      f"可清理数: {len(duplicates_found)}\n"
-                      f"释放空间: {Utils.format_size(dup_size)}")
+                folder, count, size = CoreLogic.move_files(self.files, self.dest, self.operation_name, db=self.db,
+                                                           progress_callback=self._on_progress)
+                stored, errors = None, []
+            self.finished.emit({'archive': self.archive, 'folder': folder, 'count': count, 'size': size,
+                                'stored': stored, 'errors': errors})
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self.error.emit(f"错误: {str(e)}")
+        finally:
+            self.exited.emit()
+
+    def _on_progress(self, done, total):
+        self.progress_val.emit(int(done * 100 / total) if total else 100)
+        verb = "归档" if self.archive else "迁移"
+        self.progress_text.emit(f"正在{verb}冷数据: {done}/{total} 个文件")
+
+
+class EstimatorThread(QThread):
+    """完整扫描之前的快速估算: 只遍历元数据并抽样哈希，几秒内给出各模式可释放空间的区间"""
+    progress_text = pyqtSignal(str)
+    finished = pyqtSignal(dict)
+    error = pyqtSignal(str)
+
+    def __init__(self, root_dir, extensions=None, time_budget=ESTIMATE_TIME_BUDGET):
+        super().__init__()
+        self.root_dir = root_dir
+        self.extensions = extensions
+        self.time_budget = time_budget
+        self.is_running = True
+
+    def run(self):
+        try:
+            report = SpaceEstimator(time_budget=self.time_budget).estimate(
+                self.root_dir, extensions=self.extensions,
+                progress_callback=lambda msg: self.progress_text.emit(msg),
+                should_stop=lambda: not self.is_running)
+            if report is None: return
             self.finished.emit(report)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self.error.emit(f"错误: {str(e)}")
 
+    def stop(self):
+        self.is_running = False
+
+
+class ColdScannerThread(QThread):
+    """
+    后台冷数据扫描，边扫描边汇报速度与已找到的数据量。
+    budget_bytes: 设置时为空间目标模式，只选出冷度评分最高、总大小达到目标的最少文件 (见 ColdBudgetSelector)
+    """
+    progress_text = pyqtSignal(str)
+    stats = pyqtSignal(dict)
+    finished = pyqtSignal(list)
+    error = pyqtSignal(str)
+    exited = pyqtSignal()  # run() 返回前发出，无论完成、停止还是出错
+
+    def __init__(self, target_paths, days_threshold, assume_write_once=False, report_interval=0.5,
+                 budget_bytes=None):
+        super().__init__()
+        self.target_paths = target_paths
+        self.days_threshold = days_threshold
+        self.budget_bytes = budget_bytes
+        self.selected_bytes = 0
+        self.assume_write_once = assume_write_once
+        self.report_interval = report_interval
+        self.is_running = True
+
+    def run(self):
+        try:
+            counters = {}
+            files = []
+            selector = ColdBudgetSelector(self.budget_bytes) if self.budget_bytes else None
+            start = last_report = time.time()
+            for rec in CoreLogic.iter_cold_files(self.target_paths, self.days_threshold,
+                                                 should_stop=lambda: not self.is_running,
+                                                 stats=counters,
+                                                 assume_write_once=self.assume_write_once):
+                if selector:
+                    selector.offer(rec)
+                else:
+                    files.append(rec.path)
+                now = time.time()
+                if now - last_report >= self.report_interval:
+                    last_report = now
+                    if selector:
+                        counters['selected'], counters['selected_bytes'] = len(selector.heap), selector.total
+                    self._emit_stats(counters, now - start)
+            if not self.is_running: return
+            if selector:
+                files = [rec.path for rec in selector.selected()]
+                self.selected_bytes = selector.total
+                counters['selected'], counters['selected_bytes'] = len(selector.heap), selector.total
+            self._emit_stats(counters, time.time() - start)
+            self.finished.emit(files)
         except Exception as e:
             import traceback
             traceback.print_exc()
             self.error.emit(f"错误: {str(e)}")
+        finally:
+            self.exited.emit()
+
+    def _emit_stats(self, counters, elapsed):
+        info = dict(counters)
+        info['elapsed'] = elapsed
+        info['files_per_sec'] = counters.get('scanned', 0) / elapsed if elapsed > 0 else 0.0
+        self.stats.emit(info)
+        text = (f"已扫描 {info['scanned']} 个文件 ({info['files_per_sec']:.0f} 个/秒)，"
+                f"找到冷数据 {info['matched']} 个 / {Utils.format_size(info['bytes'])}")
+        if 'selected' in info:
+            text += f"，已选出最冷的 {info['selected']} 个 / {Utils.format_size(info['selected_bytes'])}"
+        self.progress_text.emit(text)
 
     def stop(self):
-        self.is_running = False
\ No newline at end of file
+        self.is_running = False
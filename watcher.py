@@ -0,0 +1,104 @@
+"""
+新文件监视: 以轮询代替 inotify / fanotify (只用标准库，Windows 上同样可用)。
+每轮用 DirectoryIndex 增量遍历，只有 mtime 变化的目录才重新读取；新到的文件立即登记进内容索引，
+与同一根目录下已有的文件比对，内容相同的直接作为 strict_md5 结果写入 scan_results，不必重新扫描。
+"""
+import os
+import time
+
+from core import Utils, CoreLogic, ContentIndex, DirectoryIndex
+
+WATCH_INTERVAL = 5.0
+
+
+class DirectoryWatcher:
+    """
+    root_dirs   : 监视的根目录列表
+    on_duplicate: 每发现一个重复文件调用一次，参数为结果 dict (与扫描结果格式相同)
+    根目录尚无目录索引时，第一轮只建立索引 (同时把全部文件登记进内容索引)，不报告重复
+    """
+
+    def __init__(self, db, root_dirs, extensions=None, interval=WATCH_INTERVAL, on_duplicate=None,
+                 progress_callback=None):
+        self.db = db
+        self.root_dirs = [os.path.normpath(os.path.abspath(d)) for d in root_dirs]
+        self.extensions = {e.lower() for e in extensions} if extensions else None
+        self.interval = interval
+        self.on_duplicate = on_duplicate
+        self.progress_callback = progress_callback
+        self.dir_index = DirectoryIndex(db)
+        self.content_index = ContentIndex(db)
+        self.polls = 0
+        self.new_files = 0
+        self.dup_count = 0
+        self.dup_size = 0
+
+    def _say(self, msg):
+        if self.progress_callback: self.progress_callback(msg)
+
+    def poll(self, should_stop=None):
+        """执行一轮检查，返回本轮发现的重复文件结果列表"""
+        found = []
+        for root_dir in self.root_dirs:
+            if should_stop and should_stop(): break
+            new_files = []
+            # 遍历时重新读取的目录中的文件已由 DirectoryIndex 登记进内容索引
+            if not self.db.load_dir_index(root_dir):
+                self._say(f"建立目录索引: {root_dir} ...")
+            for _ in self.dir_index.walk(root_dir, self.extensions, should_stop, new_files=new_files, cached=False):
+                pass
+            if not new_files: continue
+            self.new_files += len(new_files)
+            found.extend(self._match(root_dir, new_files))
+        self.polls += 1
+        if found:
+            self.db.insert_results(found)
+            self.dup_count += len(found)
+            self.dup_size += sum(d['size'] for d in found)
+        return found
+
+    def _match(self, root_dir, records):
+        """
+        与扫描一样只在同一根目录内查重，按 CoreLogic.exact_keep_key 选保留的一份:
+        通常保留已有文件、新到的作为重复项；新文件路径更短时改为保留新文件，已有的几份作为重复项
+        (它们之前的结果行被替换)，与严格扫描对同一组的选择一致
+        """
+        prefix = os.path.join(root_dir, '')
+        # 本轮已作为重复项报告的文件不再充当保留项
+        reported = set()
+        for rec in records:
+            # 已作为同一轮中其他新文件的重复项报告过
+            if rec.path in reported: continue
+            full_hash, matches = self.content_index.lookup_record(rec, register=False)
+            existing = [p for p, _ in matches if p.startswith(prefix) and p not in reported and os.path.exists(p)]
+            if not existing: continue
+            keep = min(existing + [rec.path], key=CoreLogic.exact_keep_key)
+            if keep != rec.path:
+                dups = [rec]
+            else:
+                dups = [r for r in map(self._stat, existing) if r is not None]
+                self.db.delete_results([r.path for r in dups])
+            for r in dups:
+                reported.add(r.path)
+                d = {'file': r.path, 'keep': keep, 'size': r.size, 'mtime_ns': r.mtime_ns,
+                     'reason': 'strict_md5', 'group': full_hash}
+                if self.on_duplicate: self.on_duplicate(d)
+                yield d
+
+    @staticmethod
+    def _stat(path):
+        try:
+            return Utils.stat_record(path)
+        except OSError:
+            return None
+
+    def run(self, should_stop=None, max_polls=None, on_poll=None):
+        """按 interval 轮询，直到 should_stop 返回 True 或达到 max_polls 轮；on_poll 在每轮后以本轮结果调用"""
+        while not (should_stop and should_stop()):
+            found = self.poll(should_stop)
+            if on_poll: on_poll(found)
+            if max_polls is not None and self.polls >= max_polls: return
+            deadline = time.monotonic() + self.interval
+            while time.monotonic() < deadline:
+                if should_stop and should_stop(): return
+                time.sleep(min(0.2, max(0.0, deadline - time.monotonic())))
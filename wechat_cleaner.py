@@ -4,8 +4,13 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QLabel, QFileDialog,
                              QProgressBar, QTextEdit, QRadioButton,
                              QTabWidget, QMessageBox, QGroupBox, QSpinBox, QCheckBox)
-from scanner import CoreLogic, Utils, ScannerThread
+from PyQt5.QtCore import QTimer
+from scanner import (CoreLogic, Utils, ScannerThread, EstimatorThread, ColdScannerThread, WatcherThread, LinkDedupThread,
+                     ColdMoveThread, ScanCheckpoint, DEFAULT_HASH_WORKERS)
 from db_manager import DatabaseManager
+from file_ops import MoveEngine
+from results_view import ResultsView
+from image_dedup import IMAGE_EXTS
 
 
 class MainWindow(QMainWindow):
@@ -15,8 +20,16 @@ class MainWindow(QMainWindow):
         self.target_dir = None
         self.global_migration_dir = None
         self.scan_thread = None
+        self.estimate_thread = None
+        self.watch_thread = None
+        self.link_thread = None
+        self.last_metrics = None
+        self.cold_thread = None
+        self.cold_move_thread = None
+        self.cold_dest = None
 
         self.init_ui()
+        QTimer.singleShot(0, self.check_unfinished_moves)
 
     def init_ui(self):
         self.setWindowTitle('WeChat Cleaner Pro (Engineer Edition)')
@@ -45,6 +58,10 @@ class MainWindow(QMainWindow):
         btn_mig.clicked.connect(self.select_migration_dir)
         mig_layout.addWidget(btn_mig)
         mig_layout.addWidget(self.lbl_mig_path)
+        mig_layout.addStretch()
+        btn_undo = QPushButton("↩ 撤销上次迁移")
+        btn_undo.clicked.connect(self.undo_last_move)
+        mig_layout.addWidget(btn_undo)
         top_layout.addLayout(mig_layout)
 
         top_group.setLayout(top_layout)
@@ -57,8 +74,10 @@ class MainWindow(QMainWindow):
 
         self.init_dedup_tab()
         self.init_cold_tab()
+        self.tab_results = ResultsView(self.db)
 
         self.tabs.addTab(self.tab_dedup, "🧹 重复/版本清理")
+        self.tabs.addTab(self.tab_results, "📋 扫描结果")
         self.tabs.addTab(self.tab_cold, "❄️ 冷数据归档 (MsgAttach)")
         layout.addWidget(self.tabs)
 
@@ -100,22 +119,56 @@ class MainWindow(QMainWindow):
         self.rb_fuzzy = QRadioButton("版本去重 (Fuzzy)")
         self.rb_fuzzy.setToolTip("大小差异<30%且同后缀，保留最新版")
 
+        self.rb_image = QRadioButton("相似图片 (感知哈希)")
+        self.rb_image.setToolTip("识别重新压缩、缩放的图片和缩略图 (含微信 .dat 图片)，保留分辨率最高的一张。需要安装 Pillow")
+
         mode_layout.addWidget(QLabel("模式:"))
         mode_layout.addWidget(self.rb_strict)
         mode_layout.addWidget(self.rb_fuzzy)
+        mode_layout.addWidget(self.rb_image)
         mode_layout.addStretch()
+        mode_layout.addWidget(QLabel("并行线程:"))
+        self.spin_workers = QSpinBox()
+        self.spin_workers.setRange(1, 32)
+        self.spin_workers.setValue(DEFAULT_HASH_WORKERS)
+        self.spin_workers.setToolTip("SSD/NVMe 可适当调大；机械硬盘和 USB 硬盘会自动改为按磁盘顺序单线程读取")
+        mode_layout.addWidget(self.spin_workers)
+        self.chk_incremental = QCheckBox("增量遍历")
+        self.chk_incremental.setToolTip("记录每个目录的修改时间，再次扫描时只读取有变化的目录 (假定微信附件写入后不再原地修改)")
+        mode_layout.addWidget(self.chk_incremental)
         layout.addLayout(mode_layout)
 
         # 3. 操作按钮
         btn_layout = QHBoxLayout()
-        btn_scan = QPushButton("开始扫描")
-        btn_scan.clicked.connect(self.start_dedup_scan)
+        self.btn_estimate = QPushButton("快速估算")
+        self.btn_estimate.setToolTip("只读取文件大小和文件名并抽样哈希，几秒内估算严格/混合模式大约能释放多少空间")
+        self.btn_estimate.clicked.connect(self.start_estimate)
+        self.btn_scan = QPushButton("开始扫描")
+        self.btn_scan.clicked.connect(self.start_dedup_scan)
+        self.btn_scan_stop = QPushButton("停止扫描")
+        self.btn_scan_stop.setToolTip("已完成的部分会保存为断点，下次扫描同一目录时可以继续")
+        self.btn_scan_stop.setEnabled(False)
+        self.btn_scan_stop.clicked.connect(self.stop_dedup_scan)
         self.btn_clean_dedup = QPushButton("执行清理 (移入隔离区)")
         self.btn_clean_dedup.setEnabled(False)
         self.btn_clean_dedup.clicked.connect(self.run_clean_dedup)
 
-        btn_layout.addWidget(btn_scan)
+        self.btn_link_dedup = QPushButton("链接去重 (原地释放空间)")
+        self.btn_link_dedup.setToolTip("仅处理内容完全一致的文件：替换为指向保留文件的硬链接/reflink，聊天记录中的文件仍可打开")
+        self.btn_link_dedup.setEnabled(False)
+        self.btn_link_dedup.clicked.connect(self.run_link_dedup)
+
+        btn_layout.addWidget(self.btn_estimate)
+        btn_layout.addWidget(self.btn_scan)
+        btn_layout.addWidget(self.btn_scan_stop)
         btn_layout.addWidget(self.btn_clean_dedup)
+        self.btn_watch = QPushButton("监视新文件")
+        self.btn_watch.setCheckable(True)
+        self.btn_watch.setToolTip("每隔几秒检查有变化的目录，新下载的文件与已有文件内容相同时直接加入扫描结果")
+        self.btn_watch.toggled.connect(self.toggle_watch)
+
+        btn_layout.addWidget(self.btn_link_dedup)
+        btn_layout.addWidget(self.btn_watch)
         layout.addLayout(btn_layout)
 
     def init_cold_tab(self):
@@ -136,9 +189,46 @@ class MainWindow(QMainWindow):
         form.addStretch()
         layout.addLayout(form)
 
-        btn_run = QPushButton("扫描并迁移冷数据")
-        btn_run.clicked.connect(self.run_cold_move)
-        layout.addWidget(btn_run)
+        budget_form = QHBoxLayout()
+        self.chk_cold_budget = QCheckBox("只迁移到释放")
+        self.chk_cold_budget.setToolTip("在满足天数的文件中按 (未修改天数 × 大小) 挑选最冷的文件，"
+                                        "刚好达到目标即停止，不必全部迁移")
+        self.spin_cold_budget = QSpinBox()
+        self.spin_cold_budget.setRange(1, 1024 * 1024)
+        self.spin_cold_budget.setValue(50)
+        self.spin_cold_budget.setSuffix(" GB")
+        self.spin_cold_budget.setEnabled(False)
+        self.chk_cold_budget.toggled.connect(self.spin_cold_budget.setEnabled)
+        budget_form.addWidget(self.chk_cold_budget)
+        budget_form.addWidget(self.spin_cold_budget)
+        budget_form.addWidget(QLabel("空间 (优先迁移最久未修改的大文件)"))
+        budget_form.addStretch()
+        layout.addLayout(budget_form)
+
+        self.chk_fast_cold = QCheckBox("跳过较新的月份目录 (微信附件写入后不再修改)")
+        self.chk_fast_cold.setChecked(False)
+        self.chk_fast_cold.setToolTip("名为 YYYY-MM 且晚于阈值的月份目录整体跳过，不再遍历；"
+                                      "较新月份目录中被修改时间改早的文件不会被找到")
+        layout.addWidget(self.chk_fast_cold)
+
+        self.chk_cold_archive = QCheckBox("打包为压缩卷 (适合 U 盘 / 网络盘，可按文件单独还原)")
+        self.chk_cold_archive.setToolTip("大量小附件写入分卷 ZIP，而不是逐个复制；归档目录中的 archive_manifest.db "
+                                         "记录每个文件的位置，可用 cli.py restore 还原单个文件")
+        layout.addWidget(self.chk_cold_archive)
+
+        btn_layout = QHBoxLayout()
+        self.btn_cold_run = QPushButton("扫描并迁移冷数据")
+        self.btn_cold_run.clicked.connect(self.run_cold_move)
+        self.btn_cold_stop = QPushButton("停止扫描")
+        self.btn_cold_stop.setEnabled(False)
+        self.btn_cold_stop.clicked.connect(self.stop_cold_scan)
+        btn_layout.addWidget(self.btn_cold_run)
+        btn_layout.addWidget(self.btn_cold_stop)
+        layout.addLayout(btn_layout)
+
+        self.lbl_cold_stats = QLabel("")
+        self.lbl_cold_stats.setStyleSheet("color: gray;")
+        layout.addWidget(self.lbl_cold_stats)
         layout.addStretch()
 
 
@@ -173,26 +263,129 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "提示", "请先在顶部选择微信文件夹！")
             return
 
-        mode = 'strict' if self.rb_strict.isChecked() else 'fuzzy'
-        exts = self.get_selected_extensions()
+        if self.rb_image.isChecked():
+            mode = 'image'
+            # 只扫描勾选的图片类型；没有勾选“图片”时使用全部图片后缀
+            exts = [e for e in self.get_selected_extensions() if e in IMAGE_EXTS] or IMAGE_EXTS
+        else:
+            mode = 'strict' if self.rb_strict.isChecked() else 'fuzzy'
+            exts = self.get_selected_extensions()
+
+        resume = True
+        checkpoint = ScanCheckpoint(self.db, self.target_dir, mode, exts)
+        state = checkpoint.load()
+        if state:
+            reply = QMessageBox.question(
+                self, "继续扫描",
+                f"该目录有一次未完成的扫描 (已遍历 {state['file_count']} 个文件)。\n是否从中断处继续？\n"
+                f"选择“否”将重新扫描。",
+                QMessageBox.Yes | QMessageBox.No
+            )
+            resume = reply == QMessageBox.Yes
 
         self.btn_clean_dedup.setEnabled(False)
+        self.btn_link_dedup.setEnabled(False)
         self.txt_log.clear()
         self.progress.setValue(0)
+        self.last_metrics = None
 
-        self.scan_thread = ScannerThread(self.target_dir, mode, self.db, extensions=exts)
+        self.scan_thread = ScannerThread(self.target_dir, mode, self.db, extensions=exts,
+                                         workers=self.spin_workers.value(), resume=resume,
+                                         incremental=self.chk_incremental.isChecked())
         self.scan_thread.progress_val.connect(self.progress.setValue)
         self.scan_thread.progress_text.connect(self.log)
+        self.scan_thread.metrics.connect(self.on_scan_metrics)
         self.scan_thread.finished.connect(self.on_scan_finished)
         self.scan_thread.error.connect(lambda e: QMessageBox.critical(self, "扫描出错", e))
+        self.scan_thread.exited.connect(self.on_scan_exited)
         self.scan_thread.start()
+        self.set_scan_running(True)
 
         self.log(f"启动扫描... 模式: {mode}")
 
+    def start_estimate(self):
+        if not self.target_dir:
+            QMessageBox.warning(self, "提示", "请先在顶部选择微信文件夹！")
+            return
+
+        self.estimate_thread = EstimatorThread(self.target_dir, extensions=self.get_selected_extensions())
+        self.estimate_thread.progress_text.connect(self.log)
+        self.estimate_thread.finished.connect(lambda report: self.log(Utils.format_estimate(report)))
+        self.estimate_thread.error.connect(lambda e: QMessageBox.critical(self, "估算出错", e))
+        self.estimate_thread.finished.connect(lambda report: self.btn_estimate.setEnabled(True))
+        self.estimate_thread.error.connect(lambda e: self.btn_estimate.setEnabled(True))
+        self.estimate_thread.start()
+        self.btn_estimate.setEnabled(False)
+        self.log("开始快速估算...")
+
+    def toggle_watch(self, checked):
+        if not checked:
+            # 线程可能还在轮询中，等它发出 exited 后再允许重新开始
+            if self.watch_thread and self.watch_thread.isRunning():
+                self.watch_thread.stop()
+                self.btn_watch.setEnabled(False)
+                self.log("正在停止监视...")
+            return
+        if not self.target_dir:
+            QMessageBox.warning(self, "提示", "请先在顶部选择微信文件夹！")
+            self.btn_watch.setChecked(False)
+            return
+
+        self.watch_thread = WatcherThread([self.target_dir], self.db, extensions=self.get_selected_extensions())
+        self.watch_thread.progress_text.connect(self.log)
+        self.watch_thread.found.connect(self.on_watch_found)
+        self.watch_thread.error.connect(lambda e: QMessageBox.critical(self, "监视出错", e))
+        self.watch_thread.error.connect(lambda e: self.btn_watch.setChecked(False))
+        self.watch_thread.exited.connect(self.on_watch_exited)
+        self.watch_thread.start()
+        self.log("开始监视新文件...")
+
+    def on_watch_exited(self):
+        # exited 在 run() 返回前发出，先等线程真正结束
+        self.watch_thread.wait()
+        self.btn_watch.setEnabled(True)
+        self.log("已停止监视新文件。")
+
+    def on_watch_found(self, found):
+        for d in found:
+            self.log(f"[新重复] {d['file']} (与 {d['keep']} 相同)")
+        self.tab_results.refresh()
+        self.btn_clean_dedup.setEnabled(True)
+        self.btn_link_dedup.setEnabled(True)
+
+    def set_scan_running(self, running):
+        self.btn_scan.setEnabled(not running)
+        self.btn_scan_stop.setEnabled(running)
+
+    def stop_dedup_scan(self):
+        # 线程可能还在哈希或写入结果，等它发出 exited 后才允许重新开始扫描
+        if self.scan_thread and self.scan_thread.isRunning():
+            self.scan_thread.stop()
+            self.btn_scan_stop.setEnabled(False)
+            self.log("正在停止扫描...")
+
+    def on_scan_exited(self):
+        # exited 在 run() 返回前发出，先等线程真正结束
+        self.scan_thread.wait()
+        self.set_scan_running(False)
+        if not self.scan_thread.is_running:
+            self.log("扫描已停止，进度已保存，下次扫描同一目录时可以继续。")
+
+    def on_scan_metrics(self, metrics):
+        # metrics 先于 finished 发出，这里只暂存，报告之后再一并输出
+        self.last_metrics = metrics
+
     def on_scan_finished(self, report):
         self.log("\n" + "=" * 30)
         self.log(report)
+        self.tab_results.refresh()
+        breakdown = Utils.format_result_report(self.db.get_result_report())
+        if breakdown:
+            self.log("\n[可清理空间分布]\n" + breakdown)
+        if self.last_metrics:
+            self.log(f"\n[阶段耗时 #{self.last_metrics['run_id']}]\n" + Utils.format_metrics(self.last_metrics))
         self.btn_clean_dedup.setEnabled(True)
+        self.btn_link_dedup.setEnabled(True)
         QMessageBox.information(self, "扫描完成", "分析结束，请查看日志。\n如需清理，请点击'执行清理'按钮。")
 
     def run_clean_dedup(self):
@@ -202,21 +395,64 @@ class MainWindow(QMainWindow):
 
         if not dest: return
 
-        rows = self.db.get_results()
-        files_to_move = [r[0] for r in rows]
+        # 只迁移结果页中仍勾选“包含”的文件
+        files_to_move = [r[0] for r in self.db.iter_results(included_only=True)]
 
         if not files_to_move:
-            self.log("数据库中没有待清理记录。")
+            self.log("没有待清理记录 (或已在“扫描结果”页中全部排除)。")
             return
 
         try:
-            folder, count, size = CoreLogic.move_files(files_to_move, dest, "dedup")
+            folder, count, size = CoreLogic.move_files(files_to_move, dest, "dedup", db=self.db)
             self.log(f"清理成功！已移至{folder}")
             QMessageBox.information(self, "成功", f"移动了{count}个文件\n释放空间: {Utils.format_size(size)}")
             self.btn_clean_dedup.setEnabled(False)
         except Exception as e:
             QMessageBox.critical(self, "清理失败", str(e))
 
+    def run_link_dedup(self):
+        # 运行中再次点击按钮即停止
+        if self.link_thread and self.link_thread.isRunning():
+            self.link_thread.stop()
+            self.btn_link_dedup.setEnabled(False)
+            self.log("正在停止链接去重...")
+            return
+        reply = QMessageBox.question(self, "确认链接去重",
+                                     "将把内容完全一致的重复文件替换为指向保留文件的链接。\n"
+                                     "模糊版本匹配的结果不会被处理。确定继续吗？",
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply != QMessageBox.Yes: return
+
+        self.progress.setValue(0)
+        self.link_thread = LinkDedupThread(self.db)
+        self.link_thread.progress_val.connect(self.progress.setValue)
+        self.link_thread.progress_text.connect(self.log)
+        self.link_thread.finished.connect(self.on_link_finished)
+        self.link_thread.error.connect(lambda e: QMessageBox.critical(self, "链接去重出错", e))
+        self.link_thread.error.connect(lambda e: self.set_link_running(False))
+        self.link_thread.start()
+        self.set_link_running(True)
+
+    def set_link_running(self, running):
+        self.btn_link_dedup.setText("停止链接去重" if running else "链接去重 (原地释放空间)")
+        self.btn_link_dedup.setEnabled(True)
+        self.btn_scan.setEnabled(not running)
+        self.btn_clean_dedup.setEnabled(not running)
+
+    def on_link_finished(self, result):
+        self.set_link_running(False)
+        count, size, errors = result['count'], result['size'], result['errors']
+        self.tab_results.refresh()
+        title = "链接去重报告 (已停止)" if result['stopped'] else "链接去重报告"
+        self.log(f"\n[{title}]\n替换文件数: {count}\n释放空间: {Utils.format_size(size)}")
+        for path, err in errors[:20]:
+            self.log(f"跳过: {path} ({err})")
+        if len(errors) > 20:
+            self.log(f"... 另有 {len(errors) - 20} 个文件被跳过")
+        if not result['stopped']:
+            self.btn_link_dedup.setEnabled(False)
+        QMessageBox.information(self, "完成", f"替换了{count}个文件\n释放空间: {Utils.format_size(size)}")
+
     def run_cold_move(self):
         if not self.target_dir:
             QMessageBox.warning(self, "提示", "请先选择微信文件夹！")
@@ -228,7 +464,9 @@ class MainWindow(QMainWindow):
         if not dest: return
 
         days = self.spin_days.value()
-        self.log(f"正在识别微信号目录并查找超过{days}天的文件...")
+        budget = self.spin_cold_budget.value() * 1024 ** 3 if self.chk_cold_budget.isChecked() else None
+        self.log(f"正在识别微信号目录并查找超过{days}天的文件..."
+                 + (f" (目标释放 {Utils.format_size(budget)})" if budget else ""))
 
         targets = Utils.detect_wechat_paths(self.target_dir, "FileStorage/MsgAttach")
         if not targets:
@@ -236,22 +474,108 @@ class MainWindow(QMainWindow):
             return
 
         self.log(f"已识别到 {len(targets)} 个目标文件夹: \n" + "\n".join(targets))
-        QApplication.processEvents()
 
-        files = CoreLogic.scan_cold_files_multi_path(targets, days)
+        self.cold_dest = dest
+        self.cold_thread = ColdScannerThread(targets, days, assume_write_once=self.chk_fast_cold.isChecked(),
+                                             budget_bytes=budget)
+        self.cold_thread.progress_text.connect(self.lbl_cold_stats.setText)
+        self.cold_thread.finished.connect(self.on_cold_scan_finished)
+        self.cold_thread.error.connect(lambda e: QMessageBox.critical(self, "扫描出错", e))
+        self.cold_thread.exited.connect(self.on_cold_scan_exited)
+        self.cold_thread.start()
+        self.btn_cold_run.setEnabled(False)
+        self.btn_cold_stop.setEnabled(True)
+
+    def stop_cold_scan(self):
+        # 线程可能还在遍历大目录，等它发出 exited 后才允许重新开始
+        if self.cold_thread and self.cold_thread.isRunning():
+            self.cold_thread.stop()
+            self.btn_cold_stop.setEnabled(False)
+            self.log("正在停止冷数据扫描...")
+
+    def on_cold_scan_exited(self):
+        # exited 在 run() 返回前发出，先等线程真正结束
+        self.cold_thread.wait()
+        self.btn_cold_run.setEnabled(not (self.cold_move_thread and self.cold_move_thread.isRunning()))
+        self.btn_cold_stop.setEnabled(False)
+        if not self.cold_thread.is_running:
+            self.log("冷数据扫描已停止。")
+
+    def on_cold_scan_finished(self, files):
+        self.btn_cold_stop.setEnabled(False)
+        self.log(self.lbl_cold_stats.text())
+        days = self.cold_thread.days_threshold
+        dest = self.cold_dest
 
         if not files:
             self.log("未发现符合条件的冷数据。")
             return
 
-        reply = QMessageBox.question(self, "确认迁移", f"扫描到 {len(files)} 个冷数据文件。\n确定要全部迁移吗？",
-                                     QMessageBox.Yes | QMessageBox.No)
+        if self.cold_thread.budget_bytes:
+            prompt = (f"已按空间目标选出最冷的 {len(files)} 个文件 "
+                      f"(共 {Utils.format_size(self.cold_thread.selected_bytes)})。\n确定要迁移吗？")
+        else:
+            prompt = f"扫描到 {len(files)} 个冷数据文件。\n确定要全部迁移吗？"
+        reply = QMessageBox.question(self, "确认迁移", prompt, QMessageBox.Yes | QMessageBox.No)
 
-        if reply == QMessageBox.Yes:
-            folder, count, size = CoreLogic.move_files(files, dest, f"cold_{days}days")
+        if reply != QMessageBox.Yes: return
+
+        # 打包或迁移大量文件可能要很久，放到后台线程，期间不允许开始新的冷数据扫描
+        self.progress.setValue(0)
+        self.cold_move_thread = ColdMoveThread(files, dest, f"cold_{days}days", self.db,
+                                               archive=self.chk_cold_archive.isChecked())
+        self.cold_move_thread.progress_val.connect(self.progress.setValue)
+        self.cold_move_thread.progress_text.connect(self.lbl_cold_stats.setText)
+        self.cold_move_thread.finished.connect(self.on_cold_move_finished)
+        self.cold_move_thread.error.connect(lambda e: QMessageBox.critical(self, "迁移出错", e))
+        self.cold_move_thread.exited.connect(self.on_cold_move_exited)
+        self.cold_move_thread.start()
+        self.btn_cold_run.setEnabled(False)
+
+    def on_cold_move_finished(self, result):
+        folder, count, size = result['folder'], result['count'], result['size']
+        if result['archive']:
+            self.log(f"\n[冷数据归档报告]\n归档文件数: {count}\n释放空间: {Utils.format_size(size)}\n"
+                     f"压缩卷大小: {Utils.format_size(result['stored'])}\n存放位置: {folder}")
+            for path, error in result['errors'][:20]:
+                self.log(f"未归档: {path} ({error})")
+        else:
             self.log(
                 f"\n[冷数据迁移报告]\n迁移文件数: {count}\n释放空间: {Utils.format_size(size)}\n存放位置: {folder}")
-            QMessageBox.information(self, "完成", "冷数据迁移完成！")
+        QMessageBox.information(self, "完成", "冷数据迁移完成！")
+
+    def on_cold_move_exited(self):
+        # exited 在 run() 返回前发出，先等线程真正结束
+        self.cold_move_thread.wait()
+        self.btn_cold_run.setEnabled(True)
+
+    def check_unfinished_moves(self):
+        runs = self.db.get_move_runs('running')
+        if not runs: return
+        run_id, operation, dest_root, created_at, _ = runs[0]
+        reply = QMessageBox.question(self, "发现未完成的迁移",
+                                     f"上次迁移 ({operation}, {created_at}) 未正常结束。\n"
+                                     f"存放位置: {dest_root}\n是否继续完成？",
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            count, size = MoveEngine(self.db).resume(run_id)
+            self.log(f"已继续完成迁移: {count} 个文件, {Utils.format_size(size)}")
+
+    def undo_last_move(self):
+        runs = self.db.get_move_runs('done')
+        if not runs:
+            self.log("没有可撤销的迁移记录。")
+            return
+        run_id, operation, dest_root, created_at, _ = runs[0]
+        reply = QMessageBox.question(self, "确认撤销",
+                                     f"将把 {dest_root} 中的文件全部移回原位置。\n确定要撤销吗？",
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply != QMessageBox.Yes: return
+        count, size = MoveEngine(self.db).undo(run_id)
+        self.log(f"[撤销迁移] {operation} ({created_at})\n已还原 {count} 个文件, {Utils.format_size(size)}")
+        left = self.db.get_move_entries(run_id, ('done',))
+        if left:
+            self.log(f"仍有 {len(left)} 个文件未能移回 (原位置被占用或无权限)，处理后可再次点击“撤销上次迁移”重试。")
 
 
 if __name__ == '__main__':
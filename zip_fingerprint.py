@@ -0,0 +1,184 @@
+"""
+ZIP 容器 (docx / xlsx / pptx / zip) 的结构指纹: 只读取文件末尾的中央目录，不解压任何成员。
+中央目录里已有每个成员的 CRC32 和原始大小，足以判断两个文件内容是否一致、有多少成员相同。
+"""
+import hashlib
+import os
+import struct
+
+ZIP_EXTS = {'.docx', '.xlsx', '.pptx', '.zip'}
+# 先读末尾 4KB，通常已包含 EOCD 和 Office 文档的整个中央目录；
+# 找不到 EOCD 时 (带长注释) 再读到注释的最大长度: EOCD 记录 22 字节 + 注释 65535 字节
+ZIP_PROBE_SIZE = 4096
+ZIP_TAIL_SIZE = 22 + 65535
+ZIP_MAX_CD_SIZE = 16 * 1024 * 1024
+ZIP_SIMILARITY_THRESHOLD = 0.6
+
+EOCD = struct.Struct('<4s4H2LH')
+EOCD64_LOCATOR = struct.Struct('<4sLQL')
+EOCD64 = struct.Struct('<4sQ2H2L4Q')
+CD_ENTRY = struct.Struct('<4s6H3L5H2L')
+EOCD_SIG = b'PK\x05\x06'
+EOCD64_LOCATOR_SIG = b'PK\x06\x07'
+EOCD64_SIG = b'PK\x06\x06'
+CD_SIG = b'PK\x01\x02'
+U32_MAX = 0xFFFFFFFF
+
+
+class ZipFingerprint:
+    """
+    members  : {成员名: (crc32, 原始大小)}，目录项不计入
+    signature: 按成员名排序后 (名字, crc32, 大小) 的 MD5。签名相同即解压后的内容相同，
+               与压缩级别、成员顺序、文件头时间戳无关
+    """
+    __slots__ = ('members', 'signature', 'total')
+
+    def __init__(self, members):
+        self.members = members
+        self.total = sum(size for _, size in members.values())
+        digest = hashlib.md5()
+        for name in sorted(members):
+            crc, size = members[name]
+            digest.update(f"{name}\0{crc:08x}\0{size}\n".encode('utf-8', 'surrogatepass'))
+        self.signature = digest.hexdigest()
+
+    @classmethod
+    def read(cls, path, file_size=None):
+        """
+        读取 path 的中央目录，返回 (ZipFingerprint 或 None, 读取的字节数)。
+        不是 ZIP、文件损坏或中央目录过大时返回 None
+        """
+        bytes_read = 0
+        try:
+            with open(path, 'rb') as f:
+                size = file_size if file_size is not None else os.fstat(f.fileno()).st_size
+                if size < EOCD.size: return None, 0
+                tail_start = max(0, size - ZIP_PROBE_SIZE)
+                f.seek(tail_start)
+                tail = f.read(size - tail_start)
+                bytes_read += len(tail)
+                pos = tail.rfind(EOCD_SIG)
+                if pos < 0 and tail_start > 0:
+                    new_start = max(0, size - ZIP_TAIL_SIZE)
+                    f.seek(new_start)
+                    tail = f.read(tail_start - new_start) + tail
+                    bytes_read += tail_start - new_start
+                    tail_start = new_start
+                    pos = tail.rfind(EOCD_SIG)
+
+                def read_at(offset, length):
+                    nonlocal bytes_read
+                    if offset >= tail_start:
+                        return tail[offset - tail_start:offset - tail_start + length]
+                    f.seek(offset)
+                    data = f.read(length)
+                    bytes_read += len(data)
+                    return data
+
+                if pos < 0 or pos + EOCD.size > len(tail): return None, bytes_read
+                fields = EOCD.unpack_from(tail, pos)
+                cd_size, cd_end = fields[5], tail_start + pos
+                if U32_MAX in (fields[5], fields[6]) or fields[4] == 0xFFFF:
+                    # ZIP64: EOCD 前紧挨着 locator，指向 ZIP64 EOCD 记录
+                    loc = tail[pos - EOCD64_LOCATOR.size:pos] if pos >= EOCD64_LOCATOR.size else b''
+                    if len(loc) != EOCD64_LOCATOR.size or loc[:4] != EOCD64_LOCATOR_SIG: return None, bytes_read
+                    eocd64_offset = EOCD64_LOCATOR.unpack(loc)[2]
+                    rec = read_at(eocd64_offset, EOCD64.size)
+                    if len(rec) != EOCD64.size or rec[:4] != EOCD64_SIG: return None, bytes_read
+                    cd_size, cd_end = EOCD64.unpack(rec)[8], eocd64_offset
+
+                # 用 EOCD 的位置反推中央目录起点，文件前面附加了数据 (自解压包) 时也能定位
+                cd_start = cd_end - cd_size
+                if cd_start < 0 or cd_size > ZIP_MAX_CD_SIZE: return None, bytes_read
+                cd = read_at(cd_start, cd_size)
+        except OSError:
+            return None, bytes_read
+
+        members = cls._parse_central_directory(cd)
+        return (cls(members) if members is not None else None), bytes_read
+
+    @staticmethod
+    def _parse_central_directory(cd):
+        members = {}
+        off = 0
+        while off + CD_ENTRY.size <= len(cd):
+            fields = CD_ENTRY.unpack_from(cd, off)
+            if fields[0] != CD_SIG: return None
+            flags, crc, usize = fields[3], fields[7], fields[9]
+            name_len, extra_len, comment_len = fields[10], fields[11], fields[12]
+            name_start = off + CD_ENTRY.size
+            raw_name = cd[name_start:name_start + name_len]
+            name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437', 'replace')
+            if usize == U32_MAX:
+                # 超过 4GB 的成员，原始大小在 ZIP64 扩展字段 (0x0001) 的第一个 8 字节中
+                extra = cd[name_start + name_len:name_start + name_len + extra_len]
+                i = 0
+                while i + 4 <= len(extra):
+                    tag, length = struct.unpack_from('<2H', extra, i)
+                    if tag == 1 and length >= 8 and i + 12 <= len(extra):
+                        usize = struct.unpack_from('<Q', extra, i + 4)[0]
+                        break
+                    i += 4 + length
+            if not name.endswith('/'):
+                members[name] = (crc, usize)
+            off = name_start + name_len + extra_len + comment_len
+        return members if off == len(cd) else None
+
+    def similarity(self, other):
+        """
+        按成员原始大小加权的重合度 (0~1): 完全相同的成员计满分，同名但内容不同的成员
+        按较小一方的大小计一半，只在一方存在的成员不得分
+        """
+        if self.signature == other.signature: return 1.0
+        total = score = 0
+        for name in self.members.keys() | other.members.keys():
+            a = self.members.get(name)
+            b = other.members.get(name)
+            # 空成员也计 1 字节，否则只有空文件不同的两个包会被判为完全相同
+            weight = max(a[1] if a else 0, b[1] if b else 0, 1)
+            total += weight
+            if a and b:
+                score += weight if a == b else 0.5 * min(a[1], b[1])
+        return score / total if total else 0.0
+
+    @classmethod
+    def confirm_groups(cls, groups, path_of, size_of, threshold=ZIP_SIMILARITY_THRESHOLD):
+        """
+        用中央目录校验按文件名得到的版本分组 (组内首个为基准文件):
+        - 基准文件不是有效的 ZIP 时无法判断，整组保持原样
+        - 其他成员与基准的相似度低于 threshold (或不是有效的 ZIP) 时移出该组；
+          移出的成员以其中第一个为新基准再校验一轮，基准本身是无关文件时真正的版本不会因此丢失
+        path_of / size_of: 组内下标 -> 路径 / 大小。
+        返回 (校验后仍有两个以上成员的分组, {下标: 与基准的相似度}, 读取的文件数, 读取的字节数)
+        """
+        fingerprints = {}
+        bytes_read = 0
+
+        def fingerprint(k):
+            nonlocal bytes_read
+            if k not in fingerprints:
+                fingerprints[k], n = cls.read(path_of(k), size_of(k))
+                bytes_read += n
+            return fingerprints[k]
+
+        confirmed, scores = [], {}
+        for group in groups:
+            if fingerprint(group[0]) is None:
+                confirmed.append(group)
+                continue
+            pending = group
+            while len(pending) > 1:
+                base = fingerprint(pending[0])
+                kept, rest = [pending[0]], []
+                for k in pending[1:]:
+                    fp = fingerprint(k)
+                    score = base.similarity(fp) if base is not None and fp is not None else 0.0
+                    if score >= threshold:
+                        kept.append(k)
+                        scores[k] = score
+                    else:
+                        rest.append(k)
+                if len(kept) > 1:
+                    confirmed.append(kept)
+                pending = rest
+        return confirmed, scores, len(fingerprints), bytes_read